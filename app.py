@@ -1,27 +1,72 @@
+import time
+_import_started = time.perf_counter()
+
 import os
-from flask import Flask
+from flask import Flask, request
 from scripts.database import init_db, close_connection
 from scripts.routes import register_routes
+from scripts.static_assets import register_static_assets
+from scripts.http_cache import compress_json_response
+from scripts.metrics import register_metrics, reset_metrics_dir
+from scripts.profiling import register_profiling
+from scripts.fixtures import prune_fixtures
 
 # 获取项目根目录的绝对路径
 project_root = os.path.abspath(os.path.dirname(__file__))
 
-# 创建Flask应用，并明确指定模板和静态文件夹的路径
-app = Flask(
-    __name__,
-    template_folder=os.path.join(project_root, 'templates'),
-    static_folder=os.path.join(project_root, 'static'),
-    static_url_path='/static'
-)
+# 导入应用模块本身的耗时(Flask与路由模块)，启动时随首个请求耗时一起报告
+IMPORT_TIME_MS = (time.perf_counter() - _import_started) * 1000
+
+def report_time_to_first_request(app, created_at):
+    """首个请求完成时输出工作进程的启动耗时"""
+    state = {'reported': False}
+
+    @app.after_request
+    def _report(response):
+        if not state['reported']:
+            state['reported'] = True
+            elapsed = (time.perf_counter() - created_at) * 1000
+            print(f"[启动耗时] 进程 {os.getpid()}: 导入 {IMPORT_TIME_MS:.0f} ms，"
+                  f"创建应用到首个请求完成 {elapsed:.0f} ms ({response.status_code} {request.path})")
+        return response
+
+def create_app(config=None):
+    """
+    创建Flask应用。config为额外的Flask配置项(字典)。
+    不会初始化数据库：表结构由启动入口在创建工作进程之前调用init_db()完成。
+    """
+    created_at = time.perf_counter()
+    # 明确指定模板和静态文件夹的路径
+    app = Flask(
+        __name__,
+        template_folder=os.path.join(project_root, 'templates'),
+        static_folder=os.path.join(project_root, 'static'),
+        static_url_path='/static'
+    )
+    if config:
+        app.config.update(config)
+
+    # 请求计时和 /metrics 接口最先注册，after_request按注册的逆序执行，计时覆盖其余钩子
+    register_metrics(app)
+    # 慢请求日志和按需性能剖析
+    register_profiling(app)
 
-# 注册所有路由
-register_routes(app)
+    # 注册所有路由，以及构建后(带指纹、预压缩)的静态资源
+    register_routes(app)
+    register_static_assets(app)
+    app.after_request(compress_json_response)
 
-# 注册数据库连接关闭处理
-app.teardown_appcontext(close_connection)
+    # 注册数据库连接关闭处理
+    app.teardown_appcontext(close_connection)
 
-# 初始化数据库
-init_db(app)
+    report_time_to_first_request(app, created_at)
+    print(f"[启动耗时] 进程 {os.getpid()}: 导入 {IMPORT_TIME_MS:.0f} ms，"
+          f"创建应用 {(time.perf_counter() - created_at) * 1000:.0f} ms")
+    return app
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    # 开发模式：单进程调试服务器(生产环境请使用 python serve.py)
+    init_db()
+    reset_metrics_dir()
+    prune_fixtures()
+    create_app().run(debug=True, host='0.0.0.0', port=5000)
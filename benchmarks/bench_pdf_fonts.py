@@ -0,0 +1,70 @@
+"""
+对比每份PDF报告的字体加载开销：每次解析字体(旧方式) vs 进程级字体缓存。
+
+用法(在项目根目录):
+    python benchmarks/bench_pdf_fonts.py --reports 20
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts import pdf_generator
+from scripts.pdf_generator import generate_pdf_report
+
+PROBLEM = {'title': 'Sum of even numbers', 'description_md': 'Compute the sum of all even numbers from 1 to 100.'}
+CODE = open(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'testfiles', '1.1.py'), encoding='utf-8').read()
+TEST_RESULTS = {
+    'passed': 1, 'total': 1,
+    'details': [{'case': 1, 'status': 'passed', 'input': '', 'expected_output': '2550', 'actual_output': '2550'}]
+}
+AI_REVIEW = {
+    'general_comment': '代码结构清晰，逻辑正确。',
+    'strengths': ['使用了函数封装'],
+    'areas_for_improvement': [{'category': '性能效率', 'comment': '可以使用步长为2的range。', 'line_reference': '3'}],
+}
+
+def uncached_add_font(pdf, family, style, font_path):
+    """旧方式：每个PDF实例都重新解析字体文件"""
+    pdf.add_font(family, style, font_path)
+
+def measure(label, reports, trace_memory):
+    timings = []
+    # tracemalloc本身会显著拖慢执行，只在需要时开启
+    if trace_memory:
+        tracemalloc.start()
+    for _ in range(reports):
+        start = time.perf_counter()
+        generate_pdf_report(PROBLEM, CODE, TEST_RESULTS, AI_REVIEW)
+        timings.append((time.perf_counter() - start) * 1000)
+    line = (f"{label:<8} first={timings[0]:8.1f} ms  median={statistics.median(timings):8.1f} ms  "
+            f"mean={statistics.mean(timings):8.1f} ms")
+    if trace_memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        line += f"  peak_mem={peak / 1024 / 1024:6.1f} MB"
+    print(line)
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description='PDF字体缓存基准测试')
+    parser.add_argument('--reports', type=int, default=20, help='每种方式生成的报告数量')
+    parser.add_argument('--memory', action='store_true', help='同时统计内存峰值(会拖慢计时)')
+    args = parser.parse_args()
+
+    cached_add_font = pdf_generator.add_cached_font
+    pdf_generator.add_cached_font = uncached_add_font
+    before = measure('before', args.reports, args.memory)
+
+    pdf_generator.add_cached_font = cached_add_font
+    after = measure('after', args.reports, args.memory)
+
+    print(f"每份报告中位数耗时降低 {statistics.median(before) - statistics.median(after):.1f} ms "
+          f"({statistics.median(before) / max(statistics.median(after), 1e-9):.1f}x)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+启动导入耗时回归检查：用 python -X importtime 导入应用，确认重量级模块没有在启动时被导入，
+并且应用模块的总导入耗时不超过预算。检查失败时以非零状态退出，可用于CI。
+
+用法(在项目根目录):
+    python benchmarks/check_import_time.py [--budget-ms 600] [--runs 3] [--output importtime.txt]
+"""
+import os
+import re
+import sys
+import argparse
+import subprocess
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 这些模块只应在首次使用时导入(PDF渲染、HTTP客户端、批量导出等)
+LAZY_MODULES = [
+    'fpdf', 'fontTools', 'requests', 'urllib3', 'multiprocessing',
+    'scripts.pdf_generator', 'scripts.pdf_pool', 'scripts.pdf_cache',
+    'scripts.report_export', 'scripts.gradebook',
+]
+
+LINE_PATTERN = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$')
+
+def profile_import(target):
+    """在新的解释器中导入target，返回[(模块名, 自身耗时us, 累计耗时us, 层级)]"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {target}'],
+        cwd=PROJECT_ROOT, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"导入 {target} 失败:\n{result.stderr}")
+    entries = []
+    for line in result.stderr.splitlines():
+        match = LINE_PATTERN.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            entries.append((module, int(self_us), int(cumulative_us), len(indent) // 2))
+    return entries, result.stderr
+
+def main():
+    parser = argparse.ArgumentParser(description='启动导入耗时回归检查')
+    parser.add_argument('--target', default='app', help='要导入的模块')
+    parser.add_argument('--budget-ms', type=float, default=600, help='目标模块累计导入耗时上限(毫秒，取多次运行的最小值)')
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--top', type=int, default=15, help='输出累计耗时最高的模块数量')
+    parser.add_argument('--output', help='保存原始 -X importtime 输出的文件')
+    args = parser.parse_args()
+
+    best = None
+    for _ in range(args.runs):
+        entries, raw = profile_import(args.target)
+        total_us = next(cumulative for module, _, cumulative, _ in entries if module == args.target)
+        if best is None or total_us < best[0]:
+            best = (total_us, entries, raw)
+    total_us, entries, raw = best
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(raw)
+
+    print(f"导入 {args.target} 累计耗时: {total_us / 1000:.1f} ms (预算 {args.budget_ms:.0f} ms，{args.runs} 次取最小)")
+    print("累计耗时最高的模块:")
+    for module, _, cumulative, level in sorted(entries, key=lambda e: e[2], reverse=True)[:args.top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {'  ' * level}{module}")
+
+    imported = {module for module, _, _, _ in entries}
+    eager = [name for name in LAZY_MODULES if name in imported]
+    failures = []
+    if eager:
+        failures.append(f"以下模块应在首次使用时导入，但在启动时被导入: {', '.join(eager)}")
+    if total_us / 1000 > args.budget_ms:
+        failures.append(f"导入耗时 {total_us / 1000:.1f} ms 超过预算 {args.budget_ms:.0f} ms")
+
+    for failure in failures:
+        print(f"失败: {failure}")
+    if not failures:
+        print("通过")
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
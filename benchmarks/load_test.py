@@ -0,0 +1,275 @@
+"""
+上机课负载测试：模拟一个班的学生在同一时间段内测试、提交代码和向AI提问。
+
+默认在临时数据库上启动本地AI服务桩和应用(python serve.py，多进程 × 多线程)，
+也可以用 --url 压测已经运行的服务。每个模拟学生按 --mix 的比例随机选择操作，
+两次操作之间的间隔服从均值为 --think 秒的指数分布；学生在 --ramp 秒内陆续加入。
+
+操作：
+    test     POST /api/test/<题目ID>
+    submit   POST /api/submit/<题目ID>
+    review   POST /api/review(学生端提问，调用AI服务桩)
+    chat     GET  /api/student/chat-history/<题目ID>/<学号>
+    latest   GET  /api/student/latest-submission/<题目ID>/<学号>
+
+用法(在项目根目录):
+    python benchmarks/load_test.py --students 150 --duration 300 --think 20
+    python benchmarks/load_test.py --students 50 --duration 60 --mix test=4,submit=2,review=2,chat=1,latest=1
+
+结束后按操作输出请求数、错误率、p50/p95/p99延迟，以及"database is locked"出现的次数
+(统计响应内容和服务端日志)，详细结果写入 --output 指定的JSON文件。
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import signal
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from run_benchmarks import PROJECT_ROOT, load_problems, load_solutions, percentile
+
+DEFAULT_MIX = 'test=4,submit=2,review=1.5,chat=1,latest=1.5'
+LOCKED_MESSAGE = 'database is locked'
+
+def parse_mix(text):
+    mix = {}
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        if name.strip() not in ('test', 'submit', 'review', 'chat', 'latest'):
+            raise ValueError(f"未知操作: {name}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def wait_until_ready(url, timeout=60):
+    import requests
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f"{url}/api/problems", timeout=2).status_code == 200:
+                return
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(0.3)
+    raise RuntimeError(f"服务在 {timeout} 秒内未就绪: {url}")
+
+class LocalStack:
+    """在临时目录中启动AI服务桩和应用，日志写入该目录"""
+    def __init__(self, args):
+        self.directory = tempfile.mkdtemp(prefix='scr-load-')
+        self.log_path = os.path.join(self.directory, 'server.log')
+        self.keep = args.keep_db
+        stub_port = free_port()
+        app_port = free_port()
+        self.url = f"http://127.0.0.1:{app_port}"
+
+        env = dict(os.environ, DATABASE_DIR=self.directory, LLM_BASE_URL=f"http://127.0.0.1:{stub_port}/v1",
+                   PYTHONUNBUFFERED='1')
+        self.stub = subprocess.Popen(
+            [sys.executable, '-m', 'scripts.stub_llm', '--port', str(stub_port), '--latency', str(args.llm_latency)],
+            cwd=PROJECT_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        self.log_file = open(self.log_path, 'w', encoding='utf-8')
+        self.app = subprocess.Popen(
+            [sys.executable, 'serve.py', '--host', '127.0.0.1', '--port', str(app_port),
+             '--workers', str(args.workers), '--threads', str(args.threads), '--server', args.server],
+            cwd=PROJECT_ROOT, env=env, stdout=self.log_file, stderr=subprocess.STDOUT
+        )
+        try:
+            wait_until_ready(self.url)
+        except Exception:
+            self.stop()
+            raise
+
+    def locked_in_log(self):
+        try:
+            with open(self.log_path, 'r', encoding='utf-8', errors='replace') as f:
+                return f.read().count(LOCKED_MESSAGE)
+        except OSError:
+            return 0
+
+    def stop(self):
+        # 与生产环境相同，用SIGTERM让服务等待进行中的请求完成后退出
+        self.app.send_signal(signal.SIGTERM)
+        try:
+            self.app.wait(timeout=90)
+        except subprocess.TimeoutExpired:
+            self.app.kill()
+        self.stub.terminate()
+        self.stub.wait(timeout=10)
+        self.log_file.close()
+
+    def cleanup(self):
+        if self.keep:
+            print(f"临时数据库和服务日志保留在 {self.directory}")
+        else:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+class Recorder:
+    """线程安全地记录每个操作的延迟和结果"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.locked = 0
+
+    def record(self, operation, elapsed, status, locked):
+        with self.lock:
+            entry = self.samples.setdefault(operation, {'latencies': [], 'statuses': {}, 'errors': 0})
+            entry['latencies'].append(elapsed)
+            entry['statuses'][status] = entry['statuses'].get(status, 0) + 1
+            if not (isinstance(status, int) and 200 <= status < 400):
+                entry['errors'] += 1
+            self.locked += locked
+
+def seed_problems(url):
+    """通过接口创建 testfiles/题目.txt 中的题目，返回题目ID列表"""
+    import requests
+    problem_ids = []
+    for problem in load_problems():
+        response = requests.post(f"{url}/api/problems", json=problem, timeout=30)
+        response.raise_for_status()
+        problem_ids.append(response.json()['problem_id'])
+    return problem_ids
+
+def student_session(index, args, url, problem_ids, solutions, recorder, mix, stop_at):
+    """单个模拟学生：循环选择操作直到测试结束"""
+    import requests
+    rng = random.Random(args.seed + index)
+    session = requests.Session()
+    student_id = str(900000 + index)   # 接口要求学号为纯数字
+    operations, weights = zip(*mix.items())
+    time.sleep(rng.uniform(0, args.ramp))
+
+    while time.monotonic() < stop_at:
+        name, problem_index, code = rng.choice(solutions)
+        problem_id = problem_ids[problem_index]
+        operation = rng.choices(operations, weights)[0]
+        if operation == 'test':
+            request = ('POST', f"/api/test/{problem_id}", {'code': code})
+        elif operation == 'submit':
+            request = ('POST', f"/api/submit/{problem_id}", {'code': code, 'student_id': student_id})
+        elif operation == 'review':
+            request = ('POST', '/api/review', {'role': 'student', 'problem_id': problem_id, 'code': code,
+                                               'student_id': student_id, 'userInput': '我的代码哪里有问题？'})
+        elif operation == 'chat':
+            request = ('GET', f"/api/student/chat-history/{problem_id}/{student_id}", None)
+        else:
+            request = ('GET', f"/api/student/latest-submission/{problem_id}/{student_id}", None)
+
+        method, path, body = request
+        started = time.perf_counter()
+        try:
+            response = session.request(method, f"{url}{path}", json=body, timeout=args.timeout)
+            status = response.status_code
+            locked = response.text.count(LOCKED_MESSAGE)
+        except requests.exceptions.RequestException as e:
+            status = type(e).__name__
+            locked = 0
+        recorder.record(operation, time.perf_counter() - started, status, locked)
+        time.sleep(min(rng.expovariate(1 / args.think) if args.think > 0 else 0, max(0, stop_at - time.monotonic())))
+
+def summarize(recorder, wall):
+    report = {}
+    for operation, entry in sorted(recorder.samples.items()):
+        ordered = sorted(entry['latencies'])
+        count = len(ordered)
+        report[operation] = {
+            'count': count,
+            'errors': entry['errors'],
+            'error_rate': round(entry['errors'] / count, 4) if count else 0,
+            'throughput_per_s': round(count / wall, 3) if wall > 0 else None,
+            'p50_ms': round(percentile(ordered, 50) * 1000, 1),
+            'p95_ms': round(percentile(ordered, 95) * 1000, 1),
+            'p99_ms': round(percentile(ordered, 99) * 1000, 1),
+            'max_ms': round(ordered[-1] * 1000, 1),
+            'statuses': {str(status): n for status, n in entry['statuses'].items()},
+        }
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description='上机课负载测试')
+    parser.add_argument('--students', type=int, default=30, help='模拟学生数')
+    parser.add_argument('--duration', type=float, default=60, help='测试时长(秒)')
+    parser.add_argument('--ramp', type=float, default=10, help='学生在该时间(秒)内陆续加入')
+    parser.add_argument('--think', type=float, default=5, help='两次操作之间的平均间隔(秒)')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f"各操作的权重，默认 {DEFAULT_MIX}")
+    parser.add_argument('--timeout', type=float, default=120, help='单个请求的超时时间(秒)')
+    parser.add_argument('--seed', type=int, default=1, help='随机种子(相同参数下操作序列可复现)')
+    parser.add_argument('--url', help='压测已运行的服务(如 http://127.0.0.1:5000)，不启动本地服务')
+    parser.add_argument('--workers', type=int, default=2, help='本地服务的工作进程数')
+    parser.add_argument('--threads', type=int, default=8, help='本地服务每个进程的线程数')
+    parser.add_argument('--server', default='auto', choices=['auto', 'gunicorn', 'waitress', 'werkzeug'])
+    parser.add_argument('--llm-latency', type=float, default=1.0, help='AI服务桩的响应延迟(秒)')
+    parser.add_argument('--output', help='详细结果JSON文件')
+    parser.add_argument('--keep-db', action='store_true', help='保留临时数据库和服务日志')
+    args = parser.parse_args()
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+
+    stack = None if args.url else LocalStack(args)
+    url = args.url or stack.url
+    recorder = Recorder()
+    try:
+        problem_ids = seed_problems(url)
+        solutions = [item for item in load_solutions() if item[1] < len(problem_ids)]
+        print(f"{args.students} 名学生，持续 {args.duration:.0f} 秒，目标 {url}")
+
+        started = time.monotonic()
+        stop_at = started + args.duration
+        threads = [
+            threading.Thread(target=student_session, daemon=True,
+                             args=(i, args, url, problem_ids, solutions, recorder, mix, stop_at))
+            for i in range(args.students)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.monotonic() - started
+    finally:
+        if stack is not None:
+            stack.stop()
+
+    report = summarize(recorder, wall)
+    locked_in_log = stack.locked_in_log() if stack is not None else None
+    total = sum(entry['count'] for entry in report.values())
+    errors = sum(entry['errors'] for entry in report.values())
+
+    print(f"\n{'操作':<8}{'请求数':>8}{'错误率':>9}{'请求/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for operation, entry in report.items():
+        print(f"{operation:<8}{entry['count']:>8}{entry['error_rate'] * 100:>8.1f}%{entry['throughput_per_s']:>9.2f}"
+              f"{entry['p50_ms']:>10.1f}{entry['p95_ms']:>10.1f}{entry['p99_ms']:>10.1f}{entry['max_ms']:>10.1f}")
+        failures = {status: n for status, n in entry['statuses'].items() if not status.startswith(('2', '3'))}
+        if failures:
+            print(f"{'':<8}失败: {failures}")
+    print(f"\n共 {total} 个请求，错误 {errors} 个({errors / max(total, 1) * 100:.2f}%)")
+    print(f"database is locked: 响应中 {recorder.locked} 次" +
+          (f"，服务端日志中 {locked_in_log} 次" if locked_in_log is not None else ""))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'meta': {key: value for key, value in vars(args).items()},
+                'wall_s': round(wall, 3),
+                'database_locked': {'responses': recorder.locked, 'server_log': locked_in_log},
+                'operations': report,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"详细结果已保存到 {args.output}")
+    if stack is not None:
+        stack.cleanup()
+
+if __name__ == '__main__':
+    main()
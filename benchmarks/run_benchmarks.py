@@ -0,0 +1,306 @@
+"""
+基准测试：用 testfiles/ 中的示例代码(正确解、错误解、IndexError、较慢的循环)作为负载，
+在临时数据库和本地AI服务桩上测量各个环节的吞吐量和延迟分位数。
+
+场景：
+    executor       execute_code_safely 执行每份代码的每个测试用例
+    route_test     POST /api/test/<题目ID>
+    route_submit   POST /api/submit/<题目ID>
+    route_read     题目列表、题目详情、提交列表、提交详情等只读接口
+    review         POST /api/review(教师端，首次评估，调用AI服务桩)
+    review_cached  POST /api/review(教师端，读取已保存的评估)
+    pdf            generate_pdf_report 生成单份报告
+
+用法(在项目根目录):
+    python benchmarks/run_benchmarks.py [--rounds 3] [--scenarios executor,pdf] [--llm-latency 0.2]
+    python benchmarks/run_benchmarks.py --baseline benchmarks/results/上一次.json
+
+结果写入 benchmarks/results/bench-<时间>.json(或 --output 指定的文件)；
+指定 --baseline 时与之前的结果对比，p95延迟或吞吐量变差超过 --threshold 时以非零状态退出。
+"""
+import os
+import io
+import sys
+import json
+import math
+import time
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+import contextlib
+import subprocess
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TESTFILES_DIR = os.path.join(PROJECT_ROOT, 'testfiles')
+RESULTS_DIR = os.path.join(PROJECT_ROOT, 'benchmarks', 'results')
+
+SCENARIOS = ['executor', 'route_test', 'route_submit', 'route_read', 'review', 'review_cached', 'pdf']
+
+# 题目.txt 只有题目描述，测试用例按示例代码的预期行为补充(按题目顺序)
+TEST_CASES = [
+    [('', '2550')],
+    [('level', 'True'), ('hello', 'False'), ('Never odd or even', 'True')],
+    [('', '[11, 12, 22, 25, 34, 64, 90]')],
+]
+
+def load_problems():
+    """解析 testfiles/题目.txt，返回[{'title', 'description_md', 'test_cases'}]"""
+    with open(os.path.join(TESTFILES_DIR, '题目.txt'), 'r', encoding='utf-8') as f:
+        blocks = [block.strip() for block in f.read().split('题目要求：') if block.strip()]
+    problems = []
+    for index, description in enumerate(blocks):
+        cases = TEST_CASES[index] if index < len(TEST_CASES) else []
+        problems.append({
+            'title': f"题目{index + 1}",
+            'description_md': description,
+            'test_cases': [{'input_data': given, 'expected_output': expected} for given, expected in cases],
+        })
+    return problems
+
+def load_solutions():
+    """返回[(文件名, 题目序号(从0开始), 代码)]，文件名 1.3.py 对应第1题"""
+    solutions = []
+    for name in sorted(os.listdir(TESTFILES_DIR)):
+        if not name.endswith('.py'):
+            continue
+        with open(os.path.join(TESTFILES_DIR, name), 'r', encoding='utf-8') as f:
+            solutions.append((name, int(name.split('.')[0]) - 1, f.read()))
+    return solutions
+
+def percentile(sorted_values, p):
+    """最近秩法分位数"""
+    if not sorted_values:
+        return None
+    index = max(0, math.ceil(p / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+def summarize(timings, errors, wall):
+    ordered = sorted(timings)
+    ms = lambda value: round(value * 1000, 3) if value is not None else None
+    return {
+        'count': len(timings),
+        'errors': errors,
+        'wall_s': round(wall, 3),
+        'throughput_per_s': round(len(timings) / wall, 3) if wall > 0 else None,
+        'mean_ms': ms(sum(ordered) / len(ordered)) if ordered else None,
+        'p50_ms': ms(percentile(ordered, 50)),
+        'p95_ms': ms(percentile(ordered, 95)),
+        'p99_ms': ms(percentile(ordered, 99)),
+        'max_ms': ms(ordered[-1]) if ordered else None,
+    }
+
+class Bench:
+    """在临时数据库上准备题目，并提供各场景的单次操作"""
+    def __init__(self, args):
+        from scripts import stub_llm, ai_service
+        from scripts.database import init_db
+        from app import create_app
+
+        self.stub = stub_llm.start_stub_server(latency=args.llm_latency)
+        ai_service.BASE_URL = self.stub.base_url
+        self.teacher_review = stub_llm.TEACHER_REVIEW
+
+        init_db()
+        self.client = create_app().test_client()
+        self.problems = load_problems()
+        self.problem_ids = []
+        for problem in self.problems:
+            response = self.client.post('/api/problems', json=problem)
+            self.problem_ids.append(response.get_json()['problem_id'])
+        self.solutions = [item for item in load_solutions() if item[1] < len(self.problems)]
+        # 每份代码最近一次提交的ID和评测结果，供评估和PDF场景使用
+        self.submissions = {}
+        self._submit_all()
+
+    def _submit_all(self):
+        for name, index, code in self.solutions:
+            self.op_route_submit(name, index, code)
+
+    def ops(self, scenario):
+        """返回该场景一轮的全部操作(无参数的可调用对象列表)"""
+        if scenario == 'executor':
+            from scripts.code_executor import execute_code_safely
+            return [lambda code=code, given=case['input_data']: self._check_executor(execute_code_safely(code, given))
+                    for name, index, code in self.solutions for case in self.problems[index]['test_cases']]
+        if scenario == 'route_read':
+            urls = ['/api/problems']
+            urls += [f'/api/problems/{pid}' for pid in self.problem_ids]
+            urls += [f'/api/submissions/{pid}' for pid in self.problem_ids]
+            urls += [f'/api/submission/{sid}' for sid, _ in self.submissions.values()]
+            return [lambda url=url: self._get(url) for url in urls]
+        if scenario == 'review':
+            # 每轮重新提交，使评估针对新的提交ID(不命中已保存的评估)
+            self._submit_all()
+        if scenario == 'review_cached':
+            # 确保每份提交都已有保存的评估
+            for item in self.solutions:
+                self._review(*item)
+        method = getattr(self, f'op_{scenario}')
+        return [lambda item=item: method(*item) for item in self.solutions]
+
+    @staticmethod
+    def _check_executor(result):
+        # 学生代码本身出错不算基准测试错误，只有执行器异常(-2)才算
+        if result['returncode'] == -2:
+            raise RuntimeError(result['stderr'])
+
+    def _check(self, response):
+        if response.status_code >= 400:
+            raise RuntimeError(f"HTTP {response.status_code}: {response.get_data(as_text=True)[:200]}")
+        return response
+
+    def _get(self, url):
+        self._check(self.client.get(url))
+
+    def op_route_test(self, name, index, code):
+        self._check(self.client.post(f'/api/test/{self.problem_ids[index]}', json={'code': code}))
+
+    def op_route_submit(self, name, index, code):
+        response = self._check(self.client.post(
+            f'/api/submit/{self.problem_ids[index]}', json={'code': code, 'student_id': f"bench-{name}"}
+        ))
+        body = response.get_json()
+        self.submissions[name] = (body['submission_id'], body['data'])
+
+    def _review(self, name, index, code):
+        submission_id, _ = self.submissions[name]
+        response = self._check(self.client.post('/api/review', json={
+            'role': 'teacher', 'problem_id': self.problem_ids[index], 'submission_id': submission_id,
+            'code': code, 'force_new': True,
+        }))
+        if response.get_json().get('status') != 'success':
+            raise RuntimeError(response.get_json().get('message'))
+
+    op_review = _review
+    op_review_cached = _review
+
+    def op_pdf(self, name, index, code):
+        from scripts.pdf_generator import generate_pdf_report
+        _, test_results = self.submissions[name]
+        pdf_bytes = generate_pdf_report(self.problems[index], code, test_results, self.teacher_review)
+        if not pdf_bytes:
+            raise RuntimeError("PDF生成失败")
+
+    def close(self):
+        self.stub.shutdown()
+
+def run_scenario(bench, scenario, rounds, warmup, verbose):
+    """执行warmup轮预热(不计时)和rounds轮计时，返回统计结果"""
+    quiet = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    timings = []
+    errors = 0
+    wall = 0.0
+    with quiet:
+        for round_index in range(warmup + rounds):
+            ops = bench.ops(scenario)
+            measured = round_index >= warmup
+            round_started = time.perf_counter()
+            for op in ops:
+                started = time.perf_counter()
+                try:
+                    op()
+                except Exception as e:
+                    if measured:
+                        errors += 1
+                    print(f"[{scenario}] 操作失败: {e}", file=sys.stderr)
+                    continue
+                if measured:
+                    timings.append(time.perf_counter() - started)
+            if measured:
+                wall += time.perf_counter() - round_started
+    return summarize(timings, errors, wall)
+
+def git_revision():
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_ROOT, capture_output=True, text=True)
+        return result.stdout.strip() or None
+    except OSError:
+        return None
+
+def compare(results, baseline, threshold):
+    """与之前的结果对比，返回变差的场景列表"""
+    regressions = []
+    print(f"\n与基线对比 ({baseline['meta'].get('git_revision')} @ {baseline['meta'].get('timestamp')}):")
+    for scenario, current in results['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(scenario)
+        if not previous or not previous.get('p95_ms') or not current.get('p95_ms'):
+            continue
+        p95_ratio = current['p95_ms'] / previous['p95_ms']
+        throughput_ratio = (current['throughput_per_s'] or 0) / (previous['throughput_per_s'] or 1)
+        regressed = p95_ratio > 1 + threshold or throughput_ratio < 1 - threshold
+        print(f"  {scenario:<14} p95 {previous['p95_ms']:>9.1f} -> {current['p95_ms']:>9.1f} ms ({p95_ratio:5.2f}x)  "
+              f"吞吐量 {throughput_ratio:5.2f}x{'  <-- 变差' if regressed else ''}")
+        if regressed:
+            regressions.append(scenario)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='执行器、接口、PDF和数据库的基准测试')
+    parser.add_argument('--rounds', type=int, default=3, help='每个场景计时的轮数(每轮覆盖全部示例代码)')
+    parser.add_argument('--warmup', type=int, default=1, help='每个场景不计时的预热轮数')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help=f"逗号分隔，可选: {','.join(SCENARIOS)}")
+    parser.add_argument('--llm-latency', type=float, default=0.0, help='AI服务桩的响应延迟(秒)')
+    parser.add_argument('--output', help='结果JSON文件，默认 benchmarks/results/bench-<时间>.json')
+    parser.add_argument('--baseline', help='与之前的结果JSON对比')
+    parser.add_argument('--threshold', type=float, default=0.2, help='对比时允许的变差比例')
+    parser.add_argument('--keep-db', action='store_true', help='保留临时数据库目录')
+    parser.add_argument('--verbose', action='store_true', help='显示应用自身的日志输出')
+    args = parser.parse_args()
+
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"未知场景: {', '.join(unknown)}")
+
+    # 数据库、PDF缓存和指标目录都放在临时目录中，必须在导入应用模块之前设置
+    if not args.verbose:
+        # 缺少中文字体时fpdf会对每份报告输出缺字警告
+        logging.getLogger('fpdf').setLevel(logging.ERROR)
+    database_dir = tempfile.mkdtemp(prefix='scr-bench-')
+    os.environ['DATABASE_DIR'] = database_dir
+    sys.path.insert(0, PROJECT_ROOT)
+
+    with contextlib.redirect_stdout(io.StringIO()) if not args.verbose else contextlib.nullcontext():
+        bench = Bench(args)
+    results = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'rounds': args.rounds,
+            'warmup': args.warmup,
+            'llm_latency': args.llm_latency,
+        },
+        'scenarios': {},
+    }
+    try:
+        print(f"{'场景':<14}{'次数':>6}{'错误':>6}{'吞吐量/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for scenario in scenarios:
+            summary = run_scenario(bench, scenario, args.rounds, args.warmup, args.verbose)
+            results['scenarios'][scenario] = summary
+            print(f"{scenario:<14}{summary['count']:>6}{summary['errors']:>6}{summary['throughput_per_s'] or 0:>10.1f}"
+                  f"{summary['p50_ms'] or 0:>10.1f}{summary['p95_ms'] or 0:>10.1f}{summary['p99_ms'] or 0:>10.1f}")
+    finally:
+        bench.close()
+        if not args.keep_db:
+            shutil.rmtree(database_dir, ignore_errors=True)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"bench-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已保存到 {output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print(f"性能变差的场景: {', '.join(regressions)}")
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
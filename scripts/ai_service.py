@@ -1,73 +1,486 @@
+import os
+import re
 import json
 import time
-import requests
-from .config import API_KEY, BASE_URL, MODEL_NAME, PDF_GENERATION_TIMEOUT, PROMPT_FILE
+import random
+import threading
+from collections import deque
+from . import metrics
+from .config import (
+    API_KEY, BASE_URL, MODEL_NAME, PROMPT_FILE, PROMPT_TOKEN_BUDGETS, LLM_REQUEST_TIMEOUT,
+    LLM_MAX_RETRIES, LLM_BACKOFF_BASE, LLM_BACKOFF_MAX,
+    LLM_RETRY_BUDGET_RATIO, LLM_RETRY_BUDGET_MIN, LLM_RETRY_BUDGET_WINDOW,
+    LLM_CIRCUIT_FAILURE_THRESHOLD, LLM_CIRCUIT_RESET_TIMEOUT
+)
+
+# 默认提示词
+DEFAULT_PROMPTS = {
+    'teacher_review_prompt': '你是一个Python代码评审助手。',
+    'student_question_prompt': '你是一个Python编程辅导助手。'
+}
+
+# 模板中可替换的占位符
+PLACEHOLDER_PATTERN = re.compile(r'\{(problem_description|code|automated_test_results|criteria|user_question)\}')
+
+# 各段内容分配预算时的权重
+SECTION_WEIGHTS = {
+    'problem_description': 2,
+    'code': 5,
+    'automated_test_results': 3,
+    'criteria': 1,
+    'user_question': 1
+}
+
+CJK_PATTERN = re.compile(r'[\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]')
+
+# 提示词模板缓存：文件修改时间变化时才重新加载
+_prompt_cache = {'mtime': None, 'prompts': None, 'compiled': {}}
+_prompt_lock = threading.Lock()
+
+def _compile_template(template):
+    """将模板预编译为(文本, 占位符)片段列表，避免每次调用时链式替换"""
+    segments = []
+    last_end = 0
+    for match in PLACEHOLDER_PATTERN.finditer(template):
+        segments.append((template[last_end:match.start()], match.group(1)))
+        last_end = match.end()
+    segments.append((template[last_end:], None))
+    return segments
 
 def load_prompts():
-    """加载AI提示词模板"""
+    """加载AI提示词模板(按文件修改时间缓存)"""
     try:
-        with open(PROMPT_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        # 默认提示词
-        return {
-            'teacher_review_prompt': '你是一个Python代码评审助手。',
-            'student_question_prompt': '你是一个Python编程辅导助手。'
-        }
-
-def build_prompt(role, problem_description, code, simulation_result, criteria='', user_input=''):
-    """构建AI提示词"""
-    prompts = load_prompts()
-    
-    # 格式化代码执行结果
-    simulation_output = f"标准输出(stdout):\n{simulation_result['stdout']}\n\n标准错误(stderr):\n{simulation_result['stderr']}"
-    if simulation_result['returncode'] != 0:
-        simulation_output += f"\n\n退出代码(returncode): {simulation_result['returncode']} (非零表示程序异常终止)"
-    
-    if role == 'teacher':
-        template = prompts.get('teacher_review_prompt', '')
-        # 使用字符串替换避免JSON花括号冲突
-        prompt = template.replace('{problem_description}', problem_description)
-        prompt = prompt.replace('{code}', code)
-        prompt = prompt.replace('{automated_test_results}', simulation_output)
-        prompt = prompt.replace('{criteria}', criteria)
-        return prompt
-    else:
-        template = prompts.get('student_question_prompt', '')
-        # 使用字符串替换避免JSON花括号冲突
-        prompt = template.replace('{problem_description}', problem_description)
-        prompt = prompt.replace('{code}', code)
-        prompt = prompt.replace('{automated_test_results}', simulation_output)
-        prompt = prompt.replace('{user_question}', user_input)
-        return prompt
-
-def call_llm_api(prompt, max_retries=3):
+        mtime = os.path.getmtime(PROMPT_FILE)
+    except OSError:
+        mtime = None
+
+    with _prompt_lock:
+        if _prompt_cache['prompts'] is None or _prompt_cache['mtime'] != mtime:
+            try:
+                with open(PROMPT_FILE, 'r', encoding='utf-8') as f:
+                    prompts = json.load(f)
+            except FileNotFoundError:
+                prompts = dict(DEFAULT_PROMPTS)
+            _prompt_cache['prompts'] = prompts
+            _prompt_cache['mtime'] = mtime
+            _prompt_cache['compiled'] = {key: _compile_template(value) for key, value in prompts.items() if isinstance(value, str)}
+        return _prompt_cache['prompts']
+
+def get_compiled_template(name):
+    """获取预编译的提示词模板"""
+    load_prompts()
+    return _prompt_cache['compiled'].get(name, [('', None)])
+
+def estimate_tokens(text):
+    """粗略估算文本的token数：中日韩字符约1个token，其余约4个字符1个token"""
+    if not text:
+        return 0
+    cjk_count = len(CJK_PATTERN.findall(text))
+    return cjk_count + (len(text) - cjk_count + 3) // 4
+
+def _chars_for_tokens(text, max_tokens):
+    """按文本自身的字符/token比例，把token上限换算为字符数"""
+    tokens = estimate_tokens(text)
+    if tokens <= max_tokens:
+        return len(text)
+    return max(0, int(len(text) * max_tokens / tokens))
+
+def collapse_repeated_lines(text):
+    """合并连续重复的行，常见于死循环中的print输出"""
+    lines = text.split('\n')
+    collapsed = []
+    previous = None
+    repeat = 0
+    for line in lines:
+        if line == previous:
+            repeat += 1
+            continue
+        if repeat:
+            collapsed.append(f"... (上一行重复了 {repeat} 次)")
+        collapsed.append(line)
+        previous = line
+        repeat = 0
+    if repeat:
+        collapsed.append(f"... (上一行重复了 {repeat} 次)")
+    return '\n'.join(collapsed)
+
+def truncate_head(text, max_tokens):
+    """保留开头部分"""
+    limit = _chars_for_tokens(text, max_tokens)
+    if limit >= len(text):
+        return text
+    return text[:limit] + f"\n... (已截断，省略了 {len(text) - limit} 个字符)"
+
+def truncate_tail(text, max_tokens):
+    """保留结尾部分，适用于程序输出"""
+    limit = _chars_for_tokens(text, max_tokens)
+    if limit >= len(text):
+        return text
+    return f"... (已截断，省略了前 {len(text) - limit} 个字符)\n" + text[len(text) - limit:]
+
+def truncate_middle(text, max_tokens):
+    """按行保留开头和结尾，省略中间部分，适用于过长的代码"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    lines = text.split('\n')
+    head, tail = [], []
+    used = 0
+    i, j = 0, len(lines) - 1
+    # 交替从头尾取行，直到用完预算
+    while i <= j:
+        cost = estimate_tokens(lines[i]) + 1
+        if used + cost > max_tokens:
+            break
+        head.append(lines[i])
+        used += cost
+        i += 1
+        if i > j:
+            break
+        cost = estimate_tokens(lines[j]) + 1
+        if used + cost > max_tokens:
+            break
+        tail.append(lines[j])
+        used += cost
+        j -= 1
+    omitted = j - i + 1
+    if omitted <= 0:
+        return text
+    return '\n'.join(head + [f"# ... (省略了 {omitted} 行) ..."] + list(reversed(tail)))
+
+def format_simulation_output(simulation_result, max_tokens=None):
+    """格式化代码执行结果，可按token上限摘要stdout和stderr"""
+    stdout = simulation_result.get('stdout', '') or ''
+    stderr = simulation_result.get('stderr', '') or ''
+    if max_tokens is not None and estimate_tokens(stdout) + estimate_tokens(stderr) > max_tokens:
+        stdout = collapse_repeated_lines(stdout)
+        stderr = collapse_repeated_lines(stderr)
+        # stderr通常包含最关键的错误信息，优先保留
+        stderr_budget = min(estimate_tokens(stderr), max_tokens // 2)
+        stderr = truncate_tail(stderr, stderr_budget)
+        stdout = truncate_tail(stdout, max_tokens - estimate_tokens(stderr))
+
+    output = f"标准输出(stdout):\n{stdout}\n\n标准错误(stderr):\n{stderr}"
+    if simulation_result.get('returncode', 0) != 0:
+        output += f"\n\n退出代码(returncode): {simulation_result['returncode']} (非零表示程序异常终止)"
+    return output
+
+def format_test_details(test_details, max_tokens=None):
+    """格式化已保存的测试用例结果，可按token上限截断每个用例的输出"""
+    passed = sum(1 for detail in test_details if detail.get('status') == 'passed')
+    header = f"已保存的评测结果：通过 {passed}/{len(test_details)} 个测试用例"
+    # 超出预算时，平均分配给每个用例的输出字段
+    field_budget = None
+    if max_tokens is not None and test_details:
+        field_budget = max(16, max_tokens // (len(test_details) * 4))
+
+    def field(value, keep_tail=False):
+        text = '' if value is None else str(value)
+        if field_budget is None:
+            return text
+        text = collapse_repeated_lines(text)
+        return truncate_tail(text, field_budget) if keep_tail else truncate_head(text, field_budget)
+
+    blocks = [header]
+    for detail in test_details:
+        status = '通过' if detail.get('status') == 'passed' else '失败'
+        block = (f"测试用例 {detail.get('case')}: {status}\n"
+                 f"输入:\n{field(detail.get('input'))}\n"
+                 f"期望输出:\n{field(detail.get('expected_output'))}\n"
+                 f"实际输出:\n{field(detail.get('actual_output'), keep_tail=True)}")
+        if detail.get('stderr'):
+            block += f"\n标准错误(stderr):\n{field(detail.get('stderr'), keep_tail=True)}"
+        blocks.append(block)
+    return '\n\n'.join(blocks)
+
+def format_test_context(simulation_result=None, test_details=None, max_tokens=None):
+    """优先使用已保存的测试结果，否则使用单次运行结果"""
+    if test_details is not None:
+        return format_test_details(test_details, max_tokens)
+    return format_simulation_output(simulation_result, max_tokens)
+
+def simulation_output_text(simulation_result=None, test_details=None):
+    """生成随评估结果保存的运行输出说明"""
+    if test_details is not None:
+        return format_test_details(test_details)
+    return f"标准输出(stdout):\n{simulation_result['stdout']}\n\n标准错误(stderr):\n{simulation_result['stderr']}"
+
+def _allocate_budget(sizes, budget):
+    """按权重分配各段预算，未用完的部分分给其余超长的段"""
+    allocation = {}
+    pending = set(sizes)
+    while pending:
+        total_weight = sum(SECTION_WEIGHTS.get(name, 1) for name in pending)
+        fits = [name for name in pending if sizes[name] <= budget * SECTION_WEIGHTS.get(name, 1) / total_weight]
+        if not fits:
+            for name in pending:
+                allocation[name] = int(budget * SECTION_WEIGHTS.get(name, 1) / total_weight)
+            break
+        for name in fits:
+            allocation[name] = sizes[name]
+            budget -= sizes[name]
+            pending.discard(name)
+    return allocation
+
+def _record_prompt_size(role, prompt, truncated_sections):
+    """记录每次调用的提示词大小"""
+    truncated = f"，已截断: {', '.join(truncated_sections)}" if truncated_sections else ""
+    tokens = estimate_tokens(prompt)
+    metrics.LLM_PROMPT_TOKENS.observe(tokens, role=role)
+    print(f"提示词大小({role}): {len(prompt)} 字符，约 {tokens} tokens{truncated}")
+
+def build_prompt(role, problem_description, code, simulation_result=None, criteria='', user_input='', test_details=None):
+    """
+    构建AI提示词，超出角色预算的内容会被截断或摘要。
+    提供test_details(已保存的评测结果)时用它代替simulation_result作为测试结果上下文。
+    """
+    template_name = 'teacher_review_prompt' if role == 'teacher' else 'student_question_prompt'
+    segments = get_compiled_template(template_name)
+
+    sections = {
+        'problem_description': problem_description or '',
+        'code': code or '',
+        'criteria': criteria or '',
+        'user_question': user_input or ''
+    }
+    used = {name for _, name in segments if name}
+    sizes = {name: estimate_tokens(value) for name, value in sections.items() if name in used}
+    if 'automated_test_results' in used:
+        sizes['automated_test_results'] = estimate_tokens(format_test_context(simulation_result, test_details))
+
+    budget = PROMPT_TOKEN_BUDGETS.get(role, PROMPT_TOKEN_BUDGETS['student'])
+    fixed_tokens = sum(estimate_tokens(text) for text, _ in segments)
+    allocation = _allocate_budget(sizes, max(0, budget - fixed_tokens))
+
+    truncated_sections = [name for name in sizes if allocation[name] < sizes[name]]
+    values = {}
+    for name in used:
+        limit = allocation[name]
+        if name == 'automated_test_results':
+            values[name] = format_test_context(simulation_result, test_details, limit if name in truncated_sections else None)
+        elif name == 'code':
+            values[name] = truncate_middle(sections[name], limit)
+        else:
+            values[name] = truncate_head(sections[name], limit)
+
+    prompt = ''.join(text + (values[name] if name else '') for text, name in segments)
+    _record_prompt_size(role, prompt, truncated_sections)
+    return prompt
+
+class CircuitBreaker:
+    """AI服务熔断器：连续失败达到阈值后快速失败，冷却后放行单个探测请求"""
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0
+        self.probe_in_flight = False
+        self.lock = threading.Lock()
+
+    def allow_request(self):
+        """判断当前是否允许发起请求"""
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self.probe_in_flight = False
+            if self.state == self.HALF_OPEN and not self.probe_in_flight:
+                self.probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.probe_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.probe_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    print(f"AI服务熔断：连续失败 {self.failures} 次，{self.reset_timeout} 秒内快速失败")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def release_probe(self):
+        """探测请求未得出健康结论(如被限流)时释放探测名额"""
+        with self.lock:
+            self.probe_in_flight = False
+
+class RetryBudget:
+    """进程内共享的重试预算：窗口内重试次数不超过请求数的一定比例"""
+    def __init__(self, ratio, min_retries, window):
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.window = window
+        self.requests = deque()
+        self.retries = deque()
+        self.lock = threading.Lock()
+
+    def _trim(self, now):
+        for events in (self.requests, self.retries):
+            while events and now - events[0] > self.window:
+                events.popleft()
+
+    def record_request(self):
+        with self.lock:
+            now = time.monotonic()
+            self._trim(now)
+            self.requests.append(now)
+
+    def try_acquire(self):
+        """尝试消耗一次重试额度"""
+        with self.lock:
+            now = time.monotonic()
+            self._trim(now)
+            allowed = max(self.min_retries, self.ratio * len(self.requests))
+            if len(self.retries) >= allowed:
+                return False
+            self.retries.append(now)
+            return True
+
+circuit_breaker = CircuitBreaker(LLM_CIRCUIT_FAILURE_THRESHOLD, LLM_CIRCUIT_RESET_TIMEOUT)
+retry_budget = RetryBudget(LLM_RETRY_BUDGET_RATIO, LLM_RETRY_BUDGET_MIN, LLM_RETRY_BUDGET_WINDOW)
+
+def fallback_response(message):
+    """AI服务不可用时返回的兜底JSON(带fallback标记，便于调用方区分)"""
+    return json.dumps({"general_comment": message, "fallback": True}, ensure_ascii=False)
+
+def backoff_delay(attempt, retry_after=None):
+    """计算重试等待时间：优先遵循Retry-After，否则使用带完全抖动的指数退避"""
+    if retry_after is not None:
+        try:
+            return min(float(retry_after), LLM_BACKOFF_MAX)
+        except (TypeError, ValueError):
+            pass
+    return random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+
+def _finish_call(started, result, content):
+    """记录一次AI调用的结果(success/fallback/circuit_open)和总耗时"""
+    elapsed = time.perf_counter() - started
+    metrics.LLM_CALLS.inc(result=result)
+    metrics.LLM_CALL_LATENCY.observe(elapsed, result=result)
+    metrics.add_request_time('llm', elapsed)
+    return content
+
+def call_llm_api(prompt, max_retries=LLM_MAX_RETRIES):
     """调用AI API获取代码评审"""
+    # requests导入开销较大，首次调用AI服务时才导入
+    import requests
+
+    started = time.perf_counter()
+    if not circuit_breaker.allow_request():
+        print("AI服务处于熔断状态，直接返回兜底结果")
+        return _finish_call(started, 'circuit_open', fallback_response("AI服务暂时不可用，请稍后重试。"))
+
     headers = {'Content-Type': 'application/json', 'Authorization': f'Bearer {API_KEY}'}
     payload = {"model": MODEL_NAME, "messages": [{"role": "user", "content": prompt}], "temperature": 0.2}
-    
+    retry_budget.record_request()
+    last_error = "AI服务暂时不可用，请稍后重试。"
+
     for attempt in range(max_retries):
+        retry_after = None
+        response = None
+        attempt_started = time.perf_counter()
         try:
-            response = requests.post(f"{BASE_URL}/chat/completions", headers=headers, json=payload, timeout=PDF_GENERATION_TIMEOUT)
-            response.raise_for_status()
-            response_data = response.json()
-            content = response_data.get('choices', [{}])[0].get('message', {}).get('content', '')
-            if not content:
-                print("AI服务返回了空内容")
-                return json.dumps({"general_comment": "AI服务返回了空内容，请稍后重试。"})
-            print(f"AI响应成功，内容长度: {len(content)}")
-            return content
+            response = requests.post(f"{BASE_URL}/chat/completions", headers=headers, json=payload, timeout=LLM_REQUEST_TIMEOUT)
+            metrics.LLM_ATTEMPT_LATENCY.observe(time.perf_counter() - attempt_started, status=response.status_code)
+            if response.status_code == 429:
+                # 被限流说明服务本身可用，不计入熔断失败
+                retry_after = response.headers.get('Retry-After')
+                last_error = "AI服务请求过于频繁，请稍后重试。"
+                print(f"AI服务限流(429)，Retry-After: {retry_after}")
+                circuit_breaker.release_probe()
+            elif response.status_code >= 500:
+                last_error = f"AI服务暂时不可用(HTTP {response.status_code})，请稍后重试。"
+                print(f"AI服务返回 {response.status_code}")
+                circuit_breaker.record_failure()
+            else:
+                response.raise_for_status()
+                response_data = response.json()
+                circuit_breaker.record_success()
+                content = response_data.get('choices', [{}])[0].get('message', {}).get('content', '')
+                if not content:
+                    print("AI服务返回了空内容")
+                    return _finish_call(started, 'fallback', fallback_response("AI服务返回了空内容，请稍后重试。"))
+                print(f"AI响应成功，内容长度: {len(content)}")
+                return _finish_call(started, 'success', content)
         except requests.exceptions.Timeout:
-            if attempt < max_retries - 1:
-                time.sleep(2 ** attempt)
-                continue
+            metrics.LLM_ATTEMPT_LATENCY.observe(time.perf_counter() - attempt_started, status='timeout')
             print("AI服务响应超时")
-            return json.dumps({"general_comment": "AI服务响应超时，请稍后重试。"})
+            last_error = "AI服务响应超时，请稍后重试。"
+            circuit_breaker.record_failure()
+        except requests.exceptions.ConnectionError as e:
+            metrics.LLM_ATTEMPT_LATENCY.observe(time.perf_counter() - attempt_started, status='connection_error')
+            print(f"无法连接AI服务: {str(e)}")
+            last_error = f"调用AI服务失败: {str(e)}"
+            circuit_breaker.record_failure()
         except requests.exceptions.RequestException as e:
+            # 其余4xx等请求错误重试无意义
+            if response is None:
+                metrics.LLM_ATTEMPT_LATENCY.observe(time.perf_counter() - attempt_started, status='error')
             print(f"调用AI服务失败: {str(e)}")
-            return json.dumps({"general_comment": f"调用AI服务失败: {str(e)}"})
+            circuit_breaker.release_probe()
+            return _finish_call(started, 'fallback', fallback_response(f"调用AI服务失败: {str(e)}"))
         except json.JSONDecodeError as e:
             print(f"AI响应JSON解析失败: {str(e)}")
-            return json.dumps({"general_comment": "AI服务返回了无效的JSON格式，请稍后重试。"})
+            circuit_breaker.release_probe()
+            return _finish_call(started, 'fallback', fallback_response("AI服务返回了无效的JSON格式，请稍后重试。"))
+
+        if attempt >= max_retries - 1 or not circuit_breaker.allow_request():
+            break
+        if not retry_budget.try_acquire():
+            print("AI服务重试预算已用尽，放弃重试")
+            circuit_breaker.release_probe()
+            break
+        metrics.LLM_RETRIES.inc()
+        time.sleep(backoff_delay(attempt, retry_after))
+
     print("AI服务暂时不可用")
-    return json.dumps({"general_comment": "AI服务暂时不可用，请稍后重试。"})
\ No newline at end of file
+    return _finish_call(started, 'fallback', fallback_response(last_error))
+
+def parse_ai_response(role, llm_response_content):
+    """解析AI返回的JSON内容，缺失字段补默认值；无法解析时保留原始内容"""
+    try:
+        result_data = json.loads(llm_response_content)
+        if not isinstance(result_data, dict):
+            raise ValueError("AI返回的不是有效的JSON对象")
+        
+        # 根据角色检查必要的字段
+        if role == 'teacher':
+            if 'general_comment' not in result_data:
+                result_data['general_comment'] = "AI评估完成，但缺少总体评价。"
+        else:  # student
+            # 学生端需要检查不同的字段
+            if 'explanation' not in result_data:
+                result_data['explanation'] = "AI辅导完成，但缺少解释。"
+            if 'hint_or_snippet' not in result_data:
+                result_data['hint_or_snippet'] = ""
+            if 'next_step_question' not in result_data:
+                result_data['next_step_question'] = ""
+                
+    except (json.JSONDecodeError, ValueError) as e:
+        print(f"AI响应解析失败: {e}")
+        # 当AI无法响应JSON格式时，返回原始内容
+        if role == 'teacher':
+            result_data = {
+                "general_comment": llm_response_content,
+                "raw_response": llm_response_content,
+                "strengths": [], "areas_for_improvement": [], "total_score": 0
+            }
+        else:  # student
+            result_data = {
+                "explanation": llm_response_content,
+                "hint_or_snippet": "",
+                "next_step_question": "",
+                "raw_response": llm_response_content
+            }
+    return result_data
@@ -0,0 +1,256 @@
+"""
+离线批量评测：把一个目录或ZIP压缩包中的学生代码(.py)按题目的测试用例评测并保存为提交记录。
+
+用法(在项目根目录):
+    python -m scripts.batch_grade --problem 3 作业/第三周/
+    python -m scripts.batch_grade --problem 3 第三周.zip --output 第三周成绩.csv
+    python -m scripts.batch_grade --problem 3 第三周.zip --id-pattern "(\\d{8})"
+
+学号默认取文件名(去掉.py)，也可用 --id-pattern 从文件名中提取(使用第一个分组)。
+评测逻辑与 /api/submit 相同(scripts/grading.py)，各文件在多个线程中并行评测
+(每个线程同时运行一个代码子进程，默认线程数为CPU核数)，结果每 --batch-size 份写入一次数据库，
+同一学生对该题目的旧提交会被替换。
+
+每写入一批，就把这批文件记录到进度文件(默认为 <输出文件>.state.jsonl)；
+中断后加 --resume 重新运行，会跳过进度文件中内容未变化的文件。
+结束后把全部结果(包括之前已完成的)写入 --output 指定的汇总文件，按扩展名输出CSV或JSON；
+个别文件评测出错时记录在汇总文件的error列并以状态码1退出，--resume 时会重新评测这些文件。
+"""
+import os
+import re
+import csv
+import sys
+import json
+import time
+import zipfile
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from .code_hash import generate_code_hash
+from .database import init_db, connect_db
+from .code_executor import use_dedicated_gate
+from .grading import load_test_cases, grade_code, replace_submissions
+
+SUMMARY_FIELDS = ['student_id', 'source', 'passed', 'total', 'score', 'submission_id', 'error']
+
+def _decode(data):
+    return data.decode('utf-8-sig', errors='replace')
+
+def collect_sources(paths):
+    """列出所有待评测文件，返回 [(来源, 文件名, 代码), ...]，来源形如 目录/a.py 或 包.zip:a.py"""
+    sources = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                dirs.sort()
+                for name in sorted(names):
+                    if name.endswith('.py'):
+                        full_path = os.path.join(root, name)
+                        with open(full_path, 'rb') as f:
+                            sources.append((full_path, name, _decode(f.read())))
+        elif zipfile.is_zipfile(path):
+            with zipfile.ZipFile(path) as archive:
+                for info in sorted(archive.infolist(), key=lambda item: item.filename):
+                    name = os.path.basename(info.filename)
+                    # 跳过目录和macOS压缩时附带的元数据文件
+                    if info.is_dir() or not name.endswith('.py') or name.startswith('._') or '__MACOSX/' in info.filename:
+                        continue
+                    sources.append((f"{path}:{info.filename}", name, _decode(archive.read(info))))
+        elif path.endswith('.py') and os.path.isfile(path):
+            with open(path, 'rb') as f:
+                sources.append((path, os.path.basename(path), _decode(f.read())))
+        else:
+            raise ValueError(f"不是目录、ZIP压缩包或.py文件: {path}")
+    return sources
+
+def student_id_for(name, pattern):
+    """从文件名得到学号，无法提取时返回None"""
+    stem = name[:-len('.py')]
+    if not pattern:
+        return stem.strip() or None
+    match = pattern.search(stem)
+    if not match:
+        return None
+    return (match.group(1) if pattern.groups else match.group(0)).strip() or None
+
+def load_state(path):
+    """读取进度文件，返回 {来源: 记录}；文件末尾写了一半的行会被忽略"""
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            done[entry['source']] = entry
+    return done
+
+class BatchWriter:
+    """缓存评测结果，每满 batch_size 份在一个事务中写入数据库并追加到进度文件"""
+    def __init__(self, problem_id, batch_size, state_path):
+        self.problem_id = problem_id
+        self.batch_size = batch_size
+        self.db = connect_db('student')
+        self.state_file = open(state_path, 'a', encoding='utf-8')
+        self.pending = []
+        self.written = []
+
+    def add(self, source, student_id, code, result):
+        self.pending.append((source, student_id, code, result))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        cursor = self.db.cursor()
+        submission_ids = replace_submissions(
+            cursor, self.problem_id, [(student_id, code, result) for _, student_id, code, result in self.pending]
+        )
+        self.db.commit()
+        # 数据库提交成功后再记录进度，中断时最多重新评测未提交的这一批
+        for source, student_id, code, result in self.pending:
+            entry = {
+                'source': source, 'student_id': student_id, 'code_hash': generate_code_hash(code),
+                'passed': result['passed'], 'total': result['total'], 'submission_id': submission_ids[student_id]
+            }
+            self.state_file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            self.written.append(entry)
+        self.state_file.flush()
+        self.pending = []
+
+    def close(self):
+        self.state_file.close()
+        self.db.close()
+
+def grade_file(gate, student_id, code, test_cases):
+    """评测一份代码，整个评测占用一个执行名额(各测试用例依次执行)"""
+    with gate.slot(f"batch:{student_id}"):
+        return grade_code(code, test_cases)
+
+def write_summary(path, entries):
+    """按扩展名把汇总结果写为CSV或JSON；评测失败的文件只有error列"""
+    rows = []
+    for entry in sorted(entries, key=lambda item: item['student_id']):
+        if entry.get('error'):
+            score = None
+        else:
+            score = round(entry['passed'] / entry['total'] * 100, 1) if entry['total'] else 0
+        rows.append({**{field: entry.get(field) for field in SUMMARY_FIELDS}, 'score': score})
+    if path.lower().endswith('.json'):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+    else:
+        # 带BOM的UTF-8，Excel可以直接打开中文内容
+        with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+
+def main():
+    parser = argparse.ArgumentParser(description='离线批量评测学生代码')
+    parser.add_argument('paths', nargs='+', help='学生代码目录、ZIP压缩包或.py文件')
+    parser.add_argument('--problem', type=int, required=True, help='题目ID')
+    parser.add_argument('--id-pattern', help='从文件名(不含.py)提取学号的正则表达式，默认使用整个文件名')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2, help='并行评测的线程数，默认为CPU核数')
+    parser.add_argument('--batch-size', type=int, default=50, help='每次写入数据库的提交数')
+    parser.add_argument('--output', default=f"batch-grade-{time.strftime('%Y%m%d-%H%M%S')}.csv",
+                        help='汇总文件(.csv或.json)')
+    parser.add_argument('--state', help='进度文件，默认为 <输出文件>.state.jsonl')
+    parser.add_argument('--resume', action='store_true', help='跳过进度文件中已完成且内容未变化的文件')
+    args = parser.parse_args()
+    if args.workers < 1 or args.batch_size < 1:
+        parser.error('--workers 和 --batch-size 必须大于0')
+    try:
+        pattern = re.compile(args.id_pattern) if args.id_pattern else None
+    except re.error as e:
+        parser.error(f"--id-pattern 不是有效的正则表达式: {e}")
+    state_path = args.state or f"{args.output}.state.jsonl"
+
+    init_db()
+    db_teacher = connect_db('teacher')
+    try:
+        if not db_teacher.execute('SELECT 1 FROM Problem WHERE id = ?', (args.problem,)).fetchone():
+            parser.error(f"题目不存在: {args.problem}")
+        test_cases = [dict(row) for row in load_test_cases(db_teacher, args.problem)]
+    finally:
+        db_teacher.close()
+
+    try:
+        sources = collect_sources(args.paths)
+    except (OSError, ValueError, zipfile.BadZipFile) as e:
+        parser.error(str(e))
+
+    if not args.resume and os.path.exists(state_path):
+        os.remove(state_path)
+    done = load_state(state_path) if args.resume else {}
+
+    # 整理待评测列表：跳过无法得到学号、学号重复和已完成的文件
+    jobs = []
+    seen = {}
+    skipped = 0
+    finished = []
+    for source, name, code in sources:
+        student_id = student_id_for(name, pattern)
+        if student_id is None:
+            print(f"跳过 {source}: 无法从文件名提取学号")
+            continue
+        if student_id in seen:
+            print(f"跳过 {source}: 学号 {student_id} 与 {seen[student_id]} 重复")
+            continue
+        seen[student_id] = source
+        entry = done.get(source)
+        if entry and entry['student_id'] == student_id and entry['code_hash'] == generate_code_hash(code):
+            finished.append(entry)
+            skipped += 1
+            continue
+        jobs.append((source, student_id, code))
+
+    print(f"题目 {args.problem}：{len(test_cases)} 个测试用例，{len(jobs)} 份代码待评测"
+          + (f"，{skipped} 份已完成" if skipped else "") + f"，{args.workers} 个线程")
+
+    # 本进程独占的执行名额，与线程数一致，不受网页服务按学生排队的限制
+    gate = use_dedicated_gate(args.workers)
+    writer = BatchWriter(args.problem, args.batch_size, state_path)
+    started = time.monotonic()
+    interrupted = False
+    failed = []
+    executor = ThreadPoolExecutor(max_workers=args.workers)
+    try:
+        futures = {executor.submit(grade_file, gate, student_id, code, test_cases): (source, student_id, code)
+                   for source, student_id, code in jobs}
+        for count, future in enumerate(as_completed(futures), start=1):
+            source, student_id, code = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                # 单个文件评测失败不影响其他文件；不记入进度文件，--resume 时会重新评测
+                failed.append({'source': source, 'student_id': student_id, 'error': f"{type(e).__name__}: {e}"})
+                print(f"[{count}/{len(jobs)}] {student_id}: 评测失败 {type(e).__name__}: {e}  ({source})")
+                continue
+            writer.add(source, student_id, code, result)
+            print(f"[{count}/{len(jobs)}] {student_id}: {result['passed']}/{result['total']}  ({source})")
+    except KeyboardInterrupt:
+        interrupted = True
+        print("\n已中断，正在保存已完成的结果...")
+        executor.shutdown(wait=True, cancel_futures=True)
+    finally:
+        executor.shutdown(wait=True)
+        writer.flush()
+        writer.close()
+
+    finished += writer.written
+    write_summary(args.output, finished + failed)
+    elapsed = time.monotonic() - started
+    print(f"本次评测 {len(writer.written)} 份，用时 {elapsed:.1f}s，汇总 {len(finished)} 份已写入 {args.output}"
+          + (f"，{len(failed)} 份评测失败(见error列)" if failed else ""))
+    if interrupted or failed:
+        print(f"加 --resume 重新运行即可继续(进度文件 {state_path})")
+    if interrupted:
+        sys.exit(130)
+    if failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+"""
+静态资源构建：为文件名加入内容指纹，并预先压缩为gzip(安装brotli时同时生成br)。
+
+用法(在项目根目录):
+    python -m scripts.build_static
+
+输出到 static/build/，manifest.json 记录原路径到带指纹路径的映射，
+页面通过 asset_url() 引用带指纹的地址，服务器按 Accept-Encoding 返回预压缩文件并允许长期缓存。
+
+Monaco编辑器由AMD加载器按相对路径加载模块和worker，前端ES模块之间也按相对路径导入，
+这两组文件不能单独改名，因此对整个目录计算指纹(如 js/vs.1a2b3c4d/loader.js)；
+其余文件单独加指纹(如 css/style.1a2b3c4d.css)。
+"""
+import os
+import re
+import gzip
+import json
+import shutil
+import hashlib
+import argparse
+from .config import STATIC_DIR, STATIC_BUILD_DIR
+
+# 按目录计算指纹的文件组：(组内文件的公共根目录, 包含的路径前缀, 输出目录名)
+# 输出目录名同时作为manifest中整个目录的键(如Monaco的require.config需要 js/vs 的地址)
+TREE_GROUPS = [
+    ('js/vs', ('js/vs/',), 'js/vs'),
+    ('js', ('js/main.js', 'js/modules/'), 'js/app'),
+]
+
+# 值得压缩的文件类型(图片、字体等已压缩格式跳过)
+COMPRESSIBLE_EXTENSIONS = {'.js', '.css', '.html', '.json', '.svg', '.txt', '.map', '.ttf', '.otf'}
+MIN_COMPRESS_BYTES = 512
+
+# CSS中引用的静态资源地址，构建时替换为带指纹的地址
+CSS_URL_PATTERN = re.compile(r"""url\((['"]?)/static/([^'")]+)\1\)""")
+
+FINGERPRINT_LENGTH = 8
+
+def content_hash(chunks):
+    digest = hashlib.sha256()
+    for chunk in chunks:
+        digest.update(chunk)
+    return digest.hexdigest()[:FINGERPRINT_LENGTH]
+
+def list_source_files(static_dir, build_dir):
+    """列出需要构建的静态文件(相对路径，使用/分隔)，跳过构建输出目录"""
+    files = []
+    build_dir = os.path.abspath(build_dir)
+    for root, dirs, names in os.walk(static_dir):
+        dirs[:] = [d for d in dirs if os.path.abspath(os.path.join(root, d)) != build_dir]
+        for name in names:
+            path = os.path.join(root, name)
+            files.append(os.path.relpath(path, static_dir).replace(os.sep, '/'))
+    return sorted(files)
+
+def read_file(static_dir, relpath):
+    with open(os.path.join(static_dir, relpath), 'rb') as f:
+        return f.read()
+
+def fingerprinted_name(relpath, digest):
+    """style.css -> style.<指纹>.css"""
+    directory, name = os.path.split(relpath)
+    stem, ext = os.path.splitext(name)
+    return f"{directory}/{stem}.{digest}{ext}" if directory else f"{stem}.{digest}{ext}"
+
+def rewrite_css(data, manifest):
+    """把CSS中的 /static/... 引用替换为带指纹的地址"""
+    def replace(match):
+        quote, target = match.groups()
+        return f"url({quote}/static/build/{manifest.get(target, target)}{quote})"
+    return CSS_URL_PATTERN.sub(replace, data.decode('utf-8')).encode('utf-8')
+
+def write_output(build_dir, relpath, data, brotli_module):
+    """写入文件及其预压缩版本，返回(原始大小, gzip大小, br大小)"""
+    path = os.path.join(build_dir, relpath)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+    sizes = [len(data), None, None]
+    if os.path.splitext(relpath)[1].lower() not in COMPRESSIBLE_EXTENSIONS or len(data) < MIN_COMPRESS_BYTES:
+        return sizes
+    gz = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(gz) < len(data):
+        with open(path + '.gz', 'wb') as f:
+            f.write(gz)
+        sizes[1] = len(gz)
+    if brotli_module is not None:
+        br = brotli_module.compress(data, quality=11)
+        if len(br) < len(data):
+            with open(path + '.br', 'wb') as f:
+                f.write(br)
+            sizes[2] = len(br)
+    return sizes
+
+def build(static_dir=STATIC_DIR, build_dir=STATIC_BUILD_DIR):
+    """构建静态资源并写入manifest，返回manifest"""
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+        print("未安装brotli，只生成gzip压缩文件(pip install brotli 可同时生成br)")
+
+    if os.path.exists(build_dir):
+        shutil.rmtree(build_dir)
+    sources = list_source_files(static_dir, build_dir)
+    manifest = {}
+    outputs = []
+
+    # 按目录计算指纹的文件组
+    grouped = set()
+    for root, prefixes, output_name in TREE_GROUPS:
+        members = [path for path in sources if any(path == p or (p.endswith('/') and path.startswith(p)) for p in prefixes)]
+        if not members:
+            continue
+        digest = content_hash(member.encode('utf-8') + b'\0' + read_file(static_dir, member) for member in members)
+        output_root = f"{output_name}.{digest}"
+        manifest[output_name] = output_root
+        for member in members:
+            target = f"{output_root}/{member[len(root) + 1:]}"
+            manifest[member] = target
+            outputs.append((member, target))
+            grouped.add(member)
+
+    # 其余文件单独加指纹；CSS最后处理，以便替换其中引用的资源地址
+    singles = [path for path in sources if path not in grouped]
+    singles.sort(key=lambda path: path.endswith('.css'))
+    css_data = {}
+    for path in singles:
+        data = read_file(static_dir, path)
+        if path.endswith('.css'):
+            data = rewrite_css(data, manifest)
+            css_data[path] = data
+        target = fingerprinted_name(path, content_hash([data]))
+        manifest[path] = target
+        outputs.append((path, target))
+
+    totals = [0, 0, 0]
+    for source, target in outputs:
+        data = css_data.get(source) or read_file(static_dir, source)
+        original, gz, br = write_output(build_dir, target, data, brotli)
+        totals[0] += original
+        totals[1] += gz if gz is not None else original
+        totals[2] += br if br is not None else (gz if gz is not None else original)
+
+    with open(os.path.join(build_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+
+    print(f"已构建 {len(outputs)} 个静态文件到 {build_dir}")
+    print(f"原始大小 {totals[0] / 1024:.0f} KB，gzip后 {totals[1] / 1024:.0f} KB"
+          + (f"，brotli后 {totals[2] / 1024:.0f} KB" if brotli is not None else ""))
+    return manifest
+
+def main():
+    parser = argparse.ArgumentParser(description='静态资源指纹与预压缩构建')
+    parser.add_argument('--static-dir', default=STATIC_DIR)
+    parser.add_argument('--build-dir', default=STATIC_BUILD_DIR)
+    args = parser.parse_args()
+    build(args.static_dir, args.build_dir)
+
+if __name__ == '__main__':
+    main()
@@ -1,31 +1,298 @@
 import os
+import math
 import subprocess
 import tempfile
-from .config import CODE_EXECUTION_TIMEOUT
+import time
+import threading
+from collections import deque, OrderedDict
+from contextlib import contextmanager
+from .config import (
+    CODE_EXECUTION_TIMEOUT, EXECUTOR_MAX_CONCURRENT, EXECUTOR_QUEUE_LIMIT,
+    EXECUTOR_QUEUE_PER_STUDENT, EXECUTOR_QUEUE_TIMEOUT
+)
+from . import metrics
 
-def execute_code_safely(code, input_data=None):
-    """安全执行Python代码"""
-    # 创建临时文件
+class ExecutorBusyError(Exception):
+    """执行队列已满或排队超时，调用方应返回429并提示retry_after秒后重试"""
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class _Ticket:
+    """一个排队中的执行请求"""
+    __slots__ = ('granted',)
+
+    def __init__(self):
+        self.granted = False
+
+class ExecutionGate:
+    """
+    代码执行准入控制：限制同时运行的学生代码子进程数。
+    没有空闲名额时请求进入有界队列，名额释放后按学生轮流分配，
+    避免同一学生连续提交占满名额；队列已满或等待超时时抛出ExecutorBusyError。
+    """
+    def __init__(self, max_concurrent, queue_limit, per_student_limit, queue_timeout):
+        self.max_concurrent = max_concurrent
+        self.queue_limit = queue_limit
+        self.per_student_limit = per_student_limit
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.queued = 0
+        self.waiting = OrderedDict()    # 学生 -> 排队中的请求，按轮转顺序排列
+        self.admitted = 0
+        self.rejected = {'queue_full': 0, 'student_limit': 0, 'timeout': 0}
+        self.avg_hold = 1.0             # 每次占用名额的平均时长(秒)，用于估算Retry-After
+        self.avg_wait = 0.0
+        self.max_wait = 0.0
+        self.condition = threading.Condition()
+        self.local = threading.local()
+
+    @contextmanager
+    def slot(self, owner=None):
+        """占用一个执行名额；同一线程内嵌套调用时复用已占用的名额"""
+        if getattr(self.local, 'held', False):
+            yield
+            return
+        self._acquire(owner or 'anonymous')
+        self.local.held = True
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.local.held = False
+            self._release(time.monotonic() - started)
+
+    def _retry_after(self):
+        # 按排在前面的请求数和平均占用时长估算
+        return min(60, max(1, math.ceil(self.avg_hold * (self.queued + 1) / self.max_concurrent)))
+
+    def _reject(self, reason, message):
+        self.rejected[reason] += 1
+        metrics.EXECUTOR_REJECTED.inc(reason=reason)
+        return ExecutorBusyError(message, self._retry_after())
+
+    def _acquire(self, owner):
+        started = time.monotonic()
+        with self.condition:
+            if self.active < self.max_concurrent and not self.waiting:
+                self.active += 1
+                self.admitted += 1
+            else:
+                if self.queued >= self.queue_limit:
+                    raise self._reject('queue_full', "评测排队人数已满，请稍后重试")
+                queue = self.waiting.get(owner)
+                if queue is not None and len(queue) >= self.per_student_limit:
+                    raise self._reject('student_limit', "你已有评测在排队，请等待完成后再提交")
+                if queue is None:
+                    queue = self.waiting[owner] = deque()
+                ticket = _Ticket()
+                queue.append(ticket)
+                self.queued += 1
+                deadline = started + self.queue_timeout
+                while not ticket.granted:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        queue.remove(ticket)
+                        self.queued -= 1
+                        if not queue:
+                            del self.waiting[owner]
+                        raise self._reject('timeout', "评测排队超时，请稍后重试")
+                    self.condition.wait(remaining)
+            waited = time.monotonic() - started
+            self.avg_wait = self.avg_wait * 0.9 + waited * 0.1
+            self.max_wait = max(self.max_wait, waited)
+        metrics.EXECUTOR_QUEUE_WAIT.observe(waited)
+        metrics.add_request_time('executor_queue', waited)
+
+    def _release(self, held):
+        with self.condition:
+            self.avg_hold = self.avg_hold * 0.8 + held * 0.2
+            if not self.waiting:
+                self.active -= 1
+                return
+            # 名额直接交给轮到的学生的最早请求，该学生移到轮转队尾
+            owner, queue = next(iter(self.waiting.items()))
+            ticket = queue.popleft()
+            del self.waiting[owner]
+            if queue:
+                self.waiting[owner] = queue
+            ticket.granted = True
+            self.queued -= 1
+            self.admitted += 1
+            self.condition.notify_all()
+
+    def status(self):
+        with self.condition:
+            return {
+                "max_concurrent": self.max_concurrent,
+                "active": self.active,
+                "queued": self.queued,
+                "queue_limit": self.queue_limit,
+                "per_student_limit": self.per_student_limit,
+                "waiting_students": len(self.waiting),
+                "admitted": self.admitted,
+                "rejected": dict(self.rejected),
+                "avg_wait_ms": round(self.avg_wait * 1000, 1),
+                "max_wait_ms": round(self.max_wait * 1000, 1),
+                "avg_hold_ms": round(self.avg_hold * 1000, 1)
+            }
+
+# 进程内全局的执行准入控制
+execution_gate = ExecutionGate(
+    EXECUTOR_MAX_CONCURRENT, EXECUTOR_QUEUE_LIMIT, EXECUTOR_QUEUE_PER_STUDENT, EXECUTOR_QUEUE_TIMEOUT
+)
+
+def use_dedicated_gate(max_concurrent):
+    """
+    独立运行的命令行进程(如离线批量评测)改用只属于本进程的执行名额：
+    名额数等于调用方的并行线程数，每个线程占用一个名额，不会因为按学生排队的限制被拒绝。
+    """
+    global execution_gate
+    execution_gate = ExecutionGate(max_concurrent, max_concurrent, max_concurrent, EXECUTOR_QUEUE_TIMEOUT)
+    return execution_gate
+
+def execute_code_safely(code, input_data=None, timeout=None, input_path=None):
+    """
+    安全执行Python代码(未持有执行名额时先获取，可能抛出ExecutorBusyError)。
+    标准输入为input_data文本，或直接使用input_path文件；timeout为时限(秒)，默认CODE_EXECUTION_TIMEOUT。
+    返回结果中的elapsed为子进程运行时间(秒)。
+    """
+    with execution_gate.slot():
+        return _run_code(code, input_data, timeout or CODE_EXECUTION_TIMEOUT, input_path)
+
+def execute_and_compare(code, comparator, input_data=None, input_path=None, timeout=None):
+    """
+    执行代码并把标准输出按块交给comparator(见comparators.py)与期望输出比较，不保存完整输出；
+    输出已确定不一致时立即结束子进程(stopped_early)。返回结果中matched为输出是否一致，
+    stdout只保留开头 OUTPUT_PREVIEW_BYTES 字节(truncated表示被截断)。
+    """
+    with execution_gate.slot():
+        return _run_and_compare(code, comparator, input_data, input_path, timeout or CODE_EXECUTION_TIMEOUT)
+
+# 流式比较时每次读取的输出块大小，以及评测结果中保留的输出和错误输出长度
+STREAM_CHUNK_BYTES = 64 * 1024
+OUTPUT_PREVIEW_BYTES = 64 * 1024
+STDERR_LIMIT_BYTES = 64 * 1024
+
+@contextmanager
+def _script_file(code):
     with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False, encoding='utf-8') as tmp_file:
         tmp_file.write(code)
         tmp_file_path = tmp_file.name
-    
     try:
-        input_bytes = input_data.encode('utf-8') if input_data is not None else None
-        result = subprocess.run(
-            ['python', tmp_file_path],
-            input=input_bytes,
-            capture_output=True,
-            timeout=CODE_EXECUTION_TIMEOUT,
-        )
+        yield tmp_file_path
+    finally:
+        # 清理临时文件
+        if os.path.exists(tmp_file_path):
+            os.remove(tmp_file_path)
+
+def _stdin_file(input_data, input_path):
+    """子进程的标准输入：数据文件直接打开，文本写入临时文件(避免写入管道时与读取输出互相阻塞)"""
+    if input_path is not None:
+        return open(input_path, 'rb')
+    stdin = tempfile.TemporaryFile()
+    if input_data:
+        stdin.write(input_data.encode('utf-8'))
+        stdin.seek(0)
+    return stdin
+
+def _record_run(outcome, elapsed):
+    metrics.EXECUTOR_RUNS.inc(outcome=outcome)
+    metrics.EXECUTOR_LATENCY.observe(elapsed, outcome=outcome)
+    metrics.add_request_time('executor', elapsed)
+
+def _run_code(code, input_data, timeout, input_path=None):
+    started = time.perf_counter()
+    outcome = 'failure'
+    try:
+        with _script_file(code) as tmp_file_path:
+            metrics.EXECUTOR_SPAWNS.inc()
+            if input_path is not None:
+                with open(input_path, 'rb') as stdin:
+                    result = subprocess.run(['python', tmp_file_path], stdin=stdin, capture_output=True, timeout=timeout)
+            else:
+                input_bytes = input_data.encode('utf-8') if input_data is not None else None
+                result = subprocess.run(['python', tmp_file_path], input=input_bytes, capture_output=True, timeout=timeout)
+        outcome = 'success' if result.returncode == 0 else 'error'
         stdout = result.stdout.decode('utf-8', errors='replace')
         stderr = result.stderr.decode('utf-8', errors='replace')
-        return {"stdout": stdout, "stderr": stderr, "returncode": result.returncode}
+        return {"stdout": stdout, "stderr": stderr, "returncode": result.returncode, "elapsed": round(time.perf_counter() - started, 3)}
     except subprocess.TimeoutExpired:
-        return {"stdout": "", "stderr": f"代码执行超时（超过 {CODE_EXECUTION_TIMEOUT} 秒）", "returncode": -1}
+        outcome = 'timeout'
+        return {"stdout": "", "stderr": f"代码执行超时（超过 {timeout:g} 秒）", "returncode": -1, "elapsed": round(time.perf_counter() - started, 3)}
     except Exception as e:
-        return {"stdout": "", "stderr": f"执行代码时发生未知错误: {str(e)}", "returncode": -2}
+        return {"stdout": "", "stderr": f"执行代码时发生未知错误: {str(e)}", "returncode": -2, "elapsed": round(time.perf_counter() - started, 3)}
     finally:
-        # 清理临时文件
-        if os.path.exists(tmp_file_path):
-            os.remove(tmp_file_path)
\ No newline at end of file
+        _record_run(outcome, time.perf_counter() - started)
+
+def _read_stderr(stream, buffer):
+    """在单独的线程中读取错误输出，只保留开头部分，其余丢弃(避免子进程因管道写满而阻塞)"""
+    while True:
+        chunk = stream.read(STREAM_CHUNK_BYTES)
+        if not chunk:
+            return
+        if len(buffer) < STDERR_LIMIT_BYTES:
+            buffer += chunk[:STDERR_LIMIT_BYTES - len(buffer)]
+
+def _run_and_compare(code, comparator, input_data, input_path, timeout):
+    started = time.perf_counter()
+    outcome = 'failure'
+    try:
+        with _script_file(code) as tmp_file_path, _stdin_file(input_data, input_path) as stdin:
+            metrics.EXECUTOR_SPAWNS.inc()
+            process = subprocess.Popen(['python', tmp_file_path], stdin=stdin, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            timed_out = threading.Event()
+
+            def kill_on_timeout():
+                timed_out.set()
+                process.kill()
+            timer = threading.Timer(timeout, kill_on_timeout)
+            timer.start()
+            stderr = bytearray()
+            stderr_reader = threading.Thread(target=_read_stderr, args=(process.stderr, stderr), daemon=True)
+            stderr_reader.start()
+
+            preview = bytearray()
+            truncated = stopped_early = False
+            try:
+                fd = process.stdout.fileno()
+                while True:
+                    chunk = os.read(fd, STREAM_CHUNK_BYTES)
+                    if not chunk:
+                        break
+                    if len(preview) < OUTPUT_PREVIEW_BYTES:
+                        preview += chunk[:OUTPUT_PREVIEW_BYTES - len(preview)]
+                    if len(preview) >= OUTPUT_PREVIEW_BYTES:
+                        truncated = True
+                    if not comparator.feed(chunk):
+                        # 输出已不可能与期望一致，提前结束以节省执行时间
+                        stopped_early = True
+                        process.kill()
+                        break
+                process.wait()
+            finally:
+                timer.cancel()
+                if process.poll() is None:
+                    process.kill()
+                    process.wait()
+                process.stdout.close()
+                stderr_reader.join(timeout=5)
+                process.stderr.close()
+
+        elapsed = round(time.perf_counter() - started, 3)
+        if timed_out.is_set():
+            outcome = 'timeout'
+            return {"stdout": preview.decode('utf-8', errors='replace'), "stderr": f"代码执行超时（超过 {timeout:g} 秒）",
+                    "returncode": -1, "elapsed": elapsed, "matched": False, "truncated": truncated, "stopped_early": False}
+        if stopped_early:
+            outcome = 'stopped'
+        else:
+            outcome = 'success' if process.returncode == 0 else 'error'
+        return {"stdout": preview.decode('utf-8', errors='replace'), "stderr": bytes(stderr).decode('utf-8', errors='replace'),
+                "returncode": process.returncode, "elapsed": elapsed, "matched": not stopped_early and comparator.finish(),
+                "truncated": truncated, "stopped_early": stopped_early}
+    except Exception as e:
+        return {"stdout": "", "stderr": f"执行代码时发生未知错误: {str(e)}", "returncode": -2,
+                "elapsed": round(time.perf_counter() - started, 3), "matched": False, "truncated": False, "stopped_early": False}
+    finally:
+        _record_run(outcome, time.perf_counter() - started)
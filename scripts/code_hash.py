@@ -0,0 +1,54 @@
+import hashlib
+
+def normalize_code_for_hash(code):
+    """
+    标准化代码格式用于生成哈希值，去除空白字符和注释的差异
+    """
+    if not code:
+        return ""
+    
+    # 移除单行注释
+    lines = code.split('\n')
+    normalized_lines = []
+    
+    for line in lines:
+        # 移除行尾注释（但保留字符串中的#）
+        in_string = False
+        escape_next = False
+        comment_start = -1
+        
+        for i, char in enumerate(line):
+            if escape_next:
+                escape_next = False
+                continue
+                
+            if char == '\\' and in_string:
+                escape_next = True
+                continue
+                
+            if char in ('"', "'") and not escape_next:
+                in_string = not in_string
+                continue
+                
+            if not in_string and char == '#' and comment_start == -1:
+                comment_start = i
+                break
+        
+        if comment_start >= 0:
+            line = line[:comment_start].rstrip()
+        
+        # 移除前后空白
+        line = line.strip()
+        if line:  # 只保留非空行
+            normalized_lines.append(line)
+    
+    # 重新组合并标准化空白
+    normalized_code = '\n'.join(normalized_lines)
+    return normalized_code
+
+def generate_code_hash(code):
+    """
+    生成代码的标准化哈希值
+    """
+    normalized_code = normalize_code_for_hash(code)
+    return hashlib.md5(normalized_code.encode('utf-8')).hexdigest()
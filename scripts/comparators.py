@@ -0,0 +1,139 @@
+"""
+测试用例输出比较器：按块接收学生程序的输出，与期望输出(bytes或mmap)逐段比较，
+不需要把完整输出读入内存，发现不一致时可以立即结束子进程。
+
+比较方式由测试用例的 comparator 字段指定：
+    exact         首尾空白之外逐字节一致(与原来的 output.strip() == expected.strip() 相同)
+    whitespace    按空白分隔的各项依次一致，忽略空格、换行的数量和位置
+    float[:误差]  同 whitespace，两项都是数值时允许相对或绝对误差(默认 FLOAT_COMPARE_TOLERANCE)
+
+新增比较方式：实现 feed(chunk) -> 是否仍可能一致、finish() -> 是否一致，并注册到 COMPARATORS。
+"""
+import re
+import math
+from .config import FLOAT_COMPARE_TOLERANCE
+
+_NON_SPACE = re.compile(rb'\S')
+_TOKEN = re.compile(rb'\S+')
+_TRAILING_TOKEN = re.compile(rb'\S+\Z')
+
+# 单个输出项的最大长度，超出时视为不一致(避免无空白的超长输出占用内存)
+MAX_TOKEN_BYTES = 1024 * 1024
+
+class ExactComparator:
+    """忽略首尾空白的逐字节比较"""
+    def __init__(self, expected):
+        self.expected = expected
+        match = _NON_SPACE.search(expected)
+        self.pos = match.start() if match else 0
+        end = len(expected)
+        while end > self.pos and expected[end - 1:end].isspace():
+            end -= 1
+        self.end = end
+        self.started = False
+        self.ok = True
+
+    def feed(self, chunk):
+        if not self.ok:
+            return False
+        if not self.started:
+            # 跳过输出开头的空白
+            chunk = chunk.lstrip()
+            if not chunk:
+                return True
+            self.started = True
+        n = min(len(chunk), self.end - self.pos)
+        if n and chunk[:n] != self.expected[self.pos:self.pos + n]:
+            self.ok = False
+            return False
+        self.pos += n
+        # 期望输出已比较完，多出的部分只能是空白
+        if not chunk[n:].isspace() and chunk[n:]:
+            self.ok = False
+        return self.ok
+
+    def finish(self):
+        return self.ok and self.pos == self.end
+
+class TokenComparator:
+    """按空白分隔的各项依次比较；子类通过 tokens_equal 定义单项是否一致"""
+    def __init__(self, expected):
+        self.expected_tokens = _TOKEN.finditer(expected)
+        self.carry = b''
+        self.ok = True
+
+    def tokens_equal(self, actual, expected):
+        return actual == expected
+
+    def _compare(self, token):
+        expected = next(self.expected_tokens, None)
+        if expected is None or not self.tokens_equal(token, expected.group()):
+            self.ok = False
+        return self.ok
+
+    def feed(self, chunk):
+        if not self.ok:
+            return False
+        data = self.carry + chunk
+        # 末尾的项可能在下一块中继续，留到下一次比较
+        match = _TRAILING_TOKEN.search(data)
+        cut = match.start() if match else len(data)
+        self.carry = data[cut:]
+        if len(self.carry) > MAX_TOKEN_BYTES:
+            self.ok = False
+            return False
+        for token in data[:cut].split():
+            if not self._compare(token):
+                return False
+        return True
+
+    def finish(self):
+        if self.ok and self.carry:
+            self._compare(self.carry)
+        done = self.ok and next(self.expected_tokens, None) is None
+        self.expected_tokens = None     # 释放对期望输出(mmap)的引用
+        return done
+
+class FloatComparator(TokenComparator):
+    """数值项允许误差，其余项要求一致"""
+    def __init__(self, expected, tolerance=FLOAT_COMPARE_TOLERANCE):
+        super().__init__(expected)
+        self.tolerance = tolerance
+
+    def tokens_equal(self, actual, expected):
+        if actual == expected:
+            return True
+        try:
+            return math.isclose(float(actual), float(expected), rel_tol=self.tolerance, abs_tol=self.tolerance)
+        except ValueError:
+            return False
+
+COMPARATORS = {
+    'exact': ExactComparator,
+    'whitespace': TokenComparator,
+    'float': FloatComparator,
+}
+
+DEFAULT_COMPARATOR = 'exact'
+
+def parse_comparator(spec):
+    """解析比较方式，如 'float:1e-4'，返回(名称, 参数列表)；不支持时抛出ValueError"""
+    name, _, argument = (spec or DEFAULT_COMPARATOR).partition(':')
+    if name not in COMPARATORS:
+        raise ValueError(f"不支持的比较方式: {spec}")
+    if not argument:
+        return name, []
+    if name != 'float':
+        raise ValueError(f"比较方式 {name} 不接受参数: {spec}")
+    try:
+        tolerance = float(argument)
+    except ValueError:
+        raise ValueError(f"误差必须是数值: {spec}")
+    if not tolerance >= 0:
+        raise ValueError(f"误差不能为负数: {spec}")
+    return name, [tolerance]
+
+def make_comparator(spec, expected):
+    """创建比较器，expected为期望输出的bytes或mmap"""
+    name, args = parse_comparator(spec)
+    return COMPARATORS[name](expected, *args)
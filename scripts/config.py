@@ -5,22 +5,113 @@ PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 # API配置
 API_KEY = "your_key"
-BASE_URL = "https://api.deepseek.com/v1"
+# 可通过环境变量LLM_BASE_URL指向本地桩服务(scripts/stub_llm.py)
+BASE_URL = os.environ.get('LLM_BASE_URL', "https://api.deepseek.com/v1")
 MODEL_NAME = "deepseek-chat"
 
 # 超时设置(秒)
 CODE_EXECUTION_TIMEOUT = 10
 PDF_GENERATION_TIMEOUT = 300
+PDF_BOOKLET_TIMEOUT = 900     # 合订本包含全班报告，允许更长的生成时间
+LLM_REQUEST_TIMEOUT = 300
 
-# 路径配置
-DATABASE_DIR = os.path.join(PROJECT_ROOT, 'database')
+# 按参考解答运行时间确定每个测试用例的时限：REFERENCE_TIMEOUT_FLOOR + REFERENCE_TIMEOUT_FACTOR × 参考用时，
+# 不超过REFERENCE_TIMEOUT_MAX；没有参考解答(或参考解答未通过该用例)时使用CODE_EXECUTION_TIMEOUT
+REFERENCE_TIMEOUT_FACTOR = 3
+REFERENCE_TIMEOUT_FLOOR = 1.0
+REFERENCE_TIMEOUT_MAX = 60
+
+# 测试用例输出比较方式为float时的默认误差(相对或绝对)
+FLOAT_COMPARE_TOLERANCE = 1e-6
+
+# 代码执行准入控制(每个工作进程独立计算，服务总并发 = 工作进程数 × EXECUTOR_MAX_CONCURRENT)
+EXECUTOR_MAX_CONCURRENT = max(2, os.cpu_count() or 2)   # 同时运行的学生代码子进程数
+EXECUTOR_QUEUE_LIMIT = 50         # 等待执行的请求数上限，超出时直接返回429
+EXECUTOR_QUEUE_PER_STUDENT = 2    # 每个学生同时排队的请求数上限
+EXECUTOR_QUEUE_TIMEOUT = 30       # 排队超过该时间(秒)仍未轮到时返回429
+
+# PDF渲染进程数量(每个进程启动时预加载字体)
+PDF_RENDER_WORKERS = 2
+# 服务工作进程启动时即启动渲染进程，首次导出无需等待进程启动和字体解析(PDF_PREWARM=0时改为首次导出时启动)
+PDF_PREWARM = os.environ.get('PDF_PREWARM', '1') != '0'
+# 批量导出PDF时同时提交渲染的报告数量
+PDF_EXPORT_WORKERS = 4
+
+# AI服务熔断与重试设置
+LLM_MAX_RETRIES = 3
+LLM_BACKOFF_BASE = 1            # 退避基数(秒)，实际等待时间带随机抖动
+LLM_BACKOFF_MAX = 8             # 单次退避的最长等待(秒)
+LLM_RETRY_BUDGET_RATIO = 0.2    # 时间窗口内重试次数最多占请求数的比例
+LLM_RETRY_BUDGET_MIN = 3        # 时间窗口内至少允许的重试次数
+LLM_RETRY_BUDGET_WINDOW = 10    # 重试预算统计窗口(秒)
+LLM_CIRCUIT_FAILURE_THRESHOLD = 5   # 连续失败多少次后熔断
+LLM_CIRCUIT_RESET_TIMEOUT = 30      # 熔断后多久放行一次探测请求(秒)
+
+# 提示词token预算(按角色)，超出预算的代码和运行输出会被截断或摘要
+PROMPT_TOKEN_BUDGETS = {
+    'teacher': 8000,
+    'student': 6000
+}
+
+# 提交后后台预生成教师端AI评估
+REVIEW_PRECOMPUTE_ENABLED = False
+REVIEW_PRECOMPUTE_WORKERS = 1           # 同时生成评估的最大数量
+REVIEW_PRECOMPUTE_BUSY_THRESHOLD = 30   # 统计窗口内学生请求数达到该值时暂停预生成
+REVIEW_PRECOMPUTE_BUSY_WINDOW = 60      # 学生请求统计窗口(秒)
+
+# 近似重复提交检测
+SIMILARITY_REUSE_THRESHOLD = 0.9    # 相似度不低于该值时向教师提供已有提交的AI评估
+SIMILARITY_REPORT_THRESHOLD = 0.8   # 相似度报告的默认阈值
+
+# 生产环境服务配置(serve.py)
+SERVER_HOST = '0.0.0.0'
+SERVER_PORT = 5000
+SERVER_WORKERS = 2              # 工作进程数(仅gunicorn支持多进程)
+SERVER_THREADS = 8              # 每个工作进程的线程数
+SERVER_GRACEFUL_TIMEOUT = 60    # 关闭时等待进行中的评测和后台任务完成的时间(秒)
+
+# JSON接口响应的gzip压缩(小于该字节数的响应不压缩)
+JSON_GZIP_MIN_BYTES = 1024
+JSON_GZIP_LEVEL = 6
+
+# SQLite等待写锁的时间(秒)，多进程同时写入时避免立即报"database is locked"
+SQLITE_BUSY_TIMEOUT = 30
+
+# 路径配置(可通过环境变量DATABASE_DIR指定数据库目录)
+DATABASE_DIR = os.environ.get('DATABASE_DIR', os.path.join(PROJECT_ROOT, 'database'))
 TEACHER_DB_PATH = os.path.join(DATABASE_DIR, 'teacher.db')
 STUDENT_DB_PATH = os.path.join(DATABASE_DIR, 'student.db')
 FONTS_DIR = os.path.join(PROJECT_ROOT, 'fonts')
 TEMPLATES_DIR = os.path.join(PROJECT_ROOT, 'templates')
 STATIC_DIR = os.path.join(PROJECT_ROOT, 'static')
+STATIC_BUILD_DIR = os.path.join(STATIC_DIR, 'build')     # python -m scripts.build_static 的输出目录
 TESTFILES_DIR = os.path.join(PROJECT_ROOT, 'testfiles')
 
+# PDF报告磁盘缓存(可通过环境变量PDF_CACHE_DIR指定目录)
+PDF_CACHE_DIR = os.environ.get('PDF_CACHE_DIR', os.path.join(DATABASE_DIR, 'pdf_cache'))
+PDF_CACHE_MAX_BYTES = 512 * 1024 * 1024    # 缓存总大小上限，超出后淘汰最久未使用的报告
+PDF_TEMPLATE_VERSION = 1                   # 修改报告版式后递增，使旧缓存失效
+
+# 大型测试数据文件：超过FIXTURE_INLINE_LIMIT字节的输入/期望输出按内容哈希保存到FIXTURES_DIR，
+# 数据库中只保存前FIXTURE_PREVIEW_CHARS个字符用于显示
+FIXTURES_DIR = os.environ.get('FIXTURES_DIR', os.path.join(DATABASE_DIR, 'fixtures'))
+FIXTURE_INLINE_LIMIT = 64 * 1024
+FIXTURE_PREVIEW_CHARS = 2000
+FIXTURE_MAX_BYTES = 512 * 1024 * 1024      # 单个上传文件的大小上限
+
+# 运行指标(/metrics)：各工作进程定期把指标快照写入该目录，由/metrics汇总
+METRICS_DIR = os.environ.get('METRICS_DIR', os.path.join(DATABASE_DIR, 'metrics'))
+METRICS_FLUSH_INTERVAL = 5                 # 快照写入间隔(秒)
+
+# 单个请求的性能剖析(cProfile + tracemalloc)，结果保存到PROFILES_DIR
+# PROFILE_ALL_REQUESTS=1 时剖析所有请求；设置PROFILE_ADMIN_TOKEN后，
+# 请求头 X-Profile-Token 与之相同的请求也会被剖析
+PROFILE_ALL_REQUESTS = os.environ.get('PROFILE_ALL_REQUESTS') == '1'
+PROFILE_ADMIN_TOKEN = os.environ.get('PROFILE_ADMIN_TOKEN', '')
+PROFILES_DIR = os.environ.get('PROFILES_DIR', os.path.join(DATABASE_DIR, 'profiles'))
+PROFILE_MAX_FILES = 200                    # 最多保留的剖析结果数，超出后删除最旧的
+SLOW_REQUEST_THRESHOLD = 5.0               # 耗时超过该值(秒)的请求输出分项耗时日志
+
 # 字体文件路径
 FONT_PATHS = {
     'regular': os.path.join(FONTS_DIR, 'NotoSans-Regular-2.ttf'),
@@ -0,0 +1,38 @@
+"""
+学生首页概览：一名学生在每道题目上的最新提交状态、通过数和AI辅导记录摘要。
+
+学生的全部进度来自学生库中的一次聚合查询，只读取带索引的列(不读取代码、评测详情和评估内容)，
+再与教师库的题目列表合并；学生打开某道题目时再加载该题的完整提交。
+"""
+
+# 每道题取该学生最新一次提交(旧提交在重新提交时已删除)，以及AI辅导记录的数量和最近时间
+STUDENT_PROGRESS_QUERY = '''
+    SELECT s.problem_id, s.id AS submission_id, s.passed_tests, s.total_tests, s.submitted_at, s.grade_revision,
+           COALESCE(r.review_count, 0) AS review_count, r.reviewed_at
+      FROM (SELECT problem_id, MAX(id) AS id FROM Submission WHERE student_id = :student_id GROUP BY problem_id) latest
+      JOIN Submission s ON s.id = latest.id
+      LEFT JOIN (SELECT problem_id, COUNT(*) AS review_count, MAX(created_at) AS reviewed_at
+                   FROM StudentAIReview WHERE student_id = :student_id GROUP BY problem_id) r
+             ON r.problem_id = s.problem_id
+'''
+
+# 未提交的题目在概览中的各项
+EMPTY_PROGRESS = {
+    "submission_id": None, "passed_tests": None, "total_tests": None, "submitted_at": None,
+    "grade_revision": None, "review_count": 0, "reviewed_at": None
+}
+
+def load_student_dashboard(db_student, db_teacher, student_id):
+    """返回 {"student_id", "solved", "submitted", "problems": [每道题目的概览]}，未提交的题目各项为空"""
+    progress = {row['problem_id']: dict(row) for row in db_student.execute(STUDENT_PROGRESS_QUERY, {"student_id": student_id})}
+    problems = []
+    for problem in db_teacher.execute('SELECT id, title FROM Problem ORDER BY id'):
+        entry = progress.get(problem['id'], EMPTY_PROGRESS)
+        problems.append({**entry, "problem_id": problem['id'], "title": problem['title']})
+    submitted = [p for p in problems if p['submission_id'] is not None]
+    return {
+        "student_id": student_id,
+        "solved": sum(1 for p in submitted if p['total_tests'] and p['passed_tests'] == p['total_tests']),
+        "submitted": len(submitted),
+        "problems": problems
+    }
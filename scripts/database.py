@@ -1,11 +1,61 @@
 import sqlite3
 import os
+import time
 from flask import g
+from . import metrics
+from .config import DATABASE_DIR, TEACHER_DB_PATH, STUDENT_DB_PATH, SQLITE_BUSY_TIMEOUT
+from .similarity import backfill_fingerprints
 
-# 数据库文件路径配置
-DATABASE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'database')
-TEACHER_DB_PATH = os.path.join(DATABASE_DIR, 'teacher.db')
-STUDENT_DB_PATH = os.path.join(DATABASE_DIR, 'student.db')
+class MeteredCursor(sqlite3.Cursor):
+    """记录每条语句的执行耗时，按当前请求的路由汇总到运行指标"""
+    def _timed(self, method, *args):
+        started = time.perf_counter()
+        try:
+            return method(self, *args)
+        finally:
+            elapsed = time.perf_counter() - started
+            route = metrics.current_route()
+            metrics.SQLITE_QUERIES.inc(route=route)
+            metrics.SQLITE_LATENCY.observe(elapsed, route=route)
+            metrics.add_request_time('sqlite', elapsed)
+
+    def execute(self, *args):
+        return self._timed(sqlite3.Cursor.execute, *args)
+
+    def executemany(self, *args):
+        return self._timed(sqlite3.Cursor.executemany, *args)
+
+    def executescript(self, *args):
+        return self._timed(sqlite3.Cursor.executescript, *args)
+
+class MeteredConnection(sqlite3.Connection):
+    """cursor()及connection.execute()等快捷方法都使用带计时的游标"""
+    def cursor(self, factory=MeteredCursor):
+        return super().cursor(factory)
+
+    def execute(self, *args):
+        return self.cursor().execute(*args)
+
+    def executemany(self, *args):
+        return self.cursor().executemany(*args)
+
+    def executescript(self, *args):
+        return self.cursor().executescript(*args)
+
+def connect_db(db_type='student'):
+    """
+    创建独立的数据库连接，用于请求上下文之外(如后台任务)。
+    调用方负责关闭连接。
+    """
+    db_path = TEACHER_DB_PATH if db_type == 'teacher' else STUDENT_DB_PATH
+    db = sqlite3.connect(db_path, timeout=SQLITE_BUSY_TIMEOUT, factory=MeteredConnection)
+    db.row_factory = sqlite3.Row
+    return db
+
+def attach_teacher_db(db):
+    """在学生库连接上附加教师库(别名teacher)，以便跨库联合查询"""
+    db.execute('ATTACH DATABASE ? AS teacher', (TEACHER_DB_PATH,))
+    return db
 
 def get_db(db_type='student'):
     """
@@ -13,13 +63,11 @@ def get_db(db_type='student'):
     'teacher'库用于存储题目等共享信息。
     'student'库用于存储提交、评审等学生相关信息。
     """
-    db_path = TEACHER_DB_PATH if db_type == 'teacher' else STUDENT_DB_PATH
     attr_name = f'_database_{db_type}'
     
     db = getattr(g, attr_name, None)
     if db is None:
-        db = sqlite3.connect(db_path)
-        db.row_factory = sqlite3.Row
+        db = connect_db(db_type)
         setattr(g, attr_name, db)
     return db
 
@@ -37,14 +85,30 @@ def close_connection(exception):
         if db is not None:
             db.close()
 
-def init_db(app):
-    """初始化两个数据库的表结构"""
+def _ensure_column(cursor, table, column, definition):
+    """旧数据库缺少某列时补充该列，返回是否新增"""
+    columns = [row[1] for row in cursor.execute(f'PRAGMA table_info({table})').fetchall()]
+    if column in columns:
+        return False
+    cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+    return True
+
+def init_db():
+    """
+    初始化两个数据库的表结构。
+    在服务启动前(主进程中)执行一次，不依赖Flask应用上下文。
+    """
     if not os.path.exists(DATABASE_DIR):
         os.makedirs(DATABASE_DIR)
 
-    with app.app_context():
+    db_teacher = connect_db('teacher')
+    db_student = connect_db('student')
+    try:
+        # WAL模式允许多个工作进程同时读取，写入时不阻塞读取(该设置会保存在数据库文件中)
+        for db in (db_teacher, db_student):
+            db.execute('PRAGMA journal_mode=WAL')
+
         # 初始化教师数据库
-        db_teacher = get_db('teacher')
         cursor_teacher = db_teacher.cursor()
         
         cursor_teacher.execute('''
@@ -52,9 +116,18 @@ def init_db(app):
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 title TEXT NOT NULL,
                 description_md TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                reference_code TEXT,
+                revision INTEGER NOT NULL DEFAULT 1,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         ''')
+        # 题目版本号和修改时间，用于生成ETag/Last-Modified
+        _ensure_column(cursor_teacher, 'Problem', 'revision', 'INTEGER NOT NULL DEFAULT 1')
+        if _ensure_column(cursor_teacher, 'Problem', 'updated_at', 'TIMESTAMP'):
+            cursor_teacher.execute('UPDATE Problem SET updated_at = created_at')
+        # 参考解答，用于生成/校验期望输出和确定各测试用例的时限
+        _ensure_column(cursor_teacher, 'Problem', 'reference_code', 'TEXT')
         
         cursor_teacher.execute('''
             CREATE TABLE IF NOT EXISTS TestCase (
@@ -62,9 +135,19 @@ def init_db(app):
                 problem_id INTEGER,
                 input_data TEXT,
                 expected_output TEXT,
+                reference_time REAL,
+                input_ref TEXT,
+                expected_ref TEXT,
+                comparator TEXT NOT NULL DEFAULT 'exact',
                 FOREIGN KEY (problem_id) REFERENCES Problem(id) ON DELETE CASCADE
             )
         ''')
+        # 参考解答在该用例上的运行时间(秒)，为空时使用默认时限
+        _ensure_column(cursor_teacher, 'TestCase', 'reference_time', 'REAL')
+        # 大型输入/期望输出的数据文件标识(见fixtures.py)和输出比较方式(见comparators.py)
+        _ensure_column(cursor_teacher, 'TestCase', 'input_ref', 'TEXT')
+        _ensure_column(cursor_teacher, 'TestCase', 'expected_ref', 'TEXT')
+        _ensure_column(cursor_teacher, 'TestCase', 'comparator', "TEXT NOT NULL DEFAULT 'exact'")
         
         # 在教师数据库中添加AI评审表，用于存储教师端的AI评估结果
         cursor_teacher.execute('''
@@ -78,11 +161,13 @@ def init_db(app):
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         ''')
+        cursor_teacher.execute('CREATE INDEX IF NOT EXISTS idx_teacher_review_submission ON TeacherAIReview(submission_id)')
+        # 按学生和题目查找评估(早期没有submission_id的记录、PDF导出按代码哈希查找)
+        cursor_teacher.execute('CREATE INDEX IF NOT EXISTS idx_teacher_review_student_problem ON TeacherAIReview(problem_id, student_id, created_at)')
         
         db_teacher.commit()
 
         # 初始化学生数据库
-        db_student = get_db('student')
         cursor_student = db_student.cursor()
 
         cursor_student.execute('''
@@ -94,9 +179,14 @@ def init_db(app):
                 passed_tests INTEGER,
                 total_tests INTEGER,
                 test_details_json TEXT,
+                grade_revision INTEGER NOT NULL DEFAULT 0,
                 submitted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         ''')
+        # 测试用例修改后重新评测的次数，用于生成提交详情的ETag
+        _ensure_column(cursor_student, 'Submission', 'grade_revision', 'INTEGER NOT NULL DEFAULT 0')
+        # 按学生和题目查找最新提交(学生首页概览、恢复上次提交、重新提交时删除旧记录)
+        cursor_student.execute('CREATE INDEX IF NOT EXISTS idx_submission_student_problem ON Submission(student_id, problem_id)')
 
         cursor_student.execute('''
             CREATE TABLE IF NOT EXISTS StudentAIChat (
@@ -123,5 +213,26 @@ def init_db(app):
                 FOREIGN KEY (submission_id) REFERENCES Submission(id) ON DELETE SET NULL
             )
         ''')
+        cursor_student.execute('CREATE INDEX IF NOT EXISTS idx_student_review_student_problem ON StudentAIReview(student_id, problem_id, created_at)')
+        cursor_student.execute('CREATE INDEX IF NOT EXISTS idx_student_review_submission ON StudentAIReview(submission_id)')
+        
+        # 提交代码的相似度指纹(MinHash签名)，用于查找近似重复的提交
+        cursor_student.execute('''
+            CREATE TABLE IF NOT EXISTS SubmissionFingerprint (
+                submission_id INTEGER PRIMARY KEY,
+                problem_id INTEGER NOT NULL,
+                student_id TEXT NOT NULL,
+                code_hash TEXT,
+                signature TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor_student.execute('CREATE INDEX IF NOT EXISTS idx_fingerprint_problem ON SubmissionFingerprint(problem_id)')
         
         db_student.commit()
+
+        # 为建立相似度索引之前的旧提交补充指纹；之后的提交在保存时建立索引，删除时一并清理
+        backfill_fingerprints(db_student)
+    finally:
+        db_teacher.close()
+        db_student.close()
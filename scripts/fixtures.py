@@ -0,0 +1,163 @@
+"""
+大型测试数据文件：按SHA-256内容哈希保存在 FIXTURES_DIR/<前两位>/<哈希> 下，相同内容只保存一份。
+
+测试用例的 input_ref / expected_ref 指向数据文件时，input_data / expected_output 只保存开头部分用于显示；
+评测时输入文件直接作为子进程的标准输入，期望输出通过mmap按块比较，不读入内存。
+"""
+import io
+import os
+import re
+import mmap
+import time
+import hashlib
+import tempfile
+from contextlib import contextmanager
+from .config import FIXTURES_DIR, FIXTURE_INLINE_LIMIT, FIXTURE_PREVIEW_CHARS, FIXTURE_MAX_BYTES
+from .comparators import parse_comparator, DEFAULT_COMPARATOR
+from .database import connect_db
+
+CHUNK_BYTES = 1024 * 1024
+_DIGEST_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+# 未被引用的数据文件保留的时间(秒)，避免清理掉刚上传、尚未保存到题目的文件
+PRUNE_MIN_AGE = 24 * 3600
+
+class FixtureTooLarge(Exception):
+    """上传的数据文件超过 FIXTURE_MAX_BYTES"""
+
+def fixture_path(digest):
+    if not digest or not _DIGEST_PATTERN.match(digest):
+        raise ValueError(f"无效的测试数据文件标识: {digest}")
+    return os.path.join(FIXTURES_DIR, digest[:2], digest)
+
+def fixture_exists(digest):
+    try:
+        return os.path.isfile(fixture_path(digest))
+    except ValueError:
+        return False
+
+def store_stream(stream, max_bytes=FIXTURE_MAX_BYTES):
+    """边读边计算哈希写入临时文件，完成后改名为哈希路径，返回(哈希, 字节数)"""
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=FIXTURES_DIR, prefix='.upload-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            while True:
+                chunk = stream.read(CHUNK_BYTES)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise FixtureTooLarge(f"测试数据文件超过 {max_bytes // 1024 // 1024} MB")
+                digest.update(chunk)
+                f.write(chunk)
+        hexdigest = digest.hexdigest()
+        path = fixture_path(hexdigest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+        return hexdigest, size
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def store_bytes(data):
+    """保存一段内容，返回哈希(内容已存在时不重复写入)"""
+    hexdigest = hashlib.sha256(data).hexdigest()
+    if not fixture_exists(hexdigest):
+        store_stream(io.BytesIO(data), max_bytes=len(data))
+    return hexdigest
+
+def preview(digest):
+    """数据文件开头部分的文本，用于在题目编辑和评测结果中显示"""
+    path = fixture_path(digest)
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        raw = f.read(FIXTURE_PREVIEW_CHARS * 4)
+    text = raw.decode('utf-8', errors='replace')
+    if len(raw) == size and len(text) <= FIXTURE_PREVIEW_CHARS:
+        return text
+    return f"{text[:FIXTURE_PREVIEW_CHARS]}\n…(测试数据文件，共 {size} 字节)"
+
+def prepare_test_case(tc):
+    """
+    整理提交的测试用例：校验比较方式和数据文件标识；超过 FIXTURE_INLINE_LIMIT 的输入或期望输出转存为数据文件。
+    带有数据文件标识的字段以文件内容为准，文本只作显示用。不合法时抛出ValueError。
+    """
+    case = dict(tc)
+    comparator = case.get('comparator') or DEFAULT_COMPARATOR
+    parse_comparator(comparator)
+    case['comparator'] = comparator
+    for text_key, ref_key in (('input_data', 'input_ref'), ('expected_output', 'expected_ref')):
+        ref = case.get(ref_key) or None
+        text = case.get(text_key) or ''
+        if ref:
+            if not fixture_exists(ref):
+                raise ValueError(f"测试数据文件不存在: {ref}")
+            text = preview(ref)
+        elif len(text) > FIXTURE_INLINE_LIMIT or len(text.encode('utf-8')) > FIXTURE_INLINE_LIMIT:
+            ref = store_bytes(text.encode('utf-8'))
+            text = preview(ref)
+        case[ref_key] = ref
+        case[text_key] = text
+    return case
+
+def input_source(tc):
+    """传给执行函数的输入参数：数据文件作为标准输入，否则为文本"""
+    if tc['input_ref']:
+        return {"input_path": fixture_path(tc['input_ref'])}
+    return {"input_data": tc['input_data']}
+
+@contextmanager
+def open_expected(tc):
+    """期望输出的只读视图：数据文件使用mmap，文本编码为bytes"""
+    if not tc['expected_ref']:
+        yield (tc['expected_output'] or '').encode('utf-8')
+        return
+    with open(fixture_path(tc['expected_ref']), 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b''
+            return
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            yield mapped
+        finally:
+            try:
+                mapped.close()
+            except BufferError:
+                # 仍有对象引用该mmap时留给垃圾回收关闭
+                pass
+
+def prune_unreferenced(db_teacher, min_age=PRUNE_MIN_AGE):
+    """删除没有被任何测试用例引用、且创建超过min_age秒的数据文件，返回删除的文件数"""
+    if not os.path.isdir(FIXTURES_DIR):
+        return 0
+    referenced = set()
+    for row in db_teacher.execute('SELECT input_ref, expected_ref FROM TestCase WHERE input_ref IS NOT NULL OR expected_ref IS NOT NULL'):
+        referenced.update(ref for ref in row if ref)
+    removed = 0
+    now = time.time()
+    for root, _, names in os.walk(FIXTURES_DIR):
+        for name in names:
+            path = os.path.join(root, name)
+            if name in referenced:
+                continue
+            try:
+                if now - os.path.getmtime(path) >= min_age:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                pass
+    return removed
+
+def prune_fixtures():
+    """启动时清理未被引用的数据文件"""
+    db = connect_db('teacher')
+    try:
+        removed = prune_unreferenced(db)
+    finally:
+        db.close()
+    if removed:
+        print(f"已清理 {removed} 个未被引用的测试数据文件")
+    return removed
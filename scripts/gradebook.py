@@ -0,0 +1,138 @@
+"""
+成绩册导出：学生 × 题目的成绩矩阵(测试通过数和AI评分)。
+
+所有成绩来自一次跨库联合查询(学生库附加教师库)，按学生排序逐行读取，
+每读完一名学生就输出一行，因此内存占用与学生人数无关。
+"""
+import io
+import os
+import csv
+import tempfile
+from .database import connect_db, attach_teacher_db
+
+# 每名学生每道题取最新一次提交，并取该提交最新的教师端AI评估分数；
+# 早期的评估记录可能没有submission_id，按学生和题目匹配提交之后生成的评估。
+# 两种匹配分别走索引(submission_id / problem_id, student_id, created_at)只取评估ID，
+# 最后每行只解析选中的一条评估内容
+GRADEBOOK_QUERY = '''
+    WITH latest AS (
+        SELECT MAX(id) AS id FROM Submission GROUP BY student_id, problem_id
+    ),
+    matched AS (
+        SELECT s.student_id, s.problem_id, s.passed_tests, s.total_tests,
+               COALESCE(
+                   (SELECT r.id FROM teacher.TeacherAIReview r
+                     WHERE r.submission_id = s.id
+                     ORDER BY r.created_at DESC LIMIT 1),
+                   (SELECT r.id FROM teacher.TeacherAIReview r
+                     WHERE r.problem_id = s.problem_id AND r.student_id = s.student_id
+                       AND r.created_at >= s.submitted_at AND r.submission_id IS NULL
+                     ORDER BY r.created_at DESC LIMIT 1)
+               ) AS review_id
+          FROM latest
+          JOIN Submission s ON s.id = latest.id
+          JOIN teacher.Problem p ON p.id = s.problem_id
+    )
+    SELECT m.student_id, m.problem_id, m.passed_tests, m.total_tests,
+           CASE WHEN json_valid(r.review_data) THEN json_extract(r.review_data, '$.total_score') END AS ai_score
+      FROM matched m
+      LEFT JOIN teacher.TeacherAIReview r ON r.id = m.review_id
+     ORDER BY m.student_id, m.problem_id
+'''
+
+def load_problem_columns(db):
+    """读取成绩册的题目列(按题目ID排序)"""
+    return db.execute('SELECT id, title FROM teacher.Problem ORDER BY id').fetchall()
+
+def header_row(problems):
+    row = ['学号']
+    for problem in problems:
+        row.append(f"{problem['title']} 通过")
+        row.append(f"{problem['title']} AI评分")
+    row.extend(['通过题数', 'AI评分合计'])
+    return row
+
+def _student_row(student_id, scores, problems):
+    """把一名学生的各题成绩展开为一行"""
+    row = [student_id]
+    solved = 0
+    total_score = 0
+    for problem in problems:
+        score = scores.get(problem['id'])
+        if score is None:
+            row.extend(['', ''])
+            continue
+        passed, total, ai_score = score
+        row.append(f"{passed or 0}/{total or 0}")
+        row.append('' if ai_score is None else ai_score)
+        if total and passed == total:
+            solved += 1
+        if isinstance(ai_score, (int, float)):
+            total_score += ai_score
+    row.extend([solved, total_score])
+    return row
+
+def iter_gradebook_rows():
+    """逐行产出成绩册：第一行为表头，之后每名学生一行"""
+    db = attach_teacher_db(connect_db('student'))
+    try:
+        problems = load_problem_columns(db)
+        yield header_row(problems)
+
+        current_student = None
+        scores = {}
+        for record in db.execute(GRADEBOOK_QUERY):
+            if record['student_id'] != current_student:
+                if current_student is not None:
+                    yield _student_row(current_student, scores, problems)
+                current_student = record['student_id']
+                scores = {}
+            scores[record['problem_id']] = (record['passed_tests'], record['total_tests'], record['ai_score'])
+        if current_student is not None:
+            yield _student_row(current_student, scores, problems)
+    finally:
+        db.close()
+
+def stream_gradebook_csv():
+    """以CSV格式逐行产出成绩册(带BOM，Excel可直接打开中文)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    yield '\ufeff'.encode('utf-8')
+    for row in iter_gradebook_rows():
+        writer.writerow(row)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+
+def xlsx_available():
+    """XLSX导出依赖可选的openpyxl"""
+    try:
+        import openpyxl  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def stream_gradebook_xlsx(chunk_size=64 * 1024):
+    """
+    以XLSX格式产出成绩册。openpyxl的只写模式逐行写入临时文件，
+    完成后分块读取发送并删除临时文件。
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('成绩册')
+    for row in iter_gradebook_rows():
+        sheet.append(row)
+
+    fd, path = tempfile.mkstemp(prefix='gradebook_', suffix='.xlsx')
+    os.close(fd)
+    try:
+        workbook.save(path)
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        os.unlink(path)
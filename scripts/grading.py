@@ -0,0 +1,225 @@
+"""
+评测与保存提交：按题目的测试用例执行代码并统计通过数，把评测结果写入Submission。
+
+/api/test、/api/submit 和离线批量评测(python -m scripts.batch_grade)共用这里的逻辑，
+保证同一份代码在网页和命令行中得到相同的结果。调用方负责执行名额(execution_gate)和事务提交。
+测试用例的输出按用例的比较方式(comparators.py)流式比较，大型输入和期望输出使用数据文件(fixtures.py)。
+"""
+import json
+from .code_executor import execute_code_safely, execute_and_compare
+from .comparators import make_comparator, DEFAULT_COMPARATOR
+from .fixtures import prepare_test_case, input_source, open_expected
+from .similarity import index_submission
+from .config import CODE_EXECUTION_TIMEOUT, REFERENCE_TIMEOUT_FACTOR, REFERENCE_TIMEOUT_FLOOR, REFERENCE_TIMEOUT_MAX
+
+# 决定评测结果的测试用例字段：这些字段和时限都未变化时，保存的结果可以沿用
+CONTENT_FIELDS = ('input_data', 'expected_output', 'input_ref', 'expected_ref', 'comparator')
+
+def load_test_cases(db_teacher, problem_id):
+    """读取题目的测试用例(按ID排序，即添加顺序)"""
+    return db_teacher.execute('SELECT * FROM TestCase WHERE problem_id = ? ORDER BY id', (problem_id,)).fetchall()
+
+def case_timeout(tc):
+    """测试用例的时限(秒)：有参考解答用时时按比例放宽并加上下限，否则使用默认时限"""
+    reference_time = tc['reference_time']
+    if reference_time is None:
+        return CODE_EXECUTION_TIMEOUT
+    return round(min(REFERENCE_TIMEOUT_MAX, REFERENCE_TIMEOUT_FLOOR + REFERENCE_TIMEOUT_FACTOR * reference_time), 2)
+
+def run_case(code, tc, index):
+    """执行一个测试用例，返回该用例的评测结果"""
+    time_limit = case_timeout(tc)
+    with open_expected(tc) as expected:
+        result = execute_and_compare(code, make_comparator(tc['comparator'], expected), timeout=time_limit, **input_source(tc))
+    is_correct = result['matched'] and result['returncode'] == 0 and not result['stderr']
+    detail = {"case": index, "case_id": tc['id'], "status": 'passed' if is_correct else 'failed', "input": tc['input_data'], "expected_output": tc['expected_output'].strip(), "actual_output": result['stdout'].strip(), "stderr": result['stderr'], "elapsed": result['elapsed'], "time_limit": time_limit}
+    # 只记录非默认值，旧的评测结果与之兼容
+    for key in ('input_ref', 'expected_ref'):
+        if tc[key]:
+            detail[key] = tc[key]
+    if tc['comparator'] != DEFAULT_COMPARATOR:
+        detail['comparator'] = tc['comparator']
+    if result['stopped_early']:
+        detail['note'] = "输出与期望输出不一致，已提前结束运行"
+    elif result['truncated']:
+        detail['note'] = "输出较长，只显示开头部分"
+    return detail
+
+def run_without_cases(code):
+    """没有测试用例时只检查代码能否正常运行(返回码为0且没有stderr输出)"""
+    result = execute_code_safely(code)
+    is_passed = result['returncode'] == 0 and not result['stderr']
+    return {"case": 1, "status": "passed" if is_passed else "failed", "input": "无", "expected_output": "无错误执行", "actual_output": result.get('stdout', ''), "stderr": result.get('stderr', '')}
+
+def summarize(details):
+    return {"passed": sum(1 for d in details if d['status'] == 'passed'), "total": len(details), "details": details}
+
+def grade_code(code, test_cases):
+    """依次执行所有测试用例，返回 {"passed", "total", "details"}"""
+    if not test_cases:
+        return summarize([run_without_cases(code)])
+    return summarize([run_case(code, tc, i) for i, tc in enumerate(test_cases, start=1)])
+
+def _case_matches(detail, tc):
+    return (detail.get('input') == tc['input_data'] and detail.get('expected_output') == tc['expected_output'].strip()
+            and detail.get('input_ref') == tc['input_ref'] and detail.get('expected_ref') == tc['expected_ref']
+            and detail.get('comparator', DEFAULT_COMPARATOR) == tc['comparator']
+            and detail.get('time_limit', CODE_EXECUTION_TIMEOUT) == case_timeout(tc))
+
+def regrade_details(code, details, test_cases):
+    """
+    测试用例修改后重新评测一个提交：ID相同且内容、比较方式和时限未变化的用例沿用保存的结果，
+    新增和修改过的用例重新执行，已删除用例的结果被丢弃。
+    旧版本保存的结果没有case_id，按输入和期望输出匹配。返回(新结果, 重新执行的用例数)。
+    """
+    if not test_cases:
+        if len(details) == 1 and 'case_id' not in details[0]:
+            return summarize(details), 0
+        return summarize([run_without_cases(code)]), 1
+    by_id = {d['case_id']: d for d in details if 'case_id' in d}
+    legacy = [d for d in details if 'case_id' not in d and d.get('input') != '无']
+    new_details = []
+    rerun = 0
+    for i, tc in enumerate(test_cases, start=1):
+        detail = by_id.get(tc['id'])
+        if detail is None or not _case_matches(detail, tc):
+            detail = next((d for d in legacy if _case_matches(d, tc)), None)
+        if detail is None:
+            new_details.append(run_case(code, tc, i))
+            rerun += 1
+        else:
+            new_details.append({**detail, "case": i, "case_id": tc['id']})
+    return summarize(new_details), rerun
+
+def content_key(tc):
+    return tuple(tc[field] for field in CONTENT_FIELDS)
+
+def prepare_test_cases(test_cases):
+    """整理提交的测试用例(见fixtures.prepare_test_case)，不合法时抛出ValueError"""
+    return [prepare_test_case(tc) for tc in test_cases]
+
+def run_reference(reference_code, test_cases, known_times):
+    """
+    用参考解答运行各测试用例(已由prepare_test_cases整理，调用方负责执行名额)：
+    期望输出为空的用例填入参考解答的输出，不为空的用例按比较方式校验是否一致，并记录参考解答正常运行时的用时。
+    known_times 为 {content_key: 参考用时}(参考解答未修改时由调用方提供)，命中的用例不再运行。
+    返回(带reference_time的测试用例列表, 报告)。
+    """
+    prepared = []
+    report = {"filled": [], "mismatched": [], "failed": [], "reused": 0}
+    for i, tc in enumerate(test_cases, start=1):
+        case = {**tc, "reference_time": None}
+        has_expected = bool(case['expected_ref'] or case['expected_output'].strip())
+        if has_expected and content_key(case) in known_times:
+            case['reference_time'] = known_times[content_key(case)]
+            report['reused'] += 1
+            prepared.append(case)
+            continue
+
+        # 参考解答允许运行到时限上限，较慢的题目据此获得更长的时限
+        if has_expected:
+            with open_expected(case) as expected:
+                result = execute_and_compare(reference_code, make_comparator(case['comparator'], expected),
+                                             timeout=REFERENCE_TIMEOUT_MAX, **input_source(case))
+            if result['stopped_early'] or (result['returncode'] == 0 and not result['stderr'] and not result['matched']):
+                report['mismatched'].append({"case": i, "expected_output": case['expected_output'].strip(), "reference_output": result['stdout'].strip()})
+                if not result['stopped_early']:
+                    case['reference_time'] = result['elapsed']
+            elif result['returncode'] != 0 or result['stderr']:
+                report['failed'].append({"case": i, "stderr": result['stderr']})
+            else:
+                case['reference_time'] = result['elapsed']
+        else:
+            result = execute_code_safely(reference_code, timeout=REFERENCE_TIMEOUT_MAX, **input_source(case))
+            if result['returncode'] != 0 or result['stderr']:
+                report['failed'].append({"case": i, "stderr": result['stderr']})
+            else:
+                # 输出较大时转存为数据文件
+                case = prepare_test_case({**case, "expected_output": result['stdout'].strip(), "reference_time": result['elapsed']})
+                report['filled'].append(i)
+        prepared.append(case)
+    return prepared, report
+
+def _case_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def save_test_cases(cursor, problem_id, test_cases):
+    """
+    保存题目的测试用例(已由prepare_test_cases整理)，只改动有变化的行：
+    提交的用例带有已存在的ID时原地更新(内容和参考用时未变化则不动)，没有ID的用例优先匹配内容相同的旧用例，
+    其余新增；未匹配到的旧用例删除。返回测试用例是否有变化。
+    """
+    fields = CONTENT_FIELDS + ('reference_time',)
+    existing = {row['id']: row for row in cursor.execute(
+        f"SELECT id, {', '.join(fields)} FROM TestCase WHERE problem_id = ? ORDER BY id", (problem_id,)
+    ).fetchall()}
+    incoming = [(_case_id(tc.get('id')), tuple(tc.get(field) for field in fields)) for tc in test_cases]
+    assigned = [None] * len(incoming)
+    for i, (case_id, _) in enumerate(incoming):
+        if case_id in existing and case_id not in assigned:
+            assigned[i] = case_id
+    for i, (_, values) in enumerate(incoming):
+        if assigned[i] is not None:
+            continue
+        for case_id, row in existing.items():
+            if case_id not in assigned and tuple(row)[1:len(CONTENT_FIELDS) + 1] == values[:len(CONTENT_FIELDS)]:
+                assigned[i] = case_id
+                break
+
+    updates = []
+    inserts = []
+    for case_id, (_, values) in zip(assigned, incoming):
+        if case_id is None:
+            inserts.append((problem_id,) + values)
+        elif tuple(existing[case_id])[1:] != values:
+            updates.append(values + (case_id,))
+    deletes = [(case_id,) for case_id in existing if case_id not in assigned]
+    if updates:
+        cursor.executemany(f"UPDATE TestCase SET {', '.join(f'{field} = ?' for field in fields)} WHERE id = ?", updates)
+    if inserts:
+        cursor.executemany(
+            f"INSERT INTO TestCase (problem_id, {', '.join(fields)}) VALUES ({', '.join('?' * (len(fields) + 1))})", inserts
+        )
+    if deletes:
+        cursor.executemany('DELETE FROM TestCase WHERE id = ?', deletes)
+    return bool(updates or inserts or deletes)
+
+def replace_submissions(cursor, problem_id, graded):
+    """
+    保存一批评测结果，graded 为 [(学号, 代码, grade_code的结果), ...]，同一批中学号不能重复。
+    先删除这些学生对该题目的旧提交及其AI评审记录和相似度指纹，再批量插入新提交。
+    返回 {学号: 新提交ID}。
+    """
+    if not graded:
+        return {}
+    student_ids = [(student_id,) for student_id, _, _ in graded]
+    old_ids = []
+    for (student_id,) in student_ids:
+        old_ids += [(row[0],) for row in cursor.execute(
+            'SELECT id FROM Submission WHERE problem_id = ? AND student_id = ?', (problem_id, student_id)
+        ).fetchall()]
+    if old_ids:
+        cursor.executemany('DELETE FROM StudentAIReview WHERE submission_id = ?', old_ids)
+        cursor.executemany('DELETE FROM SubmissionFingerprint WHERE submission_id = ?', old_ids)
+        cursor.executemany('DELETE FROM Submission WHERE id = ?', old_ids)
+
+    cursor.executemany(
+        'INSERT INTO Submission (problem_id, student_id, code, passed_tests, total_tests, test_details_json) VALUES (?, ?, ?, ?, ?, ?)',
+        [(problem_id, student_id, code, result['passed'], result['total'], json.dumps(result['details'], ensure_ascii=False))
+         for student_id, code, result in graded]
+    )
+    # executemany不返回每行的ID；旧提交已删除，(题目, 学号)在这批数据中唯一
+    submission_ids = {}
+    for (student_id,) in student_ids:
+        row = cursor.execute(
+            'SELECT id FROM Submission WHERE problem_id = ? AND student_id = ? ORDER BY id DESC LIMIT 1',
+            (problem_id, student_id)
+        ).fetchone()
+        submission_ids[student_id] = row[0]
+    # 增量更新相似度索引
+    for student_id, code, _ in graded:
+        index_submission(cursor, submission_ids[student_id], problem_id, student_id, code)
+    return submission_ids
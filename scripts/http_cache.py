@@ -0,0 +1,83 @@
+"""
+HTTP缓存与压缩：为只读接口生成ETag/Last-Modified，客户端缓存仍有效时直接返回304；
+较大的JSON响应按客户端支持使用gzip压缩。
+
+验证器由数据行的版本号或时间戳计算，判断是否命中在查询完整数据和序列化JSON之前完成。
+"""
+import gzip
+from datetime import datetime, timezone
+from flask import request, Response
+from .config import JSON_GZIP_MIN_BYTES, JSON_GZIP_LEVEL
+from . import metrics
+
+def parse_db_timestamp(value):
+    """把SQLite的CURRENT_TIMESTAMP(UTC，'YYYY-MM-DD HH:MM:SS')转换为datetime"""
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    try:
+        return datetime.strptime(str(value)[:19], '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+
+def latest_timestamp(*values):
+    """返回若干数据库时间戳中最新的一个"""
+    parsed = [ts for ts in (parse_db_timestamp(value) for value in values) if ts is not None]
+    return max(parsed) if parsed else None
+
+def is_not_modified(etag, last_modified=None):
+    """判断客户端缓存是否仍有效：有If-None-Match时只比较ETag，否则比较If-Modified-Since"""
+    if request.if_none_match:
+        # 条件GET使用弱比较：gzip压缩后的响应带弱ETag
+        return request.if_none_match.contains_weak(etag)
+    if last_modified is not None and request.if_modified_since is not None:
+        return last_modified.replace(microsecond=0) <= request.if_modified_since
+    return False
+
+def _set_validators(response, etag, last_modified):
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # 允许浏览器缓存，但每次使用前都要向服务器验证
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def conditional_response(etag, last_modified, build):
+    """
+    客户端缓存有效时返回304(不调用build)，否则调用build()生成响应并附加验证器。
+    build返回Response或(Response, 状态码)；非200的响应不附加验证器。
+    """
+    not_modified = is_not_modified(etag, last_modified)
+    metrics.record_cache('http_conditional', not_modified)
+    if not_modified:
+        return _set_validators(Response(status=304), etag, last_modified)
+    result = build()
+    response, status = (result if isinstance(result, tuple) else (result, None))
+    if status not in (None, 200):
+        return response, status
+    return _set_validators(response, etag, last_modified)
+
+def compress_json_response(response):
+    """after_request钩子：客户端支持时用gzip压缩较大的JSON响应"""
+    if (response.mimetype != 'application/json'
+            or not 200 <= response.status_code < 300
+            or response.direct_passthrough
+            or response.is_streamed
+            or 'Content-Encoding' in response.headers):
+        return response
+    # 同一接口可能返回压缩或未压缩的内容，缓存需按Accept-Encoding区分
+    response.vary.add('Accept-Encoding')
+    if not request.accept_encodings['gzip']:
+        return response
+    data = response.get_data()
+    if len(data) < JSON_GZIP_MIN_BYTES:
+        return response
+
+    response.set_data(gzip.compress(data, compresslevel=JSON_GZIP_LEVEL))
+    response.headers['Content-Encoding'] = 'gzip'
+    # 压缩后字节不同，强ETag改为弱ETag(条件请求按弱比较仍可命中)
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
@@ -0,0 +1,287 @@
+"""
+运行指标：计数器和延迟直方图，通过 /metrics 以Prometheus文本格式输出。
+
+记录指标只在进程内存中累加(加锁后更新字典)，开销在微秒级；
+后台线程定期把本进程的快照写入 METRICS_DIR 下的独立文件，
+/metrics 读取所有进程的快照并求和，因此多个工作进程的数据能够正确汇总。
+已退出进程的快照保留到下次服务启动，计数器不会因工作进程重启而回退。
+"""
+import os
+import json
+import time
+import uuid
+import atexit
+import threading
+from flask import g, has_request_context, request
+from .config import METRICS_DIR, METRICS_FLUSH_INTERVAL
+
+# 默认延迟分桶(秒)：覆盖从毫秒级的数据库查询到数分钟的AI调用和PDF渲染
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_lock = threading.Lock()
+_registry = []
+_state = {'token': None, 'dirty': False, 'flusher': None}
+
+class Metric:
+    """指标基类：按标签值保存本进程内的数据"""
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+            _state['dirty'] = True
+        _ensure_flusher()
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with _lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry['buckets'][i] += 1
+                    break
+            entry['sum'] += value
+            entry['count'] += 1
+            _state['dirty'] = True
+        _ensure_flusher()
+
+    def time(self, **labels):
+        """计时上下文管理器：with HISTOGRAM.time(route='x'): ..."""
+        return _Timer(self, labels)
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+# ---- 指标定义 ----
+HTTP_REQUESTS = Counter('scr_http_requests_total', '按路由统计的请求数', ('route', 'method', 'status'))
+HTTP_LATENCY = Histogram('scr_http_request_duration_seconds', '按路由统计的请求耗时', ('route', 'method'))
+
+EXECUTOR_SPAWNS = Counter('scr_executor_spawns_total', '代码执行子进程启动次数')
+EXECUTOR_RUNS = Counter('scr_executor_runs_total', '代码执行结果(success/error/timeout/stopped/failure)，stopped为输出与期望不一致时提前结束', ('outcome',))
+EXECUTOR_LATENCY = Histogram('scr_executor_duration_seconds', '单次代码执行耗时', ('outcome',))
+EXECUTOR_QUEUE_WAIT = Histogram('scr_executor_queue_wait_seconds', '等待代码执行名额的时间')
+EXECUTOR_REJECTED = Counter('scr_executor_rejected_total', '执行队列拒绝的请求(queue_full/student_limit/timeout)', ('reason',))
+REGRADE_CASES = Counter('scr_regrade_cases_total', '测试用例修改后重新评测时的(提交, 用例)数(reused/rerun)', ('result',))
+
+LLM_CALLS = Counter('scr_llm_calls_total', 'AI服务调用结果(success/fallback/circuit_open)', ('result',))
+LLM_ATTEMPT_LATENCY = Histogram('scr_llm_attempt_duration_seconds', '单次AI服务HTTP请求耗时', ('status',))
+LLM_CALL_LATENCY = Histogram('scr_llm_call_duration_seconds', '一次AI服务调用(含重试)的总耗时', ('result',))
+LLM_RETRIES = Counter('scr_llm_retries_total', 'AI服务重试次数')
+LLM_PROMPT_TOKENS = Histogram(
+    'scr_llm_prompt_tokens', '提示词估算token数', ('role',),
+    buckets=(250, 500, 1000, 2000, 4000, 6000, 8000, 12000, 16000)
+)
+
+SQLITE_QUERIES = Counter('scr_sqlite_queries_total', '按路由统计的SQLite语句数', ('route',))
+SQLITE_LATENCY = Histogram('scr_sqlite_query_duration_seconds', '按路由统计的SQLite语句耗时', ('route',))
+
+PDF_RENDERS = Counter('scr_pdf_renders_total', 'PDF渲染任务结果(ok/error/timeout)', ('task', 'result'))
+PDF_LATENCY = Histogram('scr_pdf_render_duration_seconds', 'PDF渲染任务耗时(含排队)', ('task',))
+
+CACHE_LOOKUPS = Counter('scr_cache_lookups_total', '缓存查询结果(hit/miss)，命中率 = hit / (hit + miss)', ('cache', 'result'))
+
+def record_cache(cache, hit):
+    CACHE_LOOKUPS.inc(cache=cache, result='hit' if hit else 'miss')
+
+# ---- 多进程汇总 ----
+def _snapshot_path():
+    if _state['token'] is None:
+        _state['token'] = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+    return os.path.join(METRICS_DIR, f"{_state['token']}.json")
+
+def _snapshot():
+    with _lock:
+        _state['dirty'] = False
+        return {
+            metric.name: [[list(key), value if metric.kind == 'counter' else dict(value, buckets=list(value['buckets']))]
+                          for key, value in metric.values.items()]
+            for metric in _registry if metric.values
+        }
+
+def flush():
+    """把本进程的指标快照写入文件(原子替换)"""
+    data = _snapshot()
+    if not data:
+        return
+    path = _snapshot_path()
+    try:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"写入指标快照失败: {e}")
+
+def _flush_loop():
+    while True:
+        time.sleep(METRICS_FLUSH_INTERVAL)
+        if _state['dirty']:
+            flush()
+
+def _ensure_flusher():
+    # 首次记录指标时启动本进程的写入线程
+    if _state['flusher'] is None:
+        with _lock:
+            if _state['flusher'] is None:
+                thread = threading.Thread(target=_flush_loop, name='metrics-flush', daemon=True)
+                _state['flusher'] = thread
+                thread.start()
+
+def _reset_after_fork():
+    """fork出的子进程不继承父进程的指标数据和写入线程"""
+    global _lock
+    _lock = threading.Lock()
+    for metric in _registry:
+        metric.values = {}
+    _state.update(token=None, dirty=False, flusher=None)
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+atexit.register(flush)
+
+def reset_metrics_dir():
+    """服务启动时(创建工作进程之前)清空上一次运行留下的快照"""
+    if not os.path.isdir(METRICS_DIR):
+        return
+    for name in os.listdir(METRICS_DIR):
+        if name.endswith('.json') or name.endswith('.tmp'):
+            try:
+                os.remove(os.path.join(METRICS_DIR, name))
+            except OSError:
+                pass
+
+def collect():
+    """读取所有进程的快照并求和，返回 {指标名: {标签值元组: 值}}"""
+    flush()
+    totals = {}
+    try:
+        names = [name for name in os.listdir(METRICS_DIR) if name.endswith('.json')]
+    except OSError:
+        names = []
+    for name in names:
+        try:
+            with open(os.path.join(METRICS_DIR, name), 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            continue
+        for metric_name, entries in data.items():
+            merged = totals.setdefault(metric_name, {})
+            for key, value in entries:
+                key = tuple(key)
+                if isinstance(value, dict):
+                    entry = merged.setdefault(key, {'buckets': [0] * len(value['buckets']), 'sum': 0.0, 'count': 0})
+                    entry['buckets'] = [a + b for a, b in zip(entry['buckets'], value['buckets'])]
+                    entry['sum'] += value['sum']
+                    entry['count'] += value['count']
+                else:
+                    merged[key] = merged.get(key, 0) + value
+    return totals
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def render_prometheus():
+    """以Prometheus文本格式输出汇总后的指标"""
+    totals = collect()
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for key, value in sorted(totals.get(metric.name, {}).items()):
+            if metric.kind == 'counter':
+                lines.append(f"{metric.name}{_format_labels(metric.labelnames, key)} {_format_number(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(metric.buckets, value['buckets']):
+                cumulative += count
+                labels = _format_labels(metric.labelnames, key, 'le="%s"' % bound)
+                lines.append(f"{metric.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(metric.labelnames, key, 'le="+Inf"')
+            lines.append(f"{metric.name}_bucket{labels} {value['count']}")
+            lines.append(f"{metric.name}_sum{_format_labels(metric.labelnames, key)} {_format_number(value['sum'])}")
+            lines.append(f"{metric.name}_count{_format_labels(metric.labelnames, key)} {value['count']}")
+    return '\n'.join(lines) + '\n'
+
+# ---- Flask集成 ----
+def current_route():
+    """当前请求的路由模板(如 /api/submit/<int:problem_id>)，请求之外返回background"""
+    if not has_request_context():
+        return 'background'
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+def add_request_time(subsystem, seconds):
+    """把耗时计入当前请求的分项统计(慢请求日志使用)，请求之外忽略"""
+    if not has_request_context():
+        return
+    times = g.setdefault('_subsystem_times', {})
+    total, count = times.get(subsystem, (0.0, 0))
+    times[subsystem] = (total + seconds, count + 1)
+
+def request_elapsed():
+    """当前请求从开始到现在的耗时(秒)"""
+    started = g.get('_metrics_started')
+    return time.perf_counter() - started if started is not None else 0.0
+
+def register_metrics(app):
+    """注册请求计时钩子和 /metrics 接口"""
+    from flask import Response
+
+    @app.before_request
+    def _start_timer():
+        g._metrics_started = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        if '_metrics_started' in g:
+            route = current_route()
+            HTTP_LATENCY.observe(request_elapsed(), route=route, method=request.method)
+            HTTP_REQUESTS.inc(route=route, method=request.method, status=response.status_code)
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        """Prometheus格式的运行指标(所有工作进程汇总)"""
+        return Response(render_prometheus(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,150 @@
+"""
+PDF报告磁盘缓存：按报告内容生成缓存键，相同内容的报告只渲染一次。
+
+缓存键由题目版本(修订号、标题和描述)、代码、测试结果(提交时保存的评测结果)、AI评估和报告模板版本共同决定，
+任一内容变化都会得到新的键，因此缓存无需主动失效。
+缓存总大小超过上限时，按最近使用时间淘汰最旧的报告。
+"""
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from . import metrics
+from .config import PDF_CACHE_DIR, PDF_CACHE_MAX_BYTES, PDF_TEMPLATE_VERSION
+
+# 淘汰时清理到上限的比例，避免每次写入都触发淘汰
+EVICT_TARGET_RATIO = 0.9
+
+def _digest(value):
+    if not isinstance(value, str):
+        value = json.dumps(value, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(value.encode('utf-8')).hexdigest()
+
+def report_cache_key(problem, code, test_results, ai_review):
+    """计算报告的缓存键"""
+    revision = problem['revision'] if 'revision' in problem.keys() else None
+    problem_revision = _digest(f"{revision}\0{problem['title']}\0{problem['description_md']}")
+    parts = [
+        f"template={PDF_TEMPLATE_VERSION}",
+        f"problem={problem_revision}",
+        f"code={_digest(code or '')}",
+        f"tests={_digest(test_results)}",
+        f"review={_digest(ai_review)}",
+    ]
+    return hashlib.sha256('\n'.join(parts).encode('utf-8')).hexdigest()
+
+class PdfReportCache:
+    """以文件形式保存的PDF报告缓存，按大小进行LRU淘汰"""
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        # 本进程估算的缓存总大小；其他进程写入的文件在下次扫描时计入
+        self.total_bytes = None
+        self.lock = threading.Lock()
+
+    def path_for(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.pdf")
+
+    def get(self, key):
+        """命中时返回缓存文件路径并更新其使用时间，未命中返回None"""
+        path = self.path_for(key)
+        try:
+            os.utime(path)
+        except OSError:
+            metrics.record_cache('pdf_report', False)
+            return None
+        metrics.record_cache('pdf_report', True)
+        return path
+
+    def put(self, key, pdf_bytes):
+        """写入一份报告，返回缓存文件路径；写入失败时返回None"""
+        path = self.path_for(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # 先写临时文件再原子替换，避免其他请求读到不完整的报告
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(pdf_bytes)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError as e:
+            print(f"写入PDF缓存失败: {e}")
+            return None
+
+        with self.lock:
+            if self.total_bytes is None:
+                self.total_bytes = self._scan_total()
+            else:
+                self.total_bytes += len(pdf_bytes)
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+        return path
+
+    def _iter_entries(self):
+        """遍历缓存文件，返回(最近使用时间, 大小, 路径)"""
+        try:
+            shards = os.listdir(self.cache_dir)
+        except OSError:
+            return
+        for shard in shards:
+            shard_dir = os.path.join(self.cache_dir, shard)
+            if not os.path.isdir(shard_dir):
+                continue
+            for name in os.listdir(shard_dir):
+                if not name.endswith('.pdf'):
+                    continue
+                path = os.path.join(shard_dir, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield stat.st_mtime, stat.st_size, path
+
+    def _scan_total(self):
+        return sum(size for _, size, _ in self._iter_entries())
+
+    def _evict(self):
+        """删除最久未使用的报告，直到总大小降到上限以下"""
+        entries = sorted(self._iter_entries())
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * EVICT_TARGET_RATIO
+        removed = 0
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        self.total_bytes = total
+        if removed:
+            print(f"PDF缓存已淘汰 {removed} 份报告，当前大小 {total / 1024 / 1024:.1f} MB")
+
+    def stats(self):
+        entries = list(self._iter_entries())
+        return {
+            "directory": self.cache_dir,
+            "reports": len(entries),
+            "total_bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes
+        }
+
+pdf_cache = PdfReportCache(PDF_CACHE_DIR, PDF_CACHE_MAX_BYTES)
+
+def render_cached_report(problem, code, test_results, ai_review, render):
+    """
+    返回(缓存键, 缓存文件路径, PDF字节)：
+    命中缓存时PDF字节为None；未命中时调用render生成并写入缓存(写入失败时路径为None)。
+    """
+    key = report_cache_key(problem, code, test_results, ai_review)
+    path = pdf_cache.get(key)
+    if path is not None:
+        return key, path, None
+    pdf_bytes = render(problem, code, test_results, ai_review)
+    return key, pdf_cache.put(key, pdf_bytes), pdf_bytes
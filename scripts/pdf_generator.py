@@ -1,9 +1,117 @@
 import os
 import io
-import signal
+import re
+import copy
+import threading
 from fpdf import FPDF
 from fpdf.enums import XPos, YPos
-from .config import FONT_PATHS, PDF_GENERATION_TIMEOUT
+from .config import FONT_PATHS
+
+# 中日韩字符，报告中包含这些字符时才加载中文字体
+CJK_PATTERN = re.compile(r'[\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]')
+
+# 已报告过加载失败的字体，避免每份报告重复输出
+_reported_font_errors = set()
+
+# 共享字体模板依赖fpdf2 TTFFont的内部属性，只在验证过的版本上启用，其他版本按常规方式加载字体
+FONT_SHARING_FPDF_VERSIONS = ('2.8.9',)
+_SHARED_FONT_ATTRIBUTES = ('i', 'ttfont', '_hbfont', 'biggest_size_pt', 'missing_glyphs', 'subset', 'color_font', 'is_cff', 'is_cid_keyed')
+_font_sharing_supported = None
+
+# 进程级字体缓存：fontkey -> (已解析的字体模板, 字体文件字节, 能否共享)
+# 解析字体(尤其是包含数万字形的中文字体)开销很大，每个进程只解析一次
+_font_cache = {}
+_font_cache_lock = threading.Lock()
+
+def _load_font_template(pdf, family, style, font_path):
+    """解析字体文件并缓存，返回(字体模板, 字体文件字节, 能否共享)"""
+    from pathlib import Path
+    from fontTools import ttLib
+    from fpdf.fonts import TTFFont
+
+    fontkey = f"{family.lower()}{style}"
+    with _font_cache_lock:
+        entry = _font_cache.get(fontkey)
+        if entry is None:
+            with open(font_path, 'rb') as f:
+                font_bytes = f.read()
+            template = TTFFont(pdf, Path(font_path), fontkey, style)
+            # fpdf解析时会为缺少.notdef字形的TrueType字体补充该字形，
+            # 这一修改只存在于模板中，每个文档重新读取的字体不包含，因此这类字体不能共享
+            raw = ttLib.TTFont(io.BytesIO(font_bytes), lazy=True)
+            shareable = 'glyf' not in raw or '.notdef' in raw['glyf']
+            entry = (template, font_bytes, shareable)
+            _font_cache[fontkey] = entry
+            print(f"字体已解析并缓存: {os.path.basename(font_path)}")
+        return entry
+
+def font_sharing_supported():
+    """检查当前fpdf2版本能否共享字体模板(每个进程只检查一次)"""
+    global _font_sharing_supported
+    if _font_sharing_supported is None:
+        import fpdf
+        try:
+            from fpdf.fonts import TTFFont, SubsetMap  # noqa: F401
+            importable = True
+        except ImportError:
+            importable = False
+        _font_sharing_supported = importable and fpdf.__version__ in FONT_SHARING_FPDF_VERSIONS
+        if not _font_sharing_supported:
+            print(f"fpdf2 {fpdf.__version__} 未验证字体共享(支持: {', '.join(FONT_SHARING_FPDF_VERSIONS)})，每份报告单独加载字体")
+    return _font_sharing_supported
+
+def _template_compatible(template):
+    """解析出的字体模板缺少需要重置的属性时停用字体共享"""
+    global _font_sharing_supported
+    missing = [name for name in _SHARED_FONT_ATTRIBUTES if not hasattr(template, name)]
+    if missing:
+        _font_sharing_supported = False
+        print(f"fpdf2字体对象缺少属性 {missing}，每份报告单独加载字体")
+    return not missing
+
+def add_cached_font(pdf, family, style, font_path):
+    """
+    向PDF添加字体，复用进程内已解析的字形宽度、cmap等数据。
+    输出PDF时fpdf会就地裁剪字体子集，因此每个文档使用独立的TTFont对象(惰性加载，开销很小)。
+    fpdf2版本未经验证时退回常规的add_font。
+    """
+    from fontTools import ttLib
+
+    style = ''.join(sorted(style.upper()))
+    fontkey = f"{family.lower()}{style}"
+    if fontkey in pdf.fonts:
+        return
+    if not font_sharing_supported():
+        pdf.add_font(family, style, font_path)
+        return
+
+    template, font_bytes, shareable = _load_font_template(pdf, family, style, font_path)
+    if not shareable or not _template_compatible(template):
+        pdf.add_font(family, style, font_path)
+        return
+
+    font = copy.copy(template)
+    font.i = len(pdf.fonts) + 1
+    font.ttfont = ttLib.TTFont(io.BytesIO(font_bytes), recalcTimestamp=False, lazy=True)
+    font._hbfont = None
+    font.biggest_size_pt = 0
+    font.missing_glyphs = []
+    from fpdf.fonts import SubsetMap
+    font.subset = SubsetMap(font)
+    font.color_font = None
+    pdf.fonts[fontkey] = font
+    if font.is_cff and font.is_cid_keyed:
+        pdf._set_min_pdf_version("1.6")
+
+def report_font_error(name, error):
+    """字体加载失败时每个进程只提示一次"""
+    if name not in _reported_font_errors:
+        _reported_font_errors.add(name)
+        print(f"无法加载{name}字体: {error}")
+
+def contains_cjk(text):
+    """判断文本中是否包含中日韩字符"""
+    return bool(text) and CJK_PATTERN.search(text) is not None
 
 class PDF(FPDF):
     """自定义PDF生成类，支持中文字体"""
@@ -13,31 +121,41 @@ class PDF(FPDF):
         # 字体加载状态
         self.font_set = False
         self.chinese_font_set = False
+        self.chinese_font_checked = False
         
         # 加载英文字体
         try:
-            self.add_font('NotoSans', '', FONT_PATHS['regular'])
-            self.add_font('NotoSans', 'B', FONT_PATHS['bold'])
-            self.add_font('NotoSans', 'I', FONT_PATHS['italic'])
-            self.add_font('NotoSans', 'BI', FONT_PATHS['bold_italic'])
+            add_cached_font(self, 'NotoSans', '', FONT_PATHS['regular'])
+            add_cached_font(self, 'NotoSans', 'B', FONT_PATHS['bold'])
+            add_cached_font(self, 'NotoSans', 'I', FONT_PATHS['italic'])
+            add_cached_font(self, 'NotoSans', 'BI', FONT_PATHS['bold_italic'])
             self.font_set = True
-            print("NotoSans字体加载成功")
         except Exception as e:
-            print(f"无法加载NotoSans字体: {e}")
-        
-        # 加载中文字体
-        try:
-            self.add_font('SourceHanSans', '', FONT_PATHS['chinese'])
-            self.chinese_font_set = True
-            print("SourceHanSans中文字体加载成功")
-        except Exception as e:
-            print(f"无法加载SourceHanSans中文字体: {e}")
+            report_font_error('NotoSans', e)
+    
+    def ensure_chinese_font(self):
+        """首次遇到中文内容时才加载中文字体"""
+        if not self.chinese_font_checked:
+            self.chinese_font_checked = True
+            try:
+                add_cached_font(self, 'SourceHanSans', '', FONT_PATHS['chinese'])
+                self.chinese_font_set = True
+            except Exception as e:
+                report_font_error('SourceHanSans中文', e)
+        return self.chinese_font_set
+
+    def set_body_font(self, text, size):
+        """根据内容选择正文字体：含中文时使用中文字体"""
+        if contains_cjk(text) and self.ensure_chinese_font():
+            self.set_font('SourceHanSans', '', size)
+        elif self.font_set:
+            self.set_font('NotoSans', '', size)
+        else:
+            self.set_font('Arial', '', size)
     
     def header(self):
         """PDF页眉"""
-        if self.chinese_font_set:
-            self.set_font('SourceHanSans', '', 15)
-        elif self.font_set:
+        if self.font_set:
             self.set_font('NotoSans', 'B', 15)
         else:
             self.set_font('Arial', 'B', 15)
@@ -56,7 +174,7 @@ class PDF(FPDF):
 
     def chapter_title(self, title):
         """章节标题"""
-        if self.chinese_font_set:
+        if contains_cjk(title) and self.ensure_chinese_font():
             self.set_font('SourceHanSans', '', 12)
         elif self.font_set:
             self.set_font('NotoSans', 'B', 12)
@@ -67,18 +185,13 @@ class PDF(FPDF):
 
     def chapter_body(self, body):
         """章节正文(英文)"""
-        if self.chinese_font_set:
-            self.set_font('SourceHanSans', '', 10)
-        elif self.font_set:
-            self.set_font('NotoSans', '', 10)
-        else:
-            self.set_font('Arial', '', 10)
+        self.set_body_font(body, 10)
         self.multi_cell(0, 5, body)
         self.ln()
     
     def chapter_body_chinese(self, body):
         """章节正文(中文)"""
-        if self.chinese_font_set:
+        if self.ensure_chinese_font():
             self.set_font('SourceHanSans', '', 10)
             self.multi_cell(0, 5, body)
             self.ln()
@@ -86,102 +199,104 @@ class PDF(FPDF):
             # 回退到英文显示
             self.chapter_body(body)
 
-def timeout_handler(signum, frame):
-    """超时处理函数"""
-    raise TimeoutError("PDF生成超时")
+def warm_fonts():
+    """预先解析并缓存所有报告字体(包括中文字体)，供长期运行的渲染进程启动时调用"""
+    pdf = PDF()
+    pdf.ensure_chinese_font()
+
+def write_report_sections(pdf, problem, code, test_results, ai_review):
+    """把一份报告的各章节写入PDF(单份报告与合订本共用)"""
+    # 题目信息
+    pdf.chapter_title("Problem Information")
+    pdf.chapter_body(f"Title: {problem['title']}")
+    pdf.chapter_body(f"Description:\n{problem['description_md']}")
+    
+    # 学生代码
+    pdf.chapter_title("Student Code")
+    pdf.chapter_body(code)
+    
+    # 测试结果
+    pdf.chapter_title(f"Test Results ({test_results['passed']}/{test_results['total']} Passed)")
+    if test_results.get('details'):
+        for detail in test_results['details']:
+            pdf.chapter_body(f"Test Case {detail['case']}: {detail['status'].upper()}\n  - Input: {detail['input']}\n  - Expected: {detail['expected_output']}\n  - Actual: {detail['actual_output']}")
+    
+    # AI评估
+    pdf.chapter_title("AI Evaluation")
+    
+    # 总体评价
+    if 'general_comment' in ai_review and ai_review['general_comment']:
+        pdf.chapter_body_chinese(f"总体评价:\n{ai_review['general_comment']}")
+    
+    # 优点
+    if 'strengths' in ai_review and ai_review['strengths']:
+        pdf.chapter_body_chinese("优点:")
+        for strength in ai_review['strengths']:
+            pdf.chapter_body_chinese(f"• {strength}")
+    
+    # 改进建议
+    if 'areas_for_improvement' in ai_review and ai_review['areas_for_improvement']:
+        pdf.chapter_body_chinese("改进建议:")
+        for item in ai_review['areas_for_improvement']:
+            category = item.get('category', '未知')
+            comment = item.get('comment', '')
+            line_ref = item.get('line_reference', '')
+            if line_ref:
+                pdf.chapter_body_chinese(f"• [{category}] (行: {line_ref}): {comment}")
+            else:
+                pdf.chapter_body_chinese(f"• [{category}]: {comment}")
+    
+    # 优化后的代码
+    if 'optimized_code' in ai_review and ai_review['optimized_code']:
+        pdf.chapter_body_chinese("优化后代码参考:")
+        pdf.chapter_body(ai_review['optimized_code'])
+    
+    # 优化说明
+    if 'explanation_of_optimization' in ai_review and ai_review['explanation_of_optimization']:
+        pdf.chapter_body_chinese("优化说明:")
+        pdf.chapter_body_chinese(ai_review['explanation_of_optimization'])
 
 def generate_pdf_report(problem, code, test_results, ai_review):
-    """生成PDF报告"""
+    """生成PDF报告(超时控制由调用方的渲染进程池负责)"""
     try:
-        # 设置超时处理(Unix系统)
-        try:
-            signal.signal(signal.SIGALRM, timeout_handler)
-            signal.alarm(PDF_GENERATION_TIMEOUT)
-        except (AttributeError, ValueError):
-            # Windows系统不支持
-            pass
-        
         # 生成PDF
         pdf = PDF()
         pdf.add_page()
-        
-        # 题目信息
-        pdf.chapter_title("Problem Information")
-        pdf.chapter_body(f"Title: {problem['title']}")
-        pdf.chapter_body(f"Description:\n{problem['description_md']}")
-        
-        # 学生代码
-        pdf.chapter_title("Student Code")
-        pdf.chapter_body(code)
-        
-        # 测试结果
-        pdf.chapter_title(f"Test Results ({test_results['passed']}/{test_results['total']} Passed)")
-        if test_results.get('details'):
-            for detail in test_results['details']:
-                pdf.chapter_body(f"Test Case {detail['case']}: {detail['status'].upper()}\n  - Input: {detail['input']}\n  - Expected: {detail['expected_output']}\n  - Actual: {detail['actual_output']}")
-        
-        # AI评估
-        pdf.chapter_title("AI Evaluation")
-        
-        # 总体评价
-        if 'general_comment' in ai_review and ai_review['general_comment']:
-            pdf.chapter_body_chinese(f"总体评价:\n{ai_review['general_comment']}")
-        
-        # 优点
-        if 'strengths' in ai_review and ai_review['strengths']:
-            pdf.chapter_body_chinese("优点:")
-            for strength in ai_review['strengths']:
-                pdf.chapter_body_chinese(f"• {strength}")
-        
-        # 改进建议
-        if 'areas_for_improvement' in ai_review and ai_review['areas_for_improvement']:
-            pdf.chapter_body_chinese("改进建议:")
-            for item in ai_review['areas_for_improvement']:
-                category = item.get('category', '未知')
-                comment = item.get('comment', '')
-                line_ref = item.get('line_reference', '')
-                if line_ref:
-                    pdf.chapter_body_chinese(f"• [{category}] (行: {line_ref}): {comment}")
-                else:
-                    pdf.chapter_body_chinese(f"• [{category}]: {comment}")
-        
-        # 优化后的代码
-        if 'optimized_code' in ai_review and ai_review['optimized_code']:
-            pdf.chapter_body_chinese("优化后代码参考:")
-            pdf.chapter_body(ai_review['optimized_code'])
-        
-        # 优化说明
-        if 'explanation_of_optimization' in ai_review and ai_review['explanation_of_optimization']:
-            pdf.chapter_body_chinese("优化说明:")
-            pdf.chapter_body_chinese(ai_review['explanation_of_optimization'])
+        write_report_sections(pdf, problem, code, test_results, ai_review)
         
         # 生成PDF字节流
         with io.BytesIO() as buffer:
             pdf.output(buffer)
-            pdf_bytes = buffer.getvalue()
-            buffer.seek(0)
-            
-            # 取消超时信号
-            try:
-                signal.alarm(0)
-            except (AttributeError, ValueError):
-                pass
-                
-            return pdf_bytes
+            return buffer.getvalue()
             
-    except TimeoutError as e:
-        # 取消超时信号
-        try:
-            signal.alarm(0)
-        except (AttributeError, ValueError):
-            pass
-        print(f"PDF生成超时: {e}")
-        raise e
     except Exception as e:
-        # 取消超时信号
-        try:
-            signal.alarm(0)
-        except (AttributeError, ValueError):
-            pass
         print(f"PDF生成错误: {e}")
-        raise e
\ No newline at end of file
+        raise e
+
+def generate_class_booklet(problem, reports, output_path):
+    """
+    把同一题目下多名学生的报告合并为一个PDF(合订本)，写入output_path，返回报告份数。
+    reports逐条产出(学生ID, 代码, 测试结果, AI评估)，每名学生从新页开始并生成书签；
+    字体等资源在整个文档中只嵌入一次。
+    """
+    pdf = PDF()
+    pdf.set_title(f"{problem['title']} - Class Booklet")
+    pdf.page_mode = 'USE_OUTLINES'
+    count = 0
+    for student_id, code, test_results, ai_review in reports:
+        pdf.add_page()
+        pdf.start_section(f"{count + 1}. {student_id}")
+        pdf.chapter_title(f"Student: {student_id}")
+        try:
+            write_report_sections(pdf, problem, code, test_results, ai_review)
+        except Exception as e:
+            # 单份报告出错不影响整本，在该学生的章节中记录错误
+            print(f"合订本中报告生成失败: 学生ID={student_id}, 错误: {e}")
+            pdf.chapter_body(f"Report generation failed: {e}")
+        count += 1
+
+    if count == 0:
+        pdf.add_page()
+        pdf.chapter_body_chinese("该题目暂无提交记录。")
+    pdf.output(output_path)
+    return count
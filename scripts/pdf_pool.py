@@ -0,0 +1,175 @@
+"""
+PDF渲染进程池：在独立进程中生成报告，避免CPU密集的渲染占用GIL阻塞其他请求。
+
+每个渲染进程启动时预先加载字体；每个任务都有独立的截止时间，
+超时的进程会被终止并替换，不影响其他正在进行的任务。
+"""
+import time
+import atexit
+import queue
+import threading
+from multiprocessing.reduction import ForkingPickler
+from . import metrics
+from .config import PDF_RENDER_WORKERS, PDF_GENERATION_TIMEOUT, PDF_BOOKLET_TIMEOUT
+
+def _worker_main(conn):
+    """渲染进程主循环：接收(任务名, 参数)，返回('ok', 结果)或('error', 错误信息)"""
+    from .pdf_generator import generate_pdf_report, warm_fonts
+    from .report_export import write_problem_booklet
+    tasks = {
+        'report': generate_pdf_report,
+        'booklet': write_problem_booklet,
+    }
+    warm_fonts()
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            break
+        if job is None:
+            break
+        task, args = job
+        try:
+            conn.send(('ok', tasks[task](*args)))
+        except Exception as e:
+            conn.send(('error', f"{type(e).__name__}: {e}"))
+    conn.close()
+
+class RenderWorker:
+    """一个渲染进程及其通信管道"""
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn,), name='pdf-render', daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def kill(self):
+        self.process.terminate()
+        self.process.join(timeout=5)
+        self.conn.close()
+
+class PdfRenderPool:
+    """固定大小的PDF渲染进程池"""
+    def __init__(self, size):
+        self.size = size
+        self.context = None
+        self.idle = queue.Queue()
+        self.started = False
+        self.closed = False
+        self.lock = threading.Lock()
+
+    def start(self):
+        """启动全部渲染进程(首次渲染时自动调用，也可在服务启动时预热)"""
+        with self.lock:
+            if self.started:
+                return
+            if self.context is None:
+                import multiprocessing
+                self.context = multiprocessing.get_context('spawn')
+            for _ in range(self.size):
+                self.idle.put(RenderWorker(self.context))
+            self.started = True
+            self.closed = False
+
+    def render(self, problem, code, test_results, ai_review, timeout=PDF_GENERATION_TIMEOUT):
+        """在渲染进程中生成PDF，超过timeout秒抛出TimeoutError"""
+        return self.run('report', (dict(problem), code, test_results, ai_review), timeout)
+
+    def run(self, task, args, timeout):
+        """在渲染进程中执行一个任务并返回结果，超过timeout秒抛出TimeoutError"""
+        started = time.perf_counter()
+        result = 'error'
+        try:
+            payload = self._run(task, args, timeout)
+            result = 'ok'
+            return payload
+        except TimeoutError:
+            result = 'timeout'
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.PDF_RENDERS.inc(task=task, result=result)
+            metrics.PDF_LATENCY.observe(elapsed, task=task)
+            metrics.add_request_time('pdf', elapsed)
+
+    def _run(self, task, args, timeout):
+        self.start()
+        deadline = time.monotonic() + timeout
+        try:
+            worker = self.idle.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError("PDF生成超时：渲染进程均繁忙")
+
+        # 序列化与管道读写分开进行：只有请求已写入但结果尚未读完时管道状态才不确定
+        in_flight = False
+        try:
+            message = ForkingPickler.dumps((task, args))
+            in_flight = True
+            worker.conn.send_bytes(message)
+            if not worker.conn.poll(max(0, deadline - time.monotonic())):
+                raise TimeoutError(f"PDF生成超时(超过 {timeout} 秒)")
+            reply = worker.conn.recv_bytes()
+            in_flight = False
+            status, payload = ForkingPickler.loads(reply)
+        except BaseException as e:
+            if in_flight:
+                # 进程超时、异常退出或通信中断：终止并替换，保证池大小不变
+                worker.kill()
+                self._replace_worker()
+            else:
+                # 参数无法序列化或结果无法解析时管道仍可用，放回进程池
+                self._release(worker)
+            if isinstance(e, (EOFError, OSError)) and not isinstance(e, TimeoutError):
+                raise RuntimeError(f"PDF渲染进程异常退出: {e}")
+            raise
+
+        self._release(worker)
+        if status != 'ok':
+            raise RuntimeError(payload)
+        return payload
+
+    def _release(self, worker):
+        """任务结束后把渲染进程放回空闲队列；进程池已关闭时让该进程退出"""
+        with self.lock:
+            closed = self.closed
+        if closed:
+            worker.conn.send(None)
+            worker.process.join(timeout=5)
+        else:
+            self.idle.put(worker)
+
+    def _replace_worker(self):
+        with self.lock:
+            if not self.closed:
+                self.idle.put(RenderWorker(self.context))
+
+    def shutdown(self, timeout=10):
+        """关闭渲染进程池；正在渲染的任务由各自的请求线程等待完成"""
+        with self.lock:
+            if not self.started:
+                return
+            self.closed = True
+            self.started = False
+        while True:
+            try:
+                worker = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                worker.conn.send(None)
+                worker.process.join(timeout=timeout)
+            except (OSError, BrokenPipeError):
+                pass
+            if worker.process.is_alive():
+                worker.kill()
+
+pdf_pool = PdfRenderPool(PDF_RENDER_WORKERS)
+atexit.register(pdf_pool.shutdown)
+
+def render_pdf_report(problem, code, test_results, ai_review, timeout=PDF_GENERATION_TIMEOUT):
+    """在渲染进程池中生成PDF报告"""
+    return pdf_pool.render(problem, code, test_results, ai_review, timeout)
+
+def render_class_booklet(problem, output_path, timeout=PDF_BOOKLET_TIMEOUT):
+    """在渲染进程中生成题目的合订本PDF并写入output_path，返回报告份数"""
+    return pdf_pool.run('booklet', (dict(problem), output_path), timeout)
@@ -0,0 +1,163 @@
+"""
+请求性能剖析与慢请求日志。
+
+慢请求日志始终开启：请求耗时超过 SLOW_REQUEST_THRESHOLD 秒时，输出代码执行、SQLite、
+AI服务、PDF渲染各自的耗时和次数(各子系统通过 metrics.add_request_time 累计到当前请求)。
+
+性能剖析需要主动开启(PROFILE_ALL_REQUESTS=1，或请求头 X-Profile-Token 与 PROFILE_ADMIN_TOKEN 一致)，
+对该请求运行cProfile并用tracemalloc记录内存峰值，结果写入 PROFILES_DIR：
+    <名称>.prof   cProfile原始数据，可用 python -m pstats 或 snakeviz 查看
+    <名称>.txt    请求信息、分项耗时、内存峰值、分配内存最多的代码行和耗时最多的函数
+响应头 X-Profile-Id 返回<名称>。tracemalloc是进程级的，同一进程同时只剖析一个请求，
+其余请求照常处理但不剖析；流式响应(批量导出、成绩册)只统计开始发送之前的部分。
+"""
+import os
+import io
+import re
+import hmac
+import time
+import threading
+from flask import g, request
+from . import metrics
+from .config import (
+    PROFILE_ALL_REQUESTS, PROFILE_ADMIN_TOKEN, PROFILES_DIR, PROFILE_MAX_FILES, SLOW_REQUEST_THRESHOLD
+)
+
+PROFILE_HEADER = 'X-Profile-Token'
+
+# 分项耗时的显示顺序和名称
+SUBSYSTEM_NAMES = {
+    'executor_queue': '执行排队', 'executor': '代码执行', 'sqlite': 'SQLite', 'llm': 'AI服务', 'pdf': 'PDF渲染'
+}
+
+TOP_ALLOCATIONS = 15
+TOP_FUNCTIONS = 40
+
+_profile_lock = threading.Lock()
+
+def profiling_requested():
+    """当前请求是否需要剖析"""
+    if PROFILE_ALL_REQUESTS:
+        return True
+    token = request.headers.get(PROFILE_HEADER, '')
+    if not PROFILE_ADMIN_TOKEN or not token:
+        return False
+    return hmac.compare_digest(token.encode('utf-8'), PROFILE_ADMIN_TOKEN.encode('utf-8'))
+
+def subsystem_breakdown(elapsed):
+    """当前请求的分项耗时，如 '代码执行 38.10s(5次)，SQLite 0.02s(14次)，其他 2.90s'"""
+    times = g.get('_subsystem_times', {})
+    parts = []
+    accounted = 0.0
+    for key, name in SUBSYSTEM_NAMES.items():
+        if key in times:
+            total, count = times[key]
+            accounted += total
+            parts.append(f"{name} {total:.2f}s({count}次)")
+    parts.append(f"其他 {max(0.0, elapsed - accounted):.2f}s")
+    return '，'.join(parts)
+
+def _start_profile():
+    if not _profile_lock.acquire(blocking=False):
+        print(f"已有请求正在剖析，跳过本次剖析: {request.method} {request.path}")
+        return
+    import cProfile
+    import tracemalloc
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    profiler = cProfile.Profile()
+    g._profile = (profiler, started_tracing)
+    profiler.enable()
+
+def _stop_profile():
+    """停止剖析并释放锁，返回(profiler, 结束时内存, 内存峰值, 内存快照)"""
+    import tracemalloc
+    profiler, started_tracing = g.pop('_profile')
+    try:
+        profiler.disable()
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),))
+        if started_tracing:
+            tracemalloc.stop()
+    finally:
+        _profile_lock.release()
+    return profiler, current, peak, snapshot
+
+def _profile_name():
+    now = time.time()
+    slug = re.sub(r'[^A-Za-z0-9]+', '_', f"{request.method}{request.path}").strip('_')[:60]
+    return f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}-{int(now * 1000) % 1000:03d}-{os.getpid()}-{slug}"
+
+def _prune_profiles():
+    """只保留最新的 PROFILE_MAX_FILES 份剖析结果"""
+    try:
+        names = [name for name in os.listdir(PROFILES_DIR) if name.endswith('.prof')]
+    except OSError:
+        return
+    if len(names) <= PROFILE_MAX_FILES:
+        return
+    names.sort(key=lambda name: os.path.getmtime(os.path.join(PROFILES_DIR, name)))
+    for name in names[:len(names) - PROFILE_MAX_FILES]:
+        for path in (name, name[:-len('.prof')] + '.txt'):
+            try:
+                os.remove(os.path.join(PROFILES_DIR, path))
+            except OSError:
+                pass
+
+def _save_profile(response, elapsed):
+    profiler, current, peak, snapshot = _stop_profile()
+    import pstats
+    name = _profile_name()
+    lines = [
+        f"请求: {request.method} {request.full_path.rstrip('?')}",
+        f"状态: {response.status_code}",
+        f"进程: {os.getpid()}",
+        f"总耗时: {elapsed:.3f}s",
+        f"分项耗时: {subsystem_breakdown(elapsed)}",
+        f"内存峰值(tracemalloc): {peak / 1024 / 1024:.1f} MB，结束时 {current / 1024 / 1024:.1f} MB",
+        "",
+        "分配内存最多的代码行:",
+    ]
+    for stat in snapshot.statistics('lineno')[:TOP_ALLOCATIONS]:
+        lines.append(f"  {stat}")
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+    lines += ["", "耗时最多的函数(按累计时间):", stream.getvalue()]
+
+    try:
+        os.makedirs(PROFILES_DIR, exist_ok=True)
+        profiler.dump_stats(os.path.join(PROFILES_DIR, f"{name}.prof"))
+        with open(os.path.join(PROFILES_DIR, f"{name}.txt"), 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines))
+    except OSError as e:
+        print(f"保存剖析结果失败: {e}")
+        return
+    _prune_profiles()
+    response.headers['X-Profile-Id'] = name
+    print(f"[剖析] {request.method} {request.path} 耗时 {elapsed:.2f}s，内存峰值 {peak / 1024 / 1024:.1f} MB，结果: {name}")
+
+def register_profiling(app):
+    """注册慢请求日志和按需剖析的钩子(需在 register_metrics 之后注册，复用其请求计时)"""
+
+    @app.before_request
+    def _maybe_start_profile():
+        if profiling_requested():
+            _start_profile()
+
+    @app.after_request
+    def _finish_request(response):
+        elapsed = metrics.request_elapsed()
+        if '_profile' in g:
+            _save_profile(response, elapsed)
+        if elapsed >= SLOW_REQUEST_THRESHOLD:
+            print(f"[慢请求] {request.method} {request.full_path.rstrip('?')} {response.status_code} "
+                  f"耗时 {elapsed:.2f}s：{subsystem_breakdown(elapsed)}")
+        return response
+
+    @app.teardown_request
+    def _release_profile(exception):
+        # 视图抛出异常时after_request不会执行，在这里停止剖析并释放锁
+        if '_profile' in g:
+            _stop_profile()
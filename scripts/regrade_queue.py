@@ -0,0 +1,165 @@
+"""
+题目测试用例修改后，在后台重新评测该题目的已有提交。
+
+保存题目时测试用例按内容对比，未变化的用例保留原ID；后台逐个提交重新评测，
+只执行新增和修改过的用例，其余用例沿用保存的结果，然后更新通过数和评测详情。
+每个提交占用一个执行名额(按题目作为排队标识参与轮转)，不会挤占学生的评测请求。
+
+任务只保存在当前工作进程的内存中，进程退出时未完成的任务会丢弃，
+可调用 POST /api/problems/<题目ID>/regrade 重新触发(未变化的用例不会重复执行)。
+"""
+import os
+import json
+import time
+import threading
+from collections import deque
+from .database import connect_db
+from .code_executor import execution_gate, ExecutorBusyError
+from .grading import load_test_cases, regrade_details
+from . import metrics
+
+# 后台线程的nice值(仅Linux下对单个线程生效，代码子进程继承该值)
+WORKER_NICENESS = 10
+
+class RegradeQueue:
+    """按题目排队的后台重新评测，单线程依次处理"""
+    def __init__(self):
+        self.pending = deque()
+        self.running = None
+        self.closed = False
+        self.worker = None
+        self.progress = {}
+        self.completed = 0
+        self.failed = 0
+        self.condition = threading.Condition()
+
+    def enqueue(self, problem_id):
+        """加入一个需要重新评测的题目；正在评测的题目会在本轮结束后再评测一轮"""
+        with self.condition:
+            if self.closed or problem_id in self.pending:
+                return
+            self.pending.append(problem_id)
+            if self.worker is None or not self.worker.is_alive():
+                # 线程在首次使用时启动，使每个工作进程拥有自己的后台线程
+                self.worker = threading.Thread(target=self._worker_loop, name='regrade', daemon=True)
+                self.worker.start()
+            self.condition.notify()
+
+    def shutdown(self, timeout):
+        """停止接收新任务，当前提交评测完成后退出，最多等待timeout秒。返回是否按时退出"""
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            self.closed = True
+            if self.pending:
+                print(f"重新评测队列关闭，丢弃 {len(self.pending)} 个待评测题目: {list(self.pending)}")
+            self.pending.clear()
+            self.condition.notify_all()
+            while self.running is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    print(f"重新评测队列关闭超时，题目 {self.running} 未完成")
+                    return False
+                self.condition.wait(timeout=remaining)
+        return True
+
+    def status(self):
+        with self.condition:
+            return {
+                "pending": list(self.pending),
+                "running": self.running,
+                "progress": dict(self.progress),
+                "completed": self.completed,
+                "failed": self.failed
+            }
+
+    def _worker_loop(self):
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), WORKER_NICENESS)
+        except (AttributeError, OSError):
+            pass
+
+        while True:
+            with self.condition:
+                while not self.closed and not self.pending:
+                    self.condition.wait()
+                if self.closed:
+                    return
+                problem_id = self.pending.popleft()
+                self.running = problem_id
+
+            try:
+                self._regrade_problem(problem_id)
+                succeeded = True
+            except Exception as e:
+                print(f"后台重新评测失败: 题目ID={problem_id}, 错误: {e}")
+                succeeded = False
+            finally:
+                with self.condition:
+                    self.running = None
+                    self.progress = {}
+                    if succeeded:
+                        self.completed += 1
+                    else:
+                        self.failed += 1
+                    self.condition.notify_all()
+
+    def _regrade_problem(self, problem_id):
+        db_student = connect_db('student')
+        db_teacher = connect_db('teacher')
+        try:
+            test_cases = [dict(row) for row in load_test_cases(db_teacher, problem_id)]
+            submission_ids = [row['id'] for row in db_student.execute(
+                'SELECT id FROM Submission WHERE problem_id = ? ORDER BY id', (problem_id,)
+            ).fetchall()]
+            updated = rerun_total = 0
+            for index, submission_id in enumerate(submission_ids, start=1):
+                with self.condition:
+                    if self.closed:
+                        print(f"重新评测已中断: 题目ID={problem_id}, 完成 {index - 1}/{len(submission_ids)} 个提交")
+                        return
+                    self.progress = {"problem_id": problem_id, "done": index - 1, "total": len(submission_ids)}
+                rerun = self._regrade_submission(db_student, submission_id, test_cases, f"regrade:{problem_id}")
+                if rerun is not None:
+                    updated += 1
+                    rerun_total += rerun
+            print(f"重新评测完成: 题目ID={problem_id}, {len(submission_ids)} 个提交中更新 {updated} 个，"
+                  f"重新执行 {rerun_total} 个用例")
+        finally:
+            db_student.close()
+            db_teacher.close()
+
+    def _regrade_submission(self, db, submission_id, test_cases, owner):
+        """重新评测一个提交，结果有变化时写入并返回重新执行的用例数，否则返回None"""
+        submission = db.execute('SELECT code, test_details_json FROM Submission WHERE id = ?', (submission_id,)).fetchone()
+        if not submission:
+            return None
+        try:
+            details = json.loads(submission['test_details_json'] or '[]')
+        except json.JSONDecodeError:
+            details = []
+        if not isinstance(details, list):
+            details = []
+
+        while True:
+            try:
+                with execution_gate.slot(owner):
+                    graded, rerun = regrade_details(submission['code'], details, test_cases)
+                break
+            except ExecutorBusyError as e:
+                # 评测高峰期让出名额，稍后重试
+                time.sleep(e.retry_after)
+        metrics.REGRADE_CASES.inc(rerun, result='rerun')
+        metrics.REGRADE_CASES.inc(len(graded['details']) - rerun, result='reused')
+        if graded['details'] == details:
+            return None
+
+        # 代码相同才写入：评测期间学生重新提交时旧记录已被删除，这里不会覆盖新提交
+        db.execute(
+            '''UPDATE Submission SET passed_tests = ?, total_tests = ?, test_details_json = ?, grade_revision = grade_revision + 1
+               WHERE id = ? AND code = ?''',
+            (graded['passed'], graded['total'], json.dumps(graded['details'], ensure_ascii=False), submission_id, submission['code'])
+        )
+        db.commit()
+        return rerun
+
+regrade_queue = RegradeQueue()
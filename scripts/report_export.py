@@ -0,0 +1,146 @@
+"""
+批量导出题目下所有学生的PDF报告，打包为ZIP流式返回。
+
+使用提交时保存的评测结果和已缓存的AI评估，不重新执行代码，也不调用AI服务；
+内容未变化的报告直接从PDF磁盘缓存读取。
+报告并行生成，每完成一份就写入ZIP并立即发送，同时在途的报告数量有上限，
+因此内存占用与班级人数无关。
+"""
+import io
+import re
+import json
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from .config import PDF_EXPORT_WORKERS
+from .database import connect_db
+from .code_hash import generate_code_hash
+from .pdf_pool import render_pdf_report
+from .pdf_cache import render_cached_report
+
+# 尚未生成AI评估时报告中显示的内容
+MISSING_REVIEW = {"general_comment": "该提交尚未生成AI评估。", "strengths": [], "areas_for_improvement": [], "total_score": 0}
+
+class ZipStreamBuffer(io.RawIOBase):
+    """只追加的内存缓冲区，作为ZipFile的输出流；每写完一个文件就取走已写入的字节"""
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer.extend(data)
+        return len(data)
+
+    def drain(self):
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+def safe_filename(name):
+    """去除文件名中的非法字符"""
+    return re.sub(r'[\\/:*?"<>|\s]+', '_', str(name)).strip('_') or 'report'
+
+def stored_test_results(submission):
+    """从提交记录中保存的评测结果构建报告所需的测试结果"""
+    try:
+        details = json.loads(submission['test_details_json']) if submission['test_details_json'] else []
+    except (json.JSONDecodeError, TypeError):
+        details = []
+    return {
+        "passed": submission['passed_tests'] or 0,
+        "total": submission['total_tests'] or len(details),
+        "details": details
+    }
+
+def load_cached_review(db_teacher, submission):
+    """读取提交的教师端AI评估缓存：先按提交ID，再按学生和代码哈希查找"""
+    review = db_teacher.execute(
+        'SELECT review_data FROM TeacherAIReview WHERE submission_id = ? ORDER BY created_at DESC LIMIT 1',
+        (submission['id'],)
+    ).fetchone()
+    if not review:
+        review = db_teacher.execute(
+            'SELECT review_data FROM TeacherAIReview WHERE problem_id = ? AND student_id = ? AND code_hash = ? ORDER BY created_at DESC LIMIT 1',
+            (submission['problem_id'], submission['student_id'], generate_code_hash(submission['code']))
+        ).fetchone()
+    if not review:
+        return None
+    try:
+        review_data = json.loads(review['review_data'])
+        if isinstance(review_data, dict) and 'general_comment' in review_data:
+            return review_data
+    except (json.JSONDecodeError, TypeError):
+        pass
+    return {"general_comment": review['review_data'], "areas_for_improvement": [], "strengths": [], "total_score": 0, "raw_response": review['review_data']}
+
+def iter_report_jobs(problem_id):
+    """逐条读取题目下的提交，生成报告任务所需的数据"""
+    db_student = connect_db('student')
+    db_teacher = connect_db('teacher')
+    try:
+        submission_ids = [row['id'] for row in db_student.execute(
+            'SELECT id FROM Submission WHERE problem_id = ? ORDER BY student_id', (problem_id,)
+        ).fetchall()]
+        for submission_id in submission_ids:
+            submission = db_student.execute('SELECT * FROM Submission WHERE id = ?', (submission_id,)).fetchone()
+            if not submission:
+                continue
+            review = load_cached_review(db_teacher, submission) or MISSING_REVIEW
+            yield submission['student_id'], submission['code'], stored_test_results(submission), review
+    finally:
+        db_student.close()
+        db_teacher.close()
+
+def write_problem_booklet(problem, output_path):
+    """在渲染进程中调用：逐份读取提交，生成题目的合订本PDF"""
+    from .pdf_generator import generate_class_booklet
+    return generate_class_booklet(problem, iter_report_jobs(problem['id']), output_path)
+
+def render_report_cached(problem, code, test_results, review):
+    """优先从PDF缓存读取报告，未命中时渲染并写入缓存"""
+    _, path, pdf_bytes = render_cached_report(problem, code, test_results, review, render_pdf_report)
+    if pdf_bytes is not None:
+        return pdf_bytes
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except OSError:
+        # 读取前恰好被淘汰
+        return render_pdf_report(problem, code, test_results, review)
+
+def stream_problem_reports_zip(problem, render=render_report_cached, workers=PDF_EXPORT_WORKERS):
+    """并行生成题目下所有报告，按完成顺序写入ZIP，逐块产出ZIP字节"""
+    stream = ZipStreamBuffer()
+    title = safe_filename(problem['title'])
+    max_in_flight = workers * 2
+    jobs = iter_report_jobs(problem['id'])
+
+    with ThreadPoolExecutor(max_workers=workers) as executor, \
+            zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_STORED) as archive:
+        in_flight = {}
+        exhausted = False
+        while in_flight or not exhausted:
+            # 补充任务直到达到在途上限
+            while not exhausted and len(in_flight) < max_in_flight:
+                try:
+                    student_id, code, test_results, review = next(jobs)
+                except StopIteration:
+                    exhausted = True
+                    break
+                future = executor.submit(render, problem, code, test_results, review)
+                in_flight[future] = f"{title}_{safe_filename(student_id)}"
+
+            if not in_flight:
+                break
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = in_flight.pop(future)
+                try:
+                    archive.writestr(f"{name}.pdf", future.result())
+                except Exception as e:
+                    print(f"批量导出报告失败: {name}, 错误: {e}")
+                    archive.writestr(f"{name}.error.txt", f"PDF生成失败: {e}")
+                yield stream.drain()
+    # 写入ZIP中央目录
+    yield stream.drain()
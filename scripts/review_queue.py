@@ -0,0 +1,219 @@
+"""
+提交后在后台预生成教师端AI评估，教师打开提交时直接读取缓存。
+
+后台线程以较低优先级运行，并发数受限；学生请求密集(如上课提交高峰)时自动暂停，
+也可以通过接口手动暂停/恢复。
+"""
+import os
+import json
+import time
+import threading
+from collections import deque
+from .config import (
+    REVIEW_PRECOMPUTE_WORKERS, REVIEW_PRECOMPUTE_BUSY_THRESHOLD, REVIEW_PRECOMPUTE_BUSY_WINDOW
+)
+from .database import connect_db
+from .code_executor import execute_code_safely
+from .ai_service import build_prompt, call_llm_api, parse_ai_response, simulation_output_text
+from .code_hash import generate_code_hash
+
+# 后台线程的nice值(仅Linux下对单个线程生效)
+WORKER_NICENESS = 10
+
+class ReviewPrecomputeQueue:
+    """教师端AI评估预生成队列"""
+    def __init__(self, max_workers, busy_threshold, busy_window):
+        self.max_workers = max_workers
+        self.busy_threshold = busy_threshold
+        self.busy_window = busy_window
+        self.pending = deque()
+        self.running = {}
+        self.student_requests = deque()
+        self.paused = False
+        self.closed = False
+        self.workers = []
+        self.completed = 0
+        self.failed = 0
+        self.condition = threading.Condition()
+
+    def enqueue(self, submission_id):
+        """加入一个待生成评估的提交"""
+        with self.condition:
+            if self.closed or submission_id in self.pending or submission_id in self.running:
+                return
+            self.pending.append(submission_id)
+            self._ensure_workers()
+            self.condition.notify()
+
+    def note_student_request(self):
+        """记录一次学生请求，用于判断是否处于高峰期"""
+        now = time.monotonic()
+        with self.condition:
+            self.student_requests.append(now)
+            self._trim_student_requests(now)
+
+    def pause(self):
+        with self.condition:
+            self.paused = True
+
+    def resume(self):
+        with self.condition:
+            self.paused = False
+            self.condition.notify_all()
+
+    def wait_for(self, submission_id, timeout):
+        """
+        请求线程需要某个提交的评估时调用：
+        若仍在排队则从队列移除(由请求线程自行生成)；若正在生成则等待其完成。
+        返回True表示已等待后台任务完成，可重新读取缓存。
+        """
+        try:
+            submission_id = int(submission_id)
+        except (TypeError, ValueError):
+            return False
+        with self.condition:
+            if submission_id in self.pending:
+                self.pending.remove(submission_id)
+                return False
+            event = self.running.get(submission_id)
+        if event is None:
+            return False
+        return event.wait(timeout)
+
+    def shutdown(self, timeout):
+        """
+        停止接收新任务并丢弃排队中的任务(教师打开提交时会按需生成)，
+        等待正在生成的评估完成，最多等待timeout秒。返回是否全部完成。
+        """
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            self.closed = True
+            self.pending.clear()
+            self.condition.notify_all()
+            while self.running:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    print(f"AI评估预生成队列关闭超时，仍有 {len(self.running)} 个任务未完成")
+                    return False
+                self.condition.wait(timeout=remaining)
+        return True
+
+    def status(self):
+        with self.condition:
+            return {
+                "paused": self.paused,
+                "busy": self._is_busy(),
+                "pending": len(self.pending),
+                "running": len(self.running),
+                "completed": self.completed,
+                "failed": self.failed,
+                "max_workers": self.max_workers
+            }
+
+    def _trim_student_requests(self, now):
+        while self.student_requests and now - self.student_requests[0] > self.busy_window:
+            self.student_requests.popleft()
+
+    def _is_busy(self):
+        self._trim_student_requests(time.monotonic())
+        return len(self.student_requests) >= self.busy_threshold
+
+    def _ensure_workers(self):
+        # 线程在首次使用时启动，使每个工作进程拥有自己的后台线程
+        self.workers = [worker for worker in self.workers if worker.is_alive()]
+        while len(self.workers) < self.max_workers:
+            worker = threading.Thread(target=self._worker_loop, name='review-precompute', daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def _worker_loop(self):
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), WORKER_NICENESS)
+        except (AttributeError, OSError):
+            pass
+
+        while True:
+            with self.condition:
+                while not self.closed and (not self.pending or self.paused or self._is_busy()):
+                    # 高峰期定时醒来重新检查
+                    self.condition.wait(timeout=5)
+                if self.closed:
+                    return
+                submission_id = self.pending.popleft()
+                event = threading.Event()
+                self.running[submission_id] = event
+
+            try:
+                self._generate_review(submission_id)
+                succeeded = True
+            except Exception as e:
+                print(f"后台生成AI评估失败: 提交ID={submission_id}, 错误: {e}")
+                succeeded = False
+            finally:
+                with self.condition:
+                    del self.running[submission_id]
+                    event.set()
+                    self.condition.notify_all()
+
+            with self.condition:
+                if succeeded:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+
+    def _generate_review(self, submission_id):
+        """生成并保存一个提交的教师端AI评估"""
+        db_student = connect_db('student')
+        db_teacher = connect_db('teacher')
+        try:
+            submission = db_student.execute(
+                'SELECT id, problem_id, student_id, code, test_details_json FROM Submission WHERE id = ?', (submission_id,)
+            ).fetchone()
+            if not submission:
+                return
+
+            code = submission['code']
+            code_hash = generate_code_hash(code)
+            existing_review = db_teacher.execute(
+                'SELECT id FROM TeacherAIReview WHERE submission_id = ? AND code_hash = ? LIMIT 1',
+                (submission_id, code_hash)
+            ).fetchone()
+            if existing_review:
+                return
+
+            problem = db_teacher.execute(
+                'SELECT description_md FROM Problem WHERE id = ?', (submission['problem_id'],)
+            ).fetchone()
+            if not problem:
+                return
+
+            # 使用提交时保存的评测结果，没有时才重新执行代码
+            try:
+                test_details = json.loads(submission['test_details_json']) if submission['test_details_json'] else None
+            except json.JSONDecodeError:
+                test_details = None
+            simulation_result = execute_code_safely(code) if test_details is None else None
+            prompt = build_prompt('teacher', problem['description_md'], code, simulation_result, test_details=test_details)
+            llm_response_content = call_llm_api(prompt)
+            result_data = parse_ai_response('teacher', llm_response_content)
+            if result_data.get('fallback'):
+                # AI服务不可用时不缓存兜底结果，留给教师打开时重新生成
+                raise RuntimeError(result_data.get('general_comment', 'AI服务不可用'))
+
+            result_data['simulation_output'] = simulation_output_text(simulation_result, test_details)
+
+            cursor = db_teacher.cursor()
+            cursor.execute('DELETE FROM TeacherAIReview WHERE submission_id = ?', (submission_id,))
+            cursor.execute(
+                'INSERT INTO TeacherAIReview (problem_id, student_id, submission_id, code_hash, review_data) VALUES (?, ?, ?, ?, ?)',
+                (submission['problem_id'], submission['student_id'], submission_id, code_hash, json.dumps(result_data, ensure_ascii=False))
+            )
+            db_teacher.commit()
+            print(f"后台AI评估已生成: 题目ID={submission['problem_id']}, 学生ID={submission['student_id']}, 提交ID={submission_id}")
+        finally:
+            db_student.close()
+            db_teacher.close()
+
+review_queue = ReviewPrecomputeQueue(
+    REVIEW_PRECOMPUTE_WORKERS, REVIEW_PRECOMPUTE_BUSY_THRESHOLD, REVIEW_PRECOMPUTE_BUSY_WINDOW
+)
@@ -1,69 +1,117 @@
 import json
 import time
 import io
-import re
-import hashlib
+import os
+import tempfile
+from urllib.parse import quote
 from flask import Flask, request, jsonify, send_from_directory, Response, send_file, render_template
 from .database import get_db, query_db
-from .code_executor import execute_code_safely
-from .ai_service import build_prompt, call_llm_api
-from .pdf_generator import generate_pdf_report
-
-def normalize_code_for_hash(code):
+from .code_executor import execute_code_safely, execution_gate, ExecutorBusyError
+from .grading import load_test_cases, grade_code, replace_submissions, save_test_cases, prepare_test_cases, run_reference, case_timeout, content_key, CONTENT_FIELDS
+from .fixtures import store_stream, preview, FixtureTooLarge
+from .ai_service import build_prompt, call_llm_api, parse_ai_response, simulation_output_text
+from .code_hash import generate_code_hash
+from .config import REVIEW_PRECOMPUTE_ENABLED, LLM_REQUEST_TIMEOUT, SIMILARITY_REUSE_THRESHOLD, SIMILARITY_REPORT_THRESHOLD
+from .review_queue import review_queue
+from .regrade_queue import regrade_queue
+from .similarity import find_similar_submissions, similarity_report
+from .dashboard import load_student_dashboard
+from .http_cache import conditional_response, parse_db_timestamp, latest_timestamp
+from . import metrics
+# PDF渲染、批量导出和成绩册模块在首次使用时才导入，缩短工作进程的启动时间
+
+def load_stored_test_details(submission_id, code):
     """
-    标准化代码格式用于生成哈希值，去除空白字符和注释的差异
+    读取提交记录中已保存的评测结果。
+    仅当保存的代码与当前代码哈希一致时返回，否则返回None(需要重新执行)。
     """
-    if not code:
-        return ""
-    
-    # 移除单行注释
-    lines = code.split('\n')
-    normalized_lines = []
-    
-    for line in lines:
-        # 移除行尾注释（但保留字符串中的#）
-        in_string = False
-        escape_next = False
-        comment_start = -1
-        
-        for i, char in enumerate(line):
-            if escape_next:
-                escape_next = False
-                continue
-                
-            if char == '\\' and in_string:
-                escape_next = True
-                continue
-                
-            if char in ('"', "'") and not escape_next:
-                in_string = not in_string
-                continue
-                
-            if not in_string and char == '#' and comment_start == -1:
-                comment_start = i
-                break
-        
-        if comment_start >= 0:
-            line = line[:comment_start].rstrip()
-        
-        # 移除前后空白
-        line = line.strip()
-        if line:  # 只保留非空行
-            normalized_lines.append(line)
-    
-    # 重新组合并标准化空白
-    normalized_code = '\n'.join(normalized_lines)
-    return normalized_code
-
-def generate_code_hash(code):
+    if not submission_id:
+        return None
+    submission = query_db('SELECT code, test_details_json FROM Submission WHERE id = ?', (submission_id,), one=True)
+    if not submission or not submission['test_details_json']:
+        return None
+    if generate_code_hash(submission['code']) != generate_code_hash(code):
+        return None
+    try:
+        test_details = json.loads(submission['test_details_json'])
+    except (json.JSONDecodeError, TypeError):
+        return None
+    return test_details if isinstance(test_details, list) else None
+
+def is_reusable_review(review_data):
+    """完整的教师端评估才可复用：兜底结果、解析失败(带raw_response)和缺少评分的记录不提供给相似提交"""
+    return (isinstance(review_data, dict) and 'general_comment' in review_data and 'total_score' in review_data
+            and not review_data.get('fallback') and 'raw_response' not in review_data)
+
+def stored_test_outcome(submission_id, code=None):
     """
-    生成代码的标准化哈希值
+    读取提交记录保存的评测结论：(通过数, 总数, 各用例状态)。
+    传入code时要求保存的代码与之哈希一致；没有可用结果时返回None。
     """
-    normalized_code = normalize_code_for_hash(code)
-    return hashlib.md5(normalized_code.encode('utf-8')).hexdigest()
+    submission = query_db('SELECT code, passed_tests, total_tests, test_details_json FROM Submission WHERE id = ?', (submission_id,), one=True)
+    if not submission or submission['total_tests'] is None:
+        return None
+    if code is not None and generate_code_hash(submission['code']) != generate_code_hash(code):
+        return None
+    try:
+        test_details = json.loads(submission['test_details_json'] or '[]')
+    except (json.JSONDecodeError, TypeError):
+        return None
+    if not isinstance(test_details, list):
+        return None
+    return (submission['passed_tests'], submission['total_tests'], [detail.get('status') for detail in test_details])
+
+def find_similar_review(problem_id, code, submission_id):
+    """
+    查找相似度达到阈值且已有教师端AI评估的其他提交，返回可直接响应的数据。
+    只复用评测结论(通过数、总数和各用例状态)与当前提交完全一致的提交的评估。
+    """
+    try:
+        exclude_id = int(submission_id)
+    except (TypeError, ValueError):
+        return None
+    outcome = stored_test_outcome(exclude_id, code)
+    if outcome is None:
+        return None
+    matches = find_similar_submissions(get_db('student'), problem_id, code, SIMILARITY_REUSE_THRESHOLD, exclude_id)
+    for match in matches:
+        if stored_test_outcome(match['submission_id']) != outcome:
+            continue
+        review = query_db(
+            'SELECT review_data FROM TeacherAIReview WHERE submission_id = ? ORDER BY created_at DESC LIMIT 1',
+            (match['submission_id'],), one=True, db_type='teacher'
+        )
+        if not review:
+            continue
+        try:
+            review_data = json.loads(review['review_data'])
+        except (json.JSONDecodeError, TypeError):
+            continue
+        if is_reusable_review(review_data):
+            similarity = int(match['similarity'] * 100)
+            return {
+                "status": "success",
+                "data": review_data,
+                "message": f"找到相似提交(学生ID={match['student_id']}，相似度{similarity}%)的AI评估",
+                "cached": True,
+                "similar_to": match
+            }
+    return None
+
+def execution_owner(data):
+    """执行排队时用于按学生轮转的标识：优先使用学号，否则使用客户端地址"""
+    student_id = str(data.get('student_id') or '').strip()
+    return f"student:{student_id}" if student_id else f"addr:{request.remote_addr}"
 
 def register_routes(app):
     """注册所有路由"""
+
+    @app.errorhandler(ExecutorBusyError)
+    def executor_busy(error):
+        """代码执行队列已满或排队超时：快速返回429，提示客户端稍后重试"""
+        response = jsonify({"status": "error", "message": str(error), "retry_after": error.retry_after})
+        response.headers['Retry-After'] = str(error.retry_after)
+        return response, 429
     
     @app.route('/favicon.ico')
     def favicon():
@@ -85,8 +133,17 @@ def register_routes(app):
     @app.route('/api/problems', methods=['GET'])
     def get_problems():
         """获取所有题目列表"""
-        problems = query_db('SELECT id, title FROM Problem ORDER BY created_at DESC', db_type='teacher')
-        return jsonify([dict(row) for row in problems])
+        # 题目数量、最大ID和版本号之和覆盖了新增、删除和修改
+        version = query_db(
+            'SELECT COUNT(*) AS count, MAX(id) AS max_id, SUM(revision) AS revisions, MAX(updated_at) AS updated_at FROM Problem',
+            one=True, db_type='teacher'
+        )
+        etag = f"problems-{version['count']}-{version['max_id']}-{version['revisions']}"
+
+        def build():
+            problems = query_db('SELECT id, title FROM Problem ORDER BY created_at DESC', db_type='teacher')
+            return jsonify([dict(row) for row in problems])
+        return conditional_response(etag, parse_db_timestamp(version['updated_at']), build)
 
     @app.route('/api/submission/<int:submission_id>', methods=['DELETE'])
     def delete_submission(submission_id):
@@ -99,6 +156,7 @@ def register_routes(app):
             return jsonify({"status": "error", "message": "提交记录不存在"}), 404
         
         cursor.execute('DELETE FROM Submission WHERE id = ?', (submission_id,))
+        cursor.execute('DELETE FROM SubmissionFingerprint WHERE submission_id = ?', (submission_id,))
         db.commit()
         
         return jsonify({"status": "success", "message": "提交记录已删除"})
@@ -106,13 +164,18 @@ def register_routes(app):
     @app.route('/api/problems/<int:problem_id>', methods=['GET'])
     def get_problem(problem_id):
         """获取指定题目详情"""
-        problem = query_db('SELECT * FROM Problem WHERE id = ?', (problem_id,), one=True, db_type='teacher')
-        if problem:
+        version = query_db('SELECT revision, updated_at FROM Problem WHERE id = ?', (problem_id,), one=True, db_type='teacher')
+        if not version:
+            return jsonify({"error": "Problem not found"}), 404
+
+        def build():
+            problem = query_db('SELECT * FROM Problem WHERE id = ?', (problem_id,), one=True, db_type='teacher')
             problem_data = dict(problem)
-            test_cases = query_db('SELECT * FROM TestCase WHERE problem_id = ?', (problem_id,), db_type='teacher')
-            problem_data['test_cases'] = [dict(row) for row in test_cases]
+            problem_data['has_reference'] = bool(problem_data.pop('reference_code'))
+            test_cases = load_test_cases(get_db('teacher'), problem_id)
+            problem_data['test_cases'] = [{**dict(row), "time_limit": case_timeout(row)} for row in test_cases]
             return jsonify(problem_data)
-        return jsonify({"error": "Problem not found"}), 404
+        return conditional_response(f"problem-{problem_id}-r{version['revision']}", parse_db_timestamp(version['updated_at']), build)
 
     @app.route('/api/problems', methods=['POST'], defaults={'problem_id': None})
     @app.route('/api/problems/<int:problem_id>', methods=['POST'])
@@ -125,24 +188,71 @@ def register_routes(app):
         
         if not title or not description_md:
             return jsonify({"status": "error", "message": "题目名称和描述不能为空"}), 400
+        try:
+            test_cases = prepare_test_cases(test_cases)
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+
+        # 未提供reference_code时保留原有的参考解答
+        existing = query_db('SELECT reference_code FROM Problem WHERE id = ?', (problem_id,), one=True, db_type='teacher') if problem_id else None
+        reference_code = data['reference_code'] if 'reference_code' in data else (existing['reference_code'] if existing else None)
+        reference_code = reference_code if reference_code and reference_code.strip() else None
+        reference_report = None
+        if reference_code:
+            # 参考解答未修改时，内容未变化的用例沿用已记录的用时，不再运行
+            known_times = {}
+            if existing and existing['reference_code'] == reference_code:
+                known_times = {content_key(row): row['reference_time'] for row in query_db(
+                    f"SELECT {', '.join(CONTENT_FIELDS)}, reference_time FROM TestCase WHERE problem_id = ? AND reference_time IS NOT NULL",
+                    (problem_id,), db_type='teacher'
+                )}
+            with execution_gate.slot(execution_owner(data)):
+                test_cases, reference_report = run_reference(reference_code, test_cases, known_times)
+        else:
+            test_cases = [{**tc, "reference_time": None} for tc in test_cases]
         
         db = get_db('teacher')
         cursor = db.cursor()
         
         if problem_id:
-            cursor.execute('UPDATE Problem SET title = ?, description_md = ? WHERE id = ?', (title, description_md, problem_id))
-            cursor.execute('DELETE FROM TestCase WHERE problem_id = ?', (problem_id,))
+            cursor.execute(
+                'UPDATE Problem SET title = ?, description_md = ?, reference_code = ?, revision = revision + 1, updated_at = CURRENT_TIMESTAMP WHERE id = ?',
+                (title, description_md, reference_code, problem_id)
+            )
         else:
-            cursor.execute('INSERT INTO Problem (title, description_md) VALUES (?, ?)', (title, description_md))
+            cursor.execute(
+                'INSERT INTO Problem (title, description_md, reference_code, updated_at) VALUES (?, ?, ?, CURRENT_TIMESTAMP)',
+                (title, description_md, reference_code)
+            )
             problem_id = cursor.lastrowid
         
-        for tc in test_cases:
-            input_data = tc.get('input_data', '')
-            expected_output = tc.get('expected_output', '')
-            cursor.execute('INSERT INTO TestCase (problem_id, input_data, expected_output) VALUES (?, ?, ?)', (problem_id, input_data, expected_output))
-        
+        # 只改动有变化的测试用例，未变化的用例保留原ID
+        cases_changed = save_test_cases(cursor, problem_id, test_cases)
         db.commit()
-        return jsonify({"status": "success", "problem_id": problem_id})
+
+        # 测试用例有变化时在后台重新评测已有提交(只执行新增和修改过的用例)
+        regrading = cases_changed and query_db('SELECT 1 FROM Submission WHERE problem_id = ? LIMIT 1', (problem_id,), one=True) is not None
+        if regrading:
+            regrade_queue.enqueue(problem_id)
+        return jsonify({"status": "success", "problem_id": problem_id, "regrading": regrading, "reference": reference_report})
+
+    @app.route('/api/problems/<int:problem_id>/reference', methods=['GET'])
+    def get_problem_reference(problem_id):
+        """获取题目的参考解答(题目详情接口不返回参考解答，避免发送给学生端)"""
+        problem = query_db('SELECT reference_code FROM Problem WHERE id = ?', (problem_id,), one=True, db_type='teacher')
+        if not problem:
+            return jsonify({"status": "error", "message": "题目不存在"}), 404
+        return jsonify({"status": "success", "data": {"reference_code": problem['reference_code'] or ''}})
+
+    @app.route('/api/fixtures', methods=['POST'])
+    def upload_fixture():
+        """上传测试数据文件(请求体为文件内容，或multipart表单的file字段)，返回文件标识和开头部分"""
+        stream = request.files['file'].stream if 'file' in request.files else request.stream
+        try:
+            ref, size = store_stream(stream)
+        except FixtureTooLarge as e:
+            return jsonify({"status": "error", "message": str(e)}), 413
+        return jsonify({"status": "success", "data": {"ref": ref, "size": size, "preview": preview(ref)}})
 
     @app.route('/api/problems/<int:problem_id>', methods=['DELETE'])
     def delete_problem(problem_id):
@@ -156,65 +266,33 @@ def register_routes(app):
     @app.route('/api/test/<int:problem_id>', methods=['POST'])
     def test_code(problem_id):
         """测试代码执行结果(不保存)"""
+        review_queue.note_student_request()
         data = request.get_json()
         code = data.get('code', '')
         if not code:
             return jsonify({"status": "error", "message": "代码不能为空"}), 400
 
-        test_cases = query_db('SELECT * FROM TestCase WHERE problem_id = ?', (problem_id,), db_type='teacher')
-        results = []
-        passed = 0
-        total = len(test_cases) if test_cases else 1
-
-        if not test_cases:
-            # 无测试用例时检查代码是否能正常运行
-            result = execute_code_safely(code)
-            is_passed = result['returncode'] == 0 and not result['stderr']
-            results.append({"case": 1, "status": "passed" if is_passed else "failed", "input": "无", "expected_output": "无错误执行", "actual_output": result.get('stdout', ''), "stderr": result.get('stderr', '')})
-            if is_passed: passed = 1
-        else:
-            # 执行所有测试用例
-            for i, tc in enumerate(test_cases, start=1):
-                input_data = tc['input_data']
-                expected = tc['expected_output'].strip()
-                result = execute_code_safely(code, input_data)
-                output = result.get('stdout', '').strip()
-                is_correct = (result['returncode'] == 0 and not result['stderr'] and output == expected)
-                status = 'passed' if is_correct else 'failed'
-                if is_correct: passed += 1
-                results.append({"case": i, "status": status, "input": input_data, "expected_output": expected, "actual_output": output, "stderr": result.get('stderr', '')})
-
-        return jsonify({"status": "success", "data": {"passed": passed, "total": total, "details": results}})
+        test_cases = load_test_cases(get_db('teacher'), problem_id)
+        # 整个评测占用一个执行名额(各测试用例依次执行)，繁忙时由错误处理返回429
+        with execution_gate.slot(execution_owner(data)):
+            graded = grade_code(code, test_cases)
+
+        return jsonify({"status": "success", "data": graded})
 
     @app.route('/api/submit/<int:problem_id>', methods=['POST'])
     def submit_code(problem_id):
         """提交代码并保存结果"""
+        review_queue.note_student_request()
         data = request.get_json()
         code = data.get('code', '')
         student_id = data.get('student_id', None)
         if not code:
             return jsonify({"status": "error", "message": "代码不能为空"}), 400
 
-        test_cases = query_db('SELECT * FROM TestCase WHERE problem_id = ?', (problem_id,), db_type='teacher')
-        results = []
-        passed = 0
-        total = len(test_cases) if test_cases else 1
-
-        if not test_cases:
-            result = execute_code_safely(code)
-            is_passed = result['returncode'] == 0 and not result['stderr']
-            results.append({"case": 1, "status": "passed" if is_passed else "failed", "input": "无", "expected_output": "无错误执行", "actual_output": result.get('stdout', ''), "stderr": result.get('stderr', '')})
-            if is_passed: passed = 1
-        else:
-            for i, tc in enumerate(test_cases, start=1):
-                input_data = tc['input_data']
-                expected = tc['expected_output'].strip()
-                result = execute_code_safely(code, input_data)
-                output = result.get('stdout', '').strip()
-                is_correct = (result['returncode'] == 0 and not result['stderr'] and output == expected)
-                status = 'passed' if is_correct else 'failed'
-                if is_correct: passed += 1
-                results.append({"case": i, "status": status, "input": input_data, "expected_output": expected, "actual_output": output, "stderr": result.get('stderr', '')})
+        test_cases = load_test_cases(get_db('teacher'), problem_id)
+        # 整个评测占用一个执行名额(各测试用例依次执行)，繁忙时由错误处理返回429
+        with execution_gate.slot(execution_owner(data)):
+            graded = grade_code(code, test_cases)
 
         db = get_db()
         cursor = db.cursor()
@@ -223,37 +301,18 @@ def register_routes(app):
         else:
             student_id_placeholder = student_id.strip()
         
-        # 检查是否存在该学生对同一题目的旧提交记录，如果存在则删除
-        cursor.execute(
-            'SELECT id FROM Submission WHERE problem_id = ? AND student_id = ?',
-            (problem_id, student_id_placeholder)
-        )
-        existing_submissions = cursor.fetchall()
-        
-        if existing_submissions:
-            # 删除该学生对同一题目的所有旧提交记录
-            cursor.execute(
-                'DELETE FROM Submission WHERE problem_id = ? AND student_id = ?',
-                (problem_id, student_id_placeholder)
-            )
-            # 同时删除相关的AI评审记录
-            for submission in existing_submissions:
-                cursor.execute(
-                    'DELETE FROM StudentAIReview WHERE submission_id = ?',
-                    (submission['id'],)
-                )
-        
-        cursor.execute(
-            'INSERT INTO Submission (problem_id, student_id, code, passed_tests, total_tests, test_details_json) VALUES (?, ?, ?, ?, ?, ?)',
-            (problem_id, student_id_placeholder, code, passed, total, json.dumps(results, ensure_ascii=False))
-        )
-        submission_id = cursor.lastrowid  # 获取新提交的ID
+        # 删除该学生对同一题目的旧提交记录(及相关AI评审记录和相似度指纹)后保存新提交
+        submission_id = replace_submissions(cursor, problem_id, [(student_id_placeholder, code, graded)])[student_id_placeholder]
         db.commit()
         
+        # 提交成功后在后台预生成教师端AI评估
+        if REVIEW_PRECOMPUTE_ENABLED:
+            review_queue.enqueue(submission_id)
+        
         return jsonify({
             "status": "success",
             "submission_id": submission_id,  # 返回submission_id
-            "data": {"passed": passed, "total": total, "details": results}
+            "data": graded
         })
 
     @app.route('/api/submissions/<int:problem_id>', methods=['GET'])
@@ -280,20 +339,27 @@ def register_routes(app):
     @app.route('/api/submission/<int:submission_id>', methods=['GET'])
     def get_submission_detail(submission_id):
         """获取提交记录详情"""
-        submission = query_db('SELECT * FROM Submission WHERE id = ?', (submission_id,), one=True, db_type='student')
+        # 重新提交会生成新ID，测试用例修改后的重新评测会递增grade_revision，响应中的题目信息随题目版本变化
+        submission = query_db('SELECT problem_id, submitted_at, grade_revision FROM Submission WHERE id = ?', (submission_id,), one=True, db_type='student')
         if not submission:
             return jsonify({"error": "Submission not found"}), 404
         
-        problem = query_db('SELECT title, description_md FROM Problem WHERE id = ?', (submission['problem_id'],), one=True, db_type='teacher')
+        problem = query_db('SELECT title, description_md, revision, updated_at FROM Problem WHERE id = ?', (submission['problem_id'],), one=True, db_type='teacher')
         if not problem:
             return jsonify({"error": "Associated problem not found"}), 404
 
-        return jsonify({
-            "code": submission['code'],
-            "test_details": json.loads(submission['test_details_json']),
-            "problem_title": problem['title'],
-            "problem_description": problem['description_md']
-        })
+        def build():
+            detail = query_db('SELECT code, test_details_json FROM Submission WHERE id = ?', (submission_id,), one=True, db_type='student')
+            return jsonify({
+                "code": detail['code'],
+                "test_details": json.loads(detail['test_details_json']),
+                "problem_title": problem['title'],
+                "problem_description": problem['description_md']
+            })
+        etag = f"submission-{submission_id}-g{submission['grade_revision']}-p{problem['revision']}"
+        # 重新评测没有记录时间，重新评测过的提交只用ETag验证
+        last_modified = None if submission['grade_revision'] else latest_timestamp(submission['submitted_at'], problem['updated_at'])
+        return conditional_response(etag, last_modified, build)
 
     @app.route('/api/review', methods=['POST'])
     def review_code():
@@ -328,6 +394,13 @@ def register_routes(app):
                 'SELECT review_data FROM TeacherAIReview WHERE submission_id = ? ORDER BY created_at DESC LIMIT 1',
                 (submission_id,), one=True, db_type='teacher'
             )
+            # 后台正在预生成该提交的评估时，等待其完成后再读取缓存
+            if not existing_review and review_queue.wait_for(submission_id, LLM_REQUEST_TIMEOUT):
+                existing_review = query_db(
+                    'SELECT review_data FROM TeacherAIReview WHERE submission_id = ? ORDER BY created_at DESC LIMIT 1',
+                    (submission_id,), one=True, db_type='teacher'
+                )
+            metrics.record_cache('teacher_review', bool(existing_review))
             if existing_review:
                 try:
                     review_data = json.loads(existing_review['review_data'])
@@ -342,7 +415,7 @@ def register_routes(app):
         else:
             # 学生端：不使用缓存，每次都生成新的辅导内容
             # 这样可以确保学生每次提问都能得到针对性的回答
-            pass
+            review_queue.note_student_request()
 
         problem = query_db('SELECT * FROM Problem WHERE id = ?', (problem_id,), one=True, db_type='teacher')
         if not problem:
@@ -354,50 +427,42 @@ def register_routes(app):
             if not submission:
                 return jsonify({"status": "error", "message": "提交记录不存在"}), 400
             student_id = submission['student_id']
+
+            # 查找已有AI评估的近似重复提交，提供给教师直接参考(可通过force_new重新生成)
+            if not data.get('force_new'):
+                similar_review = find_similar_review(problem_id, code, submission_id)
+                metrics.record_cache('similar_review', bool(similar_review))
+                if similar_review:
+                    return jsonify(similar_review)
         else:
             # 学生端使用临时ID
             student_id = 'student_question'
 
-        simulation_result = execute_code_safely(code)
-        prompt = build_prompt(role, problem['description_md'], code, simulation_result, user_input=user_input)
+        # 优先使用提交时保存的评测结果，只有没有对应结果时才重新执行代码
+        if role == 'teacher':
+            stored_submission_id = submission_id
+        else:
+            latest = query_db(
+                'SELECT id FROM Submission WHERE problem_id = ? AND student_id = ? ORDER BY submitted_at DESC LIMIT 1',
+                (problem_id, str(data.get('student_id', '')).strip()), one=True
+            )
+            stored_submission_id = latest['id'] if latest else None
+        test_details = load_stored_test_details(stored_submission_id, code)
+        metrics.record_cache('stored_test_results', test_details is not None)
+        simulation_result = None
+        if test_details is None:
+            with execution_gate.slot(execution_owner(data)):
+                simulation_result = execute_code_safely(code)
+
+        prompt = build_prompt(role, problem['description_md'], code, simulation_result, user_input=user_input, test_details=test_details)
         llm_response_content = call_llm_api(prompt)
 
-        try:
-            result_data = json.loads(llm_response_content)
-            if not isinstance(result_data, dict):
-                raise ValueError("AI返回的不是有效的JSON对象")
-            
-            # 根据角色检查必要的字段
-            if role == 'teacher':
-                if 'general_comment' not in result_data:
-                    result_data['general_comment'] = "AI评估完成，但缺少总体评价。"
-            else:  # student
-                # 学生端需要检查不同的字段
-                if 'explanation' not in result_data:
-                    result_data['explanation'] = "AI辅导完成，但缺少解释。"
-                if 'hint_or_snippet' not in result_data:
-                    result_data['hint_or_snippet'] = ""
-                if 'next_step_question' not in result_data:
-                    result_data['next_step_question'] = ""
-                    
-        except (json.JSONDecodeError, ValueError) as e:
-            print(f"AI响应解析失败: {e}")
-            # 当AI无法响应JSON格式时，返回原始内容
-            if role == 'teacher':
-                result_data = {
-                    "general_comment": llm_response_content,
-                    "raw_response": llm_response_content,
-                    "strengths": [], "areas_for_improvement": [], "total_score": 0
-                }
-            else:  # student
-                result_data = {
-                    "explanation": llm_response_content,
-                    "hint_or_snippet": "",
-                    "next_step_question": "",
-                    "raw_response": llm_response_content
-                }
+        result_data = parse_ai_response(role, llm_response_content)
         
-        result_data['simulation_output'] = f"标准输出(stdout):\n{simulation_result['stdout']}\n\n标准错误(stderr):\n{simulation_result['stderr']}"
+        result_data['simulation_output'] = simulation_output_text(simulation_result, test_details)
+        if result_data.get('fallback'):
+            # AI服务不可用时不保存兜底结果，下次请求时重新生成
+            return jsonify({"status": "success", "data": result_data, "message": "AI服务暂时不可用", "cached": False})
         
         # 根据角色保存到不同的数据库表
         if role == 'teacher':
@@ -453,31 +518,83 @@ def register_routes(app):
     @app.route('/api/review/<int:submission_id>', methods=['GET'])
     def get_review_by_submission(submission_id):
         """根据提交ID获取AI评审结果"""
+        # 评审重新生成时会写入新行，因此用行ID作为版本；先只查版本，命中缓存时不读取评审内容
         # 首先从teacher数据库查找
+        source, db_type, table = 't', 'teacher', 'TeacherAIReview'
         review = query_db(
-            'SELECT review_data FROM TeacherAIReview WHERE submission_id = ? ORDER BY created_at DESC LIMIT 1',
+            'SELECT id, created_at FROM TeacherAIReview WHERE submission_id = ? ORDER BY created_at DESC LIMIT 1',
             (submission_id,), one=True, db_type='teacher'
         )
         if not review:
             # 如果teacher数据库中没有，再从student数据库查找
+            source, db_type, table = 's', 'student', 'StudentAIReview'
             review = query_db(
-                'SELECT review_data FROM StudentAIReview WHERE submission_id = ? ORDER BY created_at DESC LIMIT 1',
+                'SELECT id, created_at FROM StudentAIReview WHERE submission_id = ? ORDER BY created_at DESC LIMIT 1',
                 (submission_id,), one=True, db_type='student'
             )
         
-        if review:
+        if not review:
+            # 如果没有找到，返回空数据，前端可以据此显示空白
+            return conditional_response(f"review-{submission_id}-none", None, lambda: jsonify({"status": "success", "data": None}))
+
+        def build():
+            row = query_db(f'SELECT review_data FROM {table} WHERE id = ?', (review['id'],), one=True, db_type=db_type)
             try:
-                review_data = json.loads(review['review_data'])
+                review_data = json.loads(row['review_data'])
                 return jsonify({"status": "success", "data": review_data})
             except (json.JSONDecodeError, TypeError):
                 return jsonify({"status": "error", "message": "存储的评审数据格式错误"}), 500
-        else:
-            # 如果没有找到，返回空数据，前端可以据此显示空白
-            return jsonify({"status": "success", "data": None})
+        etag = f"review-{submission_id}-{source}{review['id']}"
+        return conditional_response(etag, parse_db_timestamp(review['created_at']), build)
+
+    @app.route('/api/similarity/<int:problem_id>', methods=['GET'])
+    def get_similarity_report(problem_id):
+        """获取题目内近似重复提交的相似度报告"""
+        threshold = request.args.get('threshold', SIMILARITY_REPORT_THRESHOLD, type=float)
+        report = similarity_report(get_db('student'), problem_id, threshold)
+        return jsonify({"status": "success", "data": report})
+
+    @app.route('/api/executor_status', methods=['GET'])
+    def get_executor_status():
+        """获取代码执行准入控制状态(当前工作进程)：运行数、排队数、等待时间和拒绝次数"""
+        return jsonify({"status": "success", "data": execution_gate.status()})
+
+    @app.route('/api/problems/<int:problem_id>/regrade', methods=['POST'])
+    def regrade_problem(problem_id):
+        """在后台按当前测试用例重新评测题目的所有提交(结果未受影响的用例不重复执行)"""
+        if not query_db('SELECT 1 FROM Problem WHERE id = ?', (problem_id,), one=True, db_type='teacher'):
+            return jsonify({"status": "error", "message": "题目不存在"}), 404
+        regrade_queue.enqueue(problem_id)
+        return jsonify({"status": "success", "message": "已加入后台重新评测队列"})
+
+    @app.route('/api/regrade_queue', methods=['GET'])
+    def get_regrade_queue_status():
+        """获取后台重新评测队列状态(当前工作进程)"""
+        return jsonify({"status": "success", "data": regrade_queue.status()})
+
+    @app.route('/api/review_queue', methods=['GET'])
+    def get_review_queue_status():
+        """获取后台AI评估预生成队列状态"""
+        return jsonify({"status": "success", "data": {"enabled": REVIEW_PRECOMPUTE_ENABLED, **review_queue.status()}})
+
+    @app.route('/api/review_queue/pause', methods=['POST'])
+    def pause_review_queue():
+        """暂停后台AI评估预生成"""
+        review_queue.pause()
+        return jsonify({"status": "success", "message": "后台AI评估预生成已暂停"})
+
+    @app.route('/api/review_queue/resume', methods=['POST'])
+    def resume_review_queue():
+        """恢复后台AI评估预生成"""
+        review_queue.resume()
+        return jsonify({"status": "success", "message": "后台AI评估预生成已恢复"})
 
     @app.route('/api/export_pdf', methods=['POST'])
     def export_pdf():
         """导出PDF评审报告"""
+        from .pdf_pool import render_pdf_report
+        from .pdf_cache import render_cached_report
+        from .report_export import stored_test_results
         try:
             # 获取请求数据
             data = request.get_json()
@@ -490,33 +607,26 @@ def register_routes(app):
             if not problem:
                 return jsonify({"status": "error", "message": "题目不存在"}), 400
             
-            test_cases = query_db('SELECT * FROM TestCase WHERE problem_id = ?', (problem_id,), db_type='teacher')
-            test_details = []
-            passed_count = 0
-            total_count = len(test_cases) if test_cases else 1
-            
-            if test_cases:
-                for i, tc in enumerate(test_cases, start=1):
-                    input_data = tc['input_data']
-                    expected = tc['expected_output'].strip()
-                    result = execute_code_safely(code, input_data)
-                    output = result.get('stdout', '').strip()
-                    status = 'passed' if result['returncode'] == 0 and output == expected else 'failed'
-                    if status == 'passed': passed_count += 1
-                    test_details.append({"case": i, "status": status, "input": input_data, "expected_output": expected, "actual_output": output})
-            else:
-                result = execute_code_safely(code)
-                status = 'passed' if result['returncode'] == 0 and not result['stderr'] else 'failed'
-                if status == 'passed': passed_count = 1
-                test_details.append({"case": 1, "status": status, "input": "N/A", "expected_output": "No Error", "actual_output": result['stdout']})
-            
-            test_results = {"passed": passed_count, "total": total_count, "details": test_details}
-            
-            # 尝试从缓存获取AI评估报告
             code_hash = generate_code_hash(code)
             student_id = data.get('student_id', 'anonymous')
             if not student_id or student_id.strip() == '':
                 student_id = 'anonymous'
+
+            # 优先使用该学生提交时保存的评测结果(代码相同时)，报告缓存键随之稳定，命中缓存时无需执行代码；
+            # 没有保存结果时按提交评测的逻辑重新评测，占用导出者的执行名额
+            submission = query_db(
+                'SELECT * FROM Submission WHERE problem_id = ? AND student_id = ? ORDER BY submitted_at DESC LIMIT 1',
+                (problem_id, student_id), one=True
+            )
+            stored = bool(submission and submission['test_details_json'] and generate_code_hash(submission['code']) == code_hash)
+            metrics.record_cache('stored_test_results', stored)
+            if stored:
+                test_results = stored_test_results(submission)
+            else:
+                test_cases = load_test_cases(get_db('teacher'), problem_id)
+                with execution_gate.slot(execution_owner(data)):
+                    test_results = grade_code(code, test_cases)
+            test_details = test_results['details']
             
             # PDF导出是教师端功能，应该查询teacher数据库的TeacherAIReview表
             cached_review = query_db(
@@ -534,78 +644,162 @@ def register_routes(app):
                 except (json.JSONDecodeError, TypeError):
                     # 如果解析失败，使用原始内容作为general_comment
                     ai_review = {"general_comment": cached_review['review_data'], "areas_for_improvement": [], "strengths": [], "total_score": 0, "raw_response": cached_review['review_data']}
+                if ai_review.get('fallback'):
+                    # 早期保存的兜底结果不再使用，重新生成
+                    ai_review = None
             
             # 如果没有找到缓存，自动运行AI评估
             if not ai_review:
                 print(f"未找到缓存的AI评估结果，自动运行AI评估: 题目ID={problem_id}, 学生ID={student_id}")
                 
-                # 运行代码模拟
-                simulation_result = execute_code_safely(code)
-                
-                # 构建AI评估提示
-                prompt = build_prompt('teacher', problem['description_md'], code, simulation_result)
+                # 直接使用上面刚得到的评测结果构建AI评估提示，无需再次运行代码
+                prompt = build_prompt('teacher', problem['description_md'], code, test_details=test_details)
                 
                 # 调用AI API获取评估结果
                 llm_response_content = call_llm_api(prompt)
                 
-                try:
-                    # 解析AI响应
-                    ai_review = json.loads(llm_response_content)
-                    if not isinstance(ai_review, dict):
-                        raise ValueError("AI返回的不是有效的JSON对象")
-                    
-                    # 确保有必要的字段
-                    if 'general_comment' not in ai_review:
-                        ai_review['general_comment'] = "AI评估完成，但缺少总体评价。"
-                        
-                except (json.JSONDecodeError, ValueError) as e:
-                    print(f"AI响应解析失败: {e}")
-                    # 当AI无法响应JSON格式时，返回原始内容
-                    ai_review = {
-                        "general_comment": llm_response_content,
-                        "raw_response": llm_response_content,
-                        "strengths": [], "areas_for_improvement": [], "total_score": 0
-                    }
+                # 解析AI响应
+                ai_review = parse_ai_response('teacher', llm_response_content)
                 
                 # 添加模拟输出到评估结果
-                ai_review['simulation_output'] = f"标准输出(stdout):\n{simulation_result['stdout']}\n\n标准错误(stderr):\n{simulation_result['stderr']}"
+                ai_review['simulation_output'] = simulation_output_text(test_details=test_details)
                 
-                # 保存AI评估结果到缓存，以便后续使用
-                try:
-                    # 尝试获取该学生对这个题目的最新提交记录的ID
-                    db_student = get_db('student')
-                    cursor_student = db_student.cursor()
-                    cursor_student.execute(
-                        'SELECT id FROM Submission WHERE problem_id = ? AND student_id = ? ORDER BY submitted_at DESC LIMIT 1',
-                        (problem_id, student_id)
-                    )
-                    latest_submission = cursor_student.fetchone()
-                    submission_id_to_use = latest_submission['id'] if latest_submission else None
+                # 保存AI评估结果到缓存，以便后续使用(AI服务不可用时的兜底结果不保存)
+                if ai_review.get('fallback'):
+                    print(f"AI服务不可用，本次报告不缓存: 题目ID={problem_id}, 学生ID={student_id}")
+                else:
+                    try:
+                        # 尝试获取该学生对这个题目的最新提交记录的ID
+                        db_student = get_db('student')
+                        cursor_student = db_student.cursor()
+                        cursor_student.execute(
+                            'SELECT id FROM Submission WHERE problem_id = ? AND student_id = ? ORDER BY submitted_at DESC LIMIT 1',
+                            (problem_id, student_id)
+                        )
+                        latest_submission = cursor_student.fetchone()
+                        submission_id_to_use = latest_submission['id'] if latest_submission else None
                     
-                    db = get_db('teacher')
-                    cursor = db.cursor()
-                    cursor.execute(
-                        'INSERT INTO TeacherAIReview (problem_id, student_id, submission_id, code_hash, review_data) VALUES (?, ?, ?, ?, ?)',
-                        (problem_id, student_id, submission_id_to_use, code_hash, json.dumps(ai_review, ensure_ascii=False))
-                    )
-                    db.commit()
-                    print(f"AI评估结果已保存到缓存: 题目ID={problem_id}, 学生ID={student_id}, 提交ID={submission_id_to_use}")
-                except Exception as e:
-                    print(f"保存AI评估结果到缓存失败: {e}")
+                        db = get_db('teacher')
+                        cursor = db.cursor()
+                        cursor.execute(
+                            'INSERT INTO TeacherAIReview (problem_id, student_id, submission_id, code_hash, review_data) VALUES (?, ?, ?, ?, ?)',
+                            (problem_id, student_id, submission_id_to_use, code_hash, json.dumps(ai_review, ensure_ascii=False))
+                        )
+                        db.commit()
+                        print(f"AI评估结果已保存到缓存: 题目ID={problem_id}, 学生ID={student_id}, 提交ID={submission_id_to_use}")
+                    except Exception as e:
+                        print(f"保存AI评估结果到缓存失败: {e}")
             
-            # 生成PDF
+            # 生成PDF：内容相同的报告直接从磁盘缓存返回
             try:
-                pdf_bytes = generate_pdf_report(problem, code, test_results, ai_review)
-                return send_file(io.BytesIO(pdf_bytes), as_attachment=True, download_name=f'Code_Review_Report_{problem["title"]}.pdf', mimetype='application/pdf')
+                download_name = f'Code_Review_Report_{problem["title"]}.pdf'
+                if ai_review.get('fallback'):
+                    # 兜底报告不写入PDF缓存，AI服务恢复后重新导出即可得到完整报告
+                    pdf_bytes = render_pdf_report(problem, code, test_results, ai_review)
+                    return send_file(io.BytesIO(pdf_bytes), as_attachment=True, download_name=download_name, mimetype='application/pdf')
+                cache_key, cache_path, pdf_bytes = render_cached_report(problem, code, test_results, ai_review, render_pdf_report)
+                if cache_path is not None:
+                    try:
+                        return send_file(cache_path, as_attachment=True, download_name=download_name, mimetype='application/pdf', etag=cache_key, conditional=True)
+                    except FileNotFoundError:
+                        # 发送前恰好被淘汰，重新生成
+                        pdf_bytes = pdf_bytes or render_pdf_report(problem, code, test_results, ai_review)
+                return send_file(io.BytesIO(pdf_bytes), as_attachment=True, download_name=download_name, mimetype='application/pdf', etag=cache_key)
                     
             except Exception as e:
                 print(f"PDF生成错误: {e}")
                 return jsonify({"status": "error", "message": f"PDF生成失败: {str(e)}"}), 500
                 
+        except ExecutorBusyError:
+            # 评测繁忙由统一的错误处理返回429
+            raise
         except Exception as e:
             print(f"PDF导出未知错误: {e}")
             return jsonify({"status": "error", "message": f"PDF导出失败: {str(e)}"}), 500
 
+    @app.route('/api/export_pdf_zip/<int:problem_id>', methods=['GET'])
+    def export_pdf_zip(problem_id):
+        """批量导出题目下所有学生的PDF报告(ZIP流式下载)"""
+        from .report_export import stream_problem_reports_zip, safe_filename
+        problem = query_db('SELECT * FROM Problem WHERE id = ?', (problem_id,), one=True, db_type='teacher')
+        if not problem:
+            return jsonify({"status": "error", "message": "题目不存在"}), 404
+        
+        filename = f"Code_Review_Reports_{safe_filename(problem['title'])}.zip"
+        return Response(
+            stream_problem_reports_zip(dict(problem)),
+            mimetype='application/zip',
+            headers={"Content-Disposition": f"attachment; filename*=UTF-8''{quote(filename)}"}
+        )
+
+    @app.route('/api/export_booklet/<int:problem_id>', methods=['GET'])
+    def export_booklet(problem_id):
+        """导出题目下所有学生报告的合订本(单个PDF，每名学生一个书签章节)"""
+        from .pdf_pool import render_class_booklet
+        from .report_export import safe_filename
+        problem = query_db('SELECT * FROM Problem WHERE id = ?', (problem_id,), one=True, db_type='teacher')
+        if not problem:
+            return jsonify({"status": "error", "message": "题目不存在"}), 404
+        
+        fd, output_path = tempfile.mkstemp(prefix='booklet_', suffix='.pdf')
+        os.close(fd)
+        try:
+            count = render_class_booklet(problem, output_path)
+        except Exception as e:
+            os.unlink(output_path)
+            print(f"合订本生成错误: {e}")
+            return jsonify({"status": "error", "message": f"合订本生成失败: {str(e)}"}), 500
+        print(f"合订本已生成: 题目ID={problem_id}, 报告数={count}")
+        
+        def stream_and_remove():
+            # 发送完毕(或客户端断开)后删除临时文件
+            try:
+                with open(output_path, 'rb') as f:
+                    while True:
+                        chunk = f.read(64 * 1024)
+                        if not chunk:
+                            break
+                        yield chunk
+            finally:
+                os.unlink(output_path)
+        
+        filename = f"Code_Review_Booklet_{safe_filename(problem['title'])}.pdf"
+        return Response(
+            stream_and_remove(),
+            mimetype='application/pdf',
+            headers={
+                "Content-Disposition": f"attachment; filename*=UTF-8''{quote(filename)}",
+                "Content-Length": str(os.path.getsize(output_path))
+            }
+        )
+
+    @app.route('/api/gradebook', methods=['GET'])
+    def export_gradebook():
+        """导出全部学生 × 全部题目的成绩册(?format=csv|xlsx，流式下载)"""
+        from .gradebook import stream_gradebook_csv, stream_gradebook_xlsx, xlsx_available
+        export_format = request.args.get('format', 'csv').lower()
+        filename = f"Gradebook_{time.strftime('%Y%m%d')}.{export_format}"
+        headers = {"Content-Disposition": f"attachment; filename*=UTF-8''{quote(filename)}"}
+        if export_format == 'csv':
+            return Response(stream_gradebook_csv(), mimetype='text/csv; charset=utf-8', headers=headers)
+        if export_format == 'xlsx':
+            if not xlsx_available():
+                return jsonify({"status": "error", "message": "XLSX导出需要安装openpyxl (pip install openpyxl)"}), 400
+            return Response(
+                stream_gradebook_xlsx(),
+                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                headers=headers
+            )
+        return jsonify({"status": "error", "message": "不支持的导出格式，可选csv或xlsx"}), 400
+
+    @app.route('/api/student/dashboard/<student_id>', methods=['GET'])
+    def get_student_dashboard(student_id):
+        """获取学生在所有题目上的最新提交状态、通过数和AI辅导摘要(不含代码和评测详情)"""
+        clean_student_id = str(student_id).strip()
+        if not clean_student_id.isdigit():
+            return jsonify({"status": "error", "message": "学号格式无效"}), 400
+        return jsonify({"status": "success", "data": load_student_dashboard(get_db('student'), get_db('teacher'), clean_student_id)})
+
     @app.route('/api/student/latest-submission/<int:problem_id>/<student_id>', methods=['GET'])
     def get_latest_submission(problem_id, student_id):
         """获取学生在特定题目下的最新提交记录"""
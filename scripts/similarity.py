@@ -0,0 +1,166 @@
+"""
+近似重复提交检测：基于AST指纹的MinHash相似度索引。
+
+变量重命名、注释和语句顺序调整不会改变大部分指纹片段，
+因此可以找到"换了变量名"的相似提交，复用已有的AI评估或生成相似度报告。
+"""
+import ast
+import json
+import builtins
+import hashlib
+from .code_hash import normalize_code_for_hash, generate_code_hash
+
+# MinHash签名长度与每个片段包含的token数
+NUM_PERMUTATIONS = 64
+SHINGLE_SIZE = 4
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+def _make_permutations():
+    """生成固定的哈希参数，保证不同进程计算出的签名一致"""
+    params = []
+    for i in range(NUM_PERMUTATIONS):
+        digest = hashlib.sha256(f'minhash-{i}'.encode('utf-8')).digest()
+        a = int.from_bytes(digest[:8], 'big') % MERSENNE_PRIME or 1
+        b = int.from_bytes(digest[8:16], 'big') % MERSENNE_PRIME
+        params.append((a, b))
+    return params
+
+PERMUTATIONS = _make_permutations()
+
+BUILTIN_NAMES = frozenset(dir(builtins))
+
+def _node_tokens(node):
+    """把AST子树展开为token序列：局部变量名统一替换，被调用的函数和内置名称保留原名，保留结构、运算符和常量"""
+    called = {id(child.func) for child in ast.walk(node) if isinstance(child, ast.Call) and isinstance(child.func, ast.Name)}
+    tokens = []
+    for child in ast.walk(node):
+        if isinstance(child, ast.Name) and (id(child) in called or child.id in BUILTIN_NAMES):
+            tokens.append(f'Name.{child.id}')
+        elif isinstance(child, (ast.Name, ast.arg)):
+            tokens.append('ID')
+        elif isinstance(child, ast.Attribute):
+            tokens.append(f'Attr.{child.attr}')
+        elif isinstance(child, ast.Constant):
+            tokens.append(f'Const.{type(child.value).__name__}.{child.value!r}'[:40])
+        elif isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            tokens.append(type(child).__name__)
+        elif not isinstance(child, (ast.Load, ast.Store, ast.Del)):
+            tokens.append(type(child).__name__)
+    return tokens
+
+def _statement_nodes(tree):
+    """遍历所有语句节点(包括嵌套在函数、循环中的语句)"""
+    for node in ast.walk(tree):
+        if isinstance(node, ast.stmt):
+            yield node
+
+def code_shingles(code):
+    """提取代码的指纹片段集合；语法错误时退化为按行片段"""
+    try:
+        tree = ast.parse(code or '')
+    except (SyntaxError, ValueError):
+        lines = normalize_code_for_hash(code).split('\n')
+        return {f'line:{line}' for line in lines if line}
+
+    shingles = set()
+    for statement in _statement_nodes(tree):
+        tokens = _node_tokens(statement)
+        if len(tokens) <= SHINGLE_SIZE:
+            shingles.add(' '.join(tokens))
+            continue
+        for i in range(len(tokens) - SHINGLE_SIZE + 1):
+            shingles.add(' '.join(tokens[i:i + SHINGLE_SIZE]))
+    return shingles
+
+def minhash_signature(code):
+    """计算代码的MinHash签名"""
+    shingles = code_shingles(code)
+    if not shingles:
+        return [MAX_HASH] * NUM_PERMUTATIONS
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode('utf-8'), digest_size=8).digest(), 'big') for s in shingles]
+    return [min(((a * h + b) % MERSENNE_PRIME) & MAX_HASH for h in hashes) for a, b in PERMUTATIONS]
+
+def signature_similarity(sig_a, sig_b):
+    """估算两个签名对应代码的Jaccard相似度"""
+    if not sig_a or not sig_b:
+        return 0.0
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / len(sig_a)
+
+def index_submission(cursor, submission_id, problem_id, student_id, code):
+    """把一次提交加入相似度索引(调用方负责提交事务)"""
+    cursor.execute(
+        'INSERT OR REPLACE INTO SubmissionFingerprint (submission_id, problem_id, student_id, code_hash, signature) VALUES (?, ?, ?, ?, ?)',
+        (submission_id, problem_id, student_id, generate_code_hash(code), json.dumps(minhash_signature(code)))
+    )
+
+def backfill_fingerprints(db):
+    """为尚未建立索引的旧提交补充指纹(启动时由init_db调用一次)"""
+    cursor = db.cursor()
+    missing = cursor.execute(
+        '''SELECT s.id, s.problem_id, s.student_id, s.code FROM Submission s
+           LEFT JOIN SubmissionFingerprint f ON f.submission_id = s.id
+           WHERE f.submission_id IS NULL'''
+    ).fetchall()
+    for row in missing:
+        index_submission(cursor, row[0], row[1], row[2], row[3])
+    db.commit()
+    return len(missing)
+
+def load_problem_signatures(db, problem_id):
+    """读取某个题目下所有提交的签名"""
+    rows = db.execute(
+        'SELECT submission_id, student_id, code_hash, signature FROM SubmissionFingerprint WHERE problem_id = ? ORDER BY submission_id',
+        (problem_id,)
+    ).fetchall()
+    return [(row['submission_id'], row['student_id'], row['code_hash'], json.loads(row['signature'])) for row in rows]
+
+def find_similar_submissions(db, problem_id, code, threshold, exclude_submission_id=None):
+    """查找与给定代码相似度不低于阈值的提交，按相似度降序返回"""
+    signature = minhash_signature(code)
+    code_hash = generate_code_hash(code)
+    matches = []
+    for submission_id, student_id, other_hash, other_signature in load_problem_signatures(db, problem_id):
+        if submission_id == exclude_submission_id:
+            continue
+        similarity = 1.0 if other_hash == code_hash else signature_similarity(signature, other_signature)
+        if similarity >= threshold:
+            matches.append({"submission_id": submission_id, "student_id": student_id, "similarity": round(similarity, 3)})
+    matches.sort(key=lambda match: match['similarity'], reverse=True)
+    return matches
+
+def similarity_report(db, problem_id, threshold):
+    """生成题目内两两相似度不低于阈值的提交对，以及相似提交分组"""
+    entries = load_problem_signatures(db, problem_id)
+    pairs = []
+    parent = {entry[0]: entry[0] for entry in entries}
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for i in range(len(entries)):
+        id_a, student_a, hash_a, sig_a = entries[i]
+        for j in range(i + 1, len(entries)):
+            id_b, student_b, hash_b, sig_b = entries[j]
+            similarity = 1.0 if hash_a == hash_b else signature_similarity(sig_a, sig_b)
+            if similarity >= threshold:
+                pairs.append({
+                    "submission_a": id_a, "student_a": student_a,
+                    "submission_b": id_b, "student_b": student_b,
+                    "similarity": round(similarity, 3)
+                })
+                parent[find(id_a)] = find(id_b)
+
+    students = {entry[0]: entry[1] for entry in entries}
+    groups = {}
+    for submission_id in parent:
+        groups.setdefault(find(submission_id), []).append(submission_id)
+    clusters = [
+        [{"submission_id": sid, "student_id": students[sid]} for sid in sorted(members)]
+        for members in groups.values() if len(members) > 1
+    ]
+    pairs.sort(key=lambda pair: pair['similarity'], reverse=True)
+    return {"submission_count": len(entries), "threshold": threshold, "pairs": pairs, "clusters": clusters}
@@ -0,0 +1,73 @@
+"""
+带指纹静态资源的引用与发送(构建见 scripts/build_static.py)。
+
+已构建时页面引用 /static/build/ 下带指纹的地址，按 Accept-Encoding 返回预压缩文件，
+并允许浏览器长期缓存；未构建时回退到原始的 /static/ 地址。
+"""
+import os
+import json
+import mimetypes
+import threading
+from flask import request, send_file, abort
+from werkzeug.security import safe_join
+from .config import STATIC_BUILD_DIR
+
+# 带指纹的文件内容不会变化，可以永久缓存
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# 按优先级排列的预压缩格式
+PRECOMPRESSED_ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+_manifest_cache = {'mtime': None, 'manifest': {}}
+_manifest_lock = threading.Lock()
+
+def load_manifest():
+    """读取构建清单；重新构建后(文件修改时间变化)自动重新加载"""
+    path = os.path.join(STATIC_BUILD_DIR, 'manifest.json')
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return {}
+    with _manifest_lock:
+        if _manifest_cache['mtime'] != mtime:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    _manifest_cache['manifest'] = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"读取静态资源清单失败: {e}")
+                _manifest_cache['manifest'] = {}
+            _manifest_cache['mtime'] = mtime
+        return _manifest_cache['manifest']
+
+def asset_url(path):
+    """返回静态资源(或整个指纹目录，如 js/vs)的访问地址"""
+    target = load_manifest().get(path)
+    if target:
+        return f"/static/build/{target}"
+    return f"/static/{path}"
+
+def send_built_asset(filename):
+    """发送构建后的静态文件，客户端支持时返回预压缩版本"""
+    path = safe_join(STATIC_BUILD_DIR, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    encoding = None
+    for candidate, suffix in PRECOMPRESSED_ENCODINGS:
+        if request.accept_encodings[candidate] and os.path.isfile(path + suffix):
+            encoding = candidate
+            path = path + suffix
+            break
+
+    response = send_file(path, mimetype=mimetype, conditional=True, etag=True)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    response.vary.add('Accept-Encoding')
+    return response
+
+def register_static_assets(app):
+    """注册构建后静态资源的路由和模板函数 asset_url"""
+    app.add_url_rule('/static/build/<path:filename>', 'built_static', send_built_asset)
+    app.context_processor(lambda: {'asset_url': asset_url})
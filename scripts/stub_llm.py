@@ -0,0 +1,131 @@
+"""
+本地AI服务桩：模拟OpenAI兼容的 /chat/completions 接口，用于离线测试。
+
+支持配置响应延迟和故障注入(5xx、429、超时)。用法:
+    python -m scripts.stub_llm --port 8001 --latency 0.5 --failure-rate 0.2
+然后设置环境变量 LLM_BASE_URL=http://127.0.0.1:8001/v1 启动应用。
+"""
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TEACHER_REVIEW = {
+    "total_score": 85,
+    "general_comment": "这是本地桩服务返回的评审结果，代码整体结构清晰。",
+    "strengths": ["逻辑清晰", "命名规范"],
+    "areas_for_improvement": [
+        {"category": "健壮性", "comment": "建议增加对异常输入的处理。", "line_reference": "1"}
+    ],
+    "optimized_code": "# 桩服务不提供优化代码",
+    "explanation_of_optimization": "桩服务不提供优化说明。"
+}
+
+STUDENT_ANSWER = {
+    "explanation": "这是本地桩服务返回的辅导内容。",
+    "hint_or_snippet": "试着打印中间变量看看。",
+    "next_step_question": "如果输入为空，你的代码会怎么处理？"
+}
+
+class StubSettings:
+    """桩服务的运行参数，可在运行期间修改"""
+    def __init__(self, latency=0.0, jitter=0.0, failure_rate=0.0, failure_mode='500', retry_after=1):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.failure_mode = failure_mode
+        self.retry_after = retry_after
+        self.request_count = 0
+        self.lock = threading.Lock()
+
+class StubLLMHandler(BaseHTTPRequestHandler):
+    """处理 /chat/completions 请求"""
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body, headers=None):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        settings = self.server.settings
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            payload = json.loads(self.rfile.read(length) or b'{}')
+        except json.JSONDecodeError:
+            self._send_json(400, {"error": "invalid json"})
+            return
+
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {"error": "not found"})
+            return
+
+        with settings.lock:
+            settings.request_count += 1
+
+        time.sleep(max(0.0, settings.latency + random.uniform(-settings.jitter, settings.jitter)))
+
+        if random.random() < settings.failure_rate:
+            if settings.failure_mode == '429':
+                self._send_json(429, {"error": "rate limited"}, {'Retry-After': str(settings.retry_after)})
+            elif settings.failure_mode == 'timeout':
+                # 挂起足够长的时间让客户端超时
+                time.sleep(3600)
+            else:
+                self._send_json(int(settings.failure_mode), {"error": "injected failure"})
+            return
+
+        messages = payload.get('messages') or [{}]
+        prompt = messages[-1].get('content', '')
+        answer = STUDENT_ANSWER if 'next_step_question' in prompt else TEACHER_REVIEW
+        self._send_json(200, {
+            "id": f"stub-{settings.request_count}",
+            "object": "chat.completion",
+            "model": payload.get('model', 'stub'),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": json.dumps(answer, ensure_ascii=False)}, "finish_reason": "stop"}]
+        })
+
+def start_stub_server(host='127.0.0.1', port=0, **settings):
+    """在后台线程启动桩服务，返回server对象(server.base_url为接口地址)"""
+    server = ThreadingHTTPServer((host, port), StubLLMHandler)
+    server.daemon_threads = True
+    server.settings = StubSettings(**settings)
+    server.base_url = f"http://{host}:{server.server_address[1]}/v1"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description='本地AI服务桩')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--latency', type=float, default=0.0, help='每次响应的延迟(秒)')
+    parser.add_argument('--jitter', type=float, default=0.0, help='延迟的随机抖动范围(秒)')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='故障注入比例(0-1)')
+    parser.add_argument('--failure-mode', default='500', help='故障类型: 500/502/503/429/timeout')
+    parser.add_argument('--retry-after', type=int, default=1, help='429响应的Retry-After(秒)')
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), StubLLMHandler)
+    server.daemon_threads = True
+    server.settings = StubSettings(args.latency, args.jitter, args.failure_rate, args.failure_mode, args.retry_after)
+    print(f"AI服务桩已启动: http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
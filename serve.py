@@ -0,0 +1,121 @@
+"""
+生产环境启动入口。
+
+优先使用gunicorn(多进程 × 多线程，仅Linux/macOS)；未安装时依次回退到
+waitress(单进程多线程，支持Windows)和Flask自带的多线程服务器。
+数据库表结构和运行指标目录在创建工作进程之前初始化一次；每个工作进程各自创建应用、
+数据库连接、AI评估预生成线程和PDF渲染进程池(启动时预热)，关闭时等待进行中的任务完成。
+
+用法(在项目根目录):
+    python serve.py [--host 0.0.0.0] [--port 5000] [--workers 2] [--threads 8] [--server auto]
+"""
+import sys
+import signal
+import argparse
+from app import create_app
+from scripts.database import init_db
+from scripts.fixtures import prune_fixtures
+from scripts import metrics
+from scripts.config import (
+    SERVER_HOST, SERVER_PORT, SERVER_WORKERS, SERVER_THREADS, SERVER_GRACEFUL_TIMEOUT, PDF_PREWARM
+)
+
+def prepare_storage():
+    """创建工作进程之前：初始化表结构，清空上一次运行的指标快照，清理未被引用的测试数据文件"""
+    init_db()
+    metrics.reset_metrics_dir()
+    prune_fixtures()
+
+def start_worker_resources():
+    """工作进程创建应用之后：启动PDF渲染进程池，渲染进程在后台解析字体"""
+    if PDF_PREWARM:
+        from scripts.pdf_pool import pdf_pool
+        pdf_pool.start()
+
+def shutdown_background_work(timeout=SERVER_GRACEFUL_TIMEOUT):
+    """工作进程退出前：等待后台AI评估和正在重新评测的提交完成，关闭PDF渲染进程池(未使用过则无需关闭)，写入最终指标"""
+    from scripts.review_queue import review_queue
+    from scripts.regrade_queue import regrade_queue
+    review_queue.shutdown(timeout)
+    regrade_queue.shutdown(timeout)
+    if 'scripts.pdf_pool' in sys.modules:
+        sys.modules['scripts.pdf_pool'].pdf_pool.shutdown()
+    metrics.flush()
+
+def run_gunicorn(args):
+    from gunicorn.app.base import BaseApplication
+
+    class GunicornServer(BaseApplication):
+        def __init__(self, options):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            # 不预加载应用：每个工作进程在fork之后各自创建应用和资源
+            return create_app()
+
+    GunicornServer({
+        'bind': f"{args.host}:{args.port}",
+        'workers': args.workers,
+        'threads': args.threads,
+        'worker_class': 'gthread',
+        'graceful_timeout': SERVER_GRACEFUL_TIMEOUT,
+        'on_starting': lambda server: prepare_storage(),
+        'post_worker_init': lambda worker: start_worker_resources(),
+        'worker_exit': lambda server, worker: shutdown_background_work(),
+    }).run()
+
+def _raise_keyboard_interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+def run_single_process(args, server):
+    """waitress或Flask多线程服务器：单进程，收到SIGTERM/Ctrl+C后清理后台任务"""
+    prepare_storage()
+    app = create_app()
+    start_worker_resources()
+    signal.signal(signal.SIGTERM, _raise_keyboard_interrupt)
+    try:
+        if server == 'waitress':
+            from waitress import serve
+            serve(app, host=args.host, port=args.port, threads=args.threads)
+        else:
+            from werkzeug.serving import run_simple
+            run_simple(args.host, args.port, app, threaded=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        shutdown_background_work()
+
+def detect_server():
+    for name in ('gunicorn', 'waitress'):
+        try:
+            __import__(name)
+            return name
+        except ImportError:
+            continue
+    return 'werkzeug'
+
+def main():
+    parser = argparse.ArgumentParser(description='智能代码批阅系统 - 生产环境服务')
+    parser.add_argument('--host', default=SERVER_HOST)
+    parser.add_argument('--port', type=int, default=SERVER_PORT)
+    parser.add_argument('--workers', type=int, default=SERVER_WORKERS, help='工作进程数(仅gunicorn)')
+    parser.add_argument('--threads', type=int, default=SERVER_THREADS, help='每个工作进程的线程数')
+    parser.add_argument('--server', choices=['auto', 'gunicorn', 'waitress', 'werkzeug'], default='auto')
+    args = parser.parse_args()
+
+    server = detect_server() if args.server == 'auto' else args.server
+    print(f"使用 {server} 启动服务: http://{args.host}:{args.port}")
+    if server == 'gunicorn':
+        run_gunicorn(args)
+    else:
+        if args.workers > 1:
+            print(f"{server} 仅支持单进程，忽略 --workers {args.workers}")
+        run_single_process(args, server)
+
+if __name__ == '__main__':
+    main()
@@ -2,7 +2,7 @@
 title 
 echo Python˷...
 
-start "Python Backend" python app.py
+start "Python Backend" python serve.py
 
 echo.
 echo ȴ˷ (5)...
@@ -39,6 +39,8 @@ window.addEventListener('DOMContentLoaded', () => {
         // 导出按钮
         exportCurrentBtn: document.getElementById('export-current-btn'),
         exportAllBtn: document.getElementById('export-all-btn'),
+        exportBookletBtn: document.getElementById('export-booklet-btn'),
+        exportGradebookBtn: document.getElementById('export-gradebook-btn'),
         codeButtons: document.getElementById('code-buttons'),
         testTab: document.getElementById('test-tab'),
         aiTab: document.getElementById('ai-tab'),
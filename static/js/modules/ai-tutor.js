@@ -25,8 +25,8 @@ export class AiTutor {
         });
     }
 
-    // 处理AI辅导请求
-    async handleAiReview() {
+    // 处理AI辅导请求（forceNew为true时忽略相似提交的评估，重新生成）
+    async handleAiReview(forceNew = false) {
         const activeProblem = this.appState.getActiveProblem();
         if (!activeProblem) {
             this.uiManager.displayNotification('请先选择一个题目', 'error');
@@ -64,6 +64,9 @@ export class AiTutor {
                     return;
                 }
                 requestBody.submission_id = currentSubmissionId;
+                if (forceNew) {
+                    requestBody.force_new = true;
+                }
             } else {
                 // 学生端使用临时生成的submission_id
                 requestBody.submission_id = `student_review_${Date.now()}_${Math.random().toString(36).substr(2, 9)}`;
@@ -84,6 +87,9 @@ export class AiTutor {
             if (data.status === 'success') {
                 // 使用Markdown渲染
                 this.renderMarkdownAiReview(data.data);
+                if (data.similar_to) {
+                    this.renderSimilarReviewNotice(data.message);
+                }
                 
                 // 只有学生端才保存到本地存储作为备份（教师端使用服务器缓存）
                 if (userRole === 'student') {
@@ -117,6 +123,21 @@ export class AiTutor {
         }
     }
 
+    // 提示当前显示的是相似提交的AI评估，并提供重新生成按钮
+    renderSimilarReviewNotice(message) {
+        const notice = document.createElement('div');
+        notice.className = 'ai-review-section';
+        notice.style.cssText = 'padding: 10px; background-color: #fff8e1; border-radius: 5px;';
+        notice.innerHTML = `
+            <p>${this.escapeHtml(message || '找到相似提交的AI评估')}，以下内容供参考。</p>
+            <button type="button">为该提交重新生成</button>
+        `;
+        notice.querySelector('button').addEventListener('click', async () => {
+            await this.handleAiReview(true);
+        });
+        this.elements.aiTab.prepend(notice);
+    }
+
     // 使用Markdown渲染AI辅导内容
     renderMarkdownAiReview(reviewData) {
         const userRole = this.appState.getUserRole();
@@ -72,11 +72,19 @@ export class CodeRunner {
                 body: JSON.stringify(requestBody),
                 signal: this.appState.getAbortController()?.signal
             });
-            
+
+            if (response.status === 429) {
+                // 评测繁忙：服务器通过Retry-After给出建议的重试等待时间
+                const data = await response.json().catch(() => ({}));
+                const retryAfter = response.headers.get('Retry-After') || data.retry_after;
+                const message = data.message || '评测繁忙，请稍后重试';
+                this.uiManager.displayNotification(retryAfter ? `${message}（约 ${retryAfter} 秒后）` : message, 'error');
+                return;
+            }
             if (!response.ok) throw new Error(`HTTP错误: ${response.status}`);
-            
+
             const data = await response.json();
-            
+
             if (data.status === 'success') {
                 this.uiManager.displayTestResult(data.data);
                 this.uiManager.displayNotification(`${actionName}完成: 通过 ${data.data.passed}/${data.data.total} 个测试用例`, 'info');
@@ -84,6 +92,8 @@ export class CodeRunner {
                 
                 if (data.submission_id) {
                     this.appState.setCurrentSubmissionId(data.submission_id);
+                    // 刷新题目列表中的通过情况
+                    this.uiManager.studentView?.loadDashboard(studentId);
                     this.uiManager.displayNotification('代码已成功提交！现在可以获取AI辅导或进行提问。', 'success');
                 }
             } else {
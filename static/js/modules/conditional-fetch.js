@@ -0,0 +1,35 @@
+// 条件请求模块 - 记录GET接口返回的ETag/Last-Modified，再次请求时发送给服务器，内容未变化时复用本地数据
+const responseCache = new Map();
+
+// 请求JSON接口，返回 { ok, status, statusText, data }；服务器返回304时使用缓存的数据
+export async function fetchJsonConditional(url, options = {}) {
+    const cached = responseCache.get(url);
+    const headers = { ...(options.headers || {}) };
+    if (cached?.etag) {
+        headers['If-None-Match'] = cached.etag;
+    } else if (cached?.lastModified) {
+        headers['If-Modified-Since'] = cached.lastModified;
+    }
+
+    const response = await fetch(url, { ...options, headers });
+    if (response.status === 304 && cached) {
+        // 每次返回新解析的对象，调用方修改数据不会影响缓存
+        return { ok: true, status: 200, statusText: 'OK', data: JSON.parse(cached.body), notModified: true };
+    }
+
+    const body = await response.text();
+    const data = body ? JSON.parse(body) : null;
+    const etag = response.headers.get('ETag');
+    const lastModified = response.headers.get('Last-Modified');
+    if (response.ok && (etag || lastModified)) {
+        responseCache.set(url, { etag, lastModified, body });
+    } else {
+        responseCache.delete(url);
+    }
+    return { ok: response.ok, status: response.status, statusText: response.statusText, data };
+}
+
+// 删除某个接口的缓存(例如删除资源后)
+export function invalidateConditional(url) {
+    responseCache.delete(url);
+}
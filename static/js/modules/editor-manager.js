@@ -33,7 +33,7 @@ export class EditorManager {
         }
         
         require.config({
-            paths: { 'vs': '/static/js/vs' },
+            paths: { 'vs': window.MONACO_VS_PATH || '/static/js/vs' },
             'vs/nls': { availableLanguages: {'*': 'zh-cn'} }
         });
 
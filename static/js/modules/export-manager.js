@@ -10,6 +10,8 @@ export class ExportManager {
     init() {
         this.initExportCurrentButton();
         this.initExportAllButton();
+        this.initExportBookletButton();
+        this.initExportGradebookButton();
     }
 
     // 初始化导出当前报告按钮
@@ -26,6 +28,20 @@ export class ExportManager {
         });
     }
 
+    // 初始化导出合订本按钮
+    initExportBookletButton() {
+        this.elements.exportBookletBtn.addEventListener('click', () => {
+            this.exportBooklet();
+        });
+    }
+
+    // 初始化导出成绩册按钮
+    initExportGradebookButton() {
+        this.elements.exportGradebookBtn.addEventListener('click', () => {
+            this.exportGradebook();
+        });
+    }
+
     // 导出当前报告
     async exportCurrentReport() {
         const activeProblem = this.appState.getActiveProblem();
@@ -137,89 +153,53 @@ export class ExportManager {
             }
             
             this.uiManager.hideGlobalLoadingModal();
-            this.uiManager.showGlobalLoadingModal(`正在批量生成 ${submissions.length} 个PDF报告...`);
-            
-            let successCount = 0;
-            let failCount = 0;
-            
-            // 为每个提交生成PDF
-            for (let i = 0; i < submissions.length; i++) {
-                const submission = submissions[i];
-                try {
-                    // 更新加载状态
-                    this.elements.loadingStatusText.textContent = `正在生成第 ${i + 1}/${submissions.length} 个PDF报告...`;
-                    
-                    // 获取提交详情
-                    const detailResponse = await fetch(`/api/submission/${submission.id}`);
-                    if (!detailResponse.ok) {
-                        console.error(`获取提交 ${submission.id} 详情失败`);
-                        failCount++;
-                        continue;
-                    }
-                    
-                    const detail = await detailResponse.json();
-                    
-                    // 生成PDF
-                    const requestBody = {
-                        problem_id: activeProblem.id,
-                        code: detail.code
-                    };
-                    
-                    // 添加学生ID到请求中
-                    if (submission.student_id) {
-                        requestBody.student_id = submission.student_id;
-                    }
-                    
-                    const pdfResponse = await fetch('/api/export_pdf', {
-                        method: 'POST',
-                        headers: { 'Content-Type': 'application/json' },
-                        body: JSON.stringify(requestBody)
-                    });
-                    
-                    if (pdfResponse.ok) {
-                        const blob = await pdfResponse.blob();
-                        
-                        // 使用延迟下载避免浏览器阻止多个下载
-                        setTimeout(() => {
-                            const url = window.URL.createObjectURL(blob);
-                            const a = document.createElement('a');
-                            a.href = url;
-                            a.download = `代码批阅报告_${submission.display_name}.pdf`;
-                            a.style.display = 'none';
-                            document.body.appendChild(a);
-                            a.click();
-                            
-                            // 延迟清理资源
-                            setTimeout(() => {
-                                window.URL.revokeObjectURL(url);
-                                document.body.removeChild(a);
-                            }, 100);
-                        }, i * 200); // 每个文件间隔200ms下载
-                        
-                        successCount++;
-                    } else {
-                        console.error(`生成PDF失败，状态码: ${pdfResponse.status}`);
-                        failCount++;
-                    }
-                } catch (error) {
-                    console.error(`导出提交 ${submission.id} 失败:`, error);
-                    failCount++;
-                }
-            }
             
-            this.uiManager.hideGlobalLoadingModal();
+            // 由服务器生成所有报告并以ZIP流式下载，浏览器直接写入磁盘，无需逐个请求
+            const a = document.createElement('a');
+            a.href = `/api/export_pdf_zip/${activeProblem.id}`;
+            a.style.display = 'none';
+            document.body.appendChild(a);
+            a.click();
+            document.body.removeChild(a);
             
-            if (successCount > 0) {
-                this.uiManager.displayNotification(`批量导出完成！成功: ${successCount}，失败: ${failCount}`, 'success');
-            } else {
-                this.uiManager.displayNotification(`批量导出失败，所有文件都无法生成`, 'error');
-            }
+            this.uiManager.displayNotification(`开始下载 ${submissions.length} 份PDF报告的压缩包`, 'success');
         } catch (error) {
             this.uiManager.hideGlobalLoadingModal();
             this.uiManager.displayNotification(`批量导出失败: ${error.message}`, 'error');
         }
     }
 
+    // 导出合订本：全班报告合并为一个带书签的PDF
+    exportBooklet() {
+        const activeProblem = this.appState.getActiveProblem();
+        if (!activeProblem) { 
+            this.uiManager.displayNotification('请先选择一个题目', 'error'); 
+            return; 
+        }
+        
+        // 由浏览器直接下载，服务器生成完成后开始传输
+        const a = document.createElement('a');
+        a.href = `/api/export_booklet/${activeProblem.id}`;
+        a.style.display = 'none';
+        document.body.appendChild(a);
+        a.click();
+        document.body.removeChild(a);
+        
+        this.uiManager.displayNotification('正在生成合订本，完成后将自动开始下载', 'info');
+    }
+
+    // 导出成绩册：全部学生 × 全部题目的通过情况和AI评分(CSV)
+    exportGradebook() {
+        const a = document.createElement('a');
+        a.href = '/api/gradebook?format=csv';
+        a.style.display = 'none';
+        document.body.appendChild(a);
+        a.click();
+        document.body.removeChild(a);
+        
+        this.uiManager.displayNotification('开始下载成绩册', 'success');
+    }
+
     // 设置当前查看的学生提交代码
     setCurrentSubmissionCode(code) {
         this.currentSubmissionCode = code;
@@ -1,4 +1,6 @@
 // 题目管理器模块 - 负责题目的加载、显示、创建和删除
+import { fetchJsonConditional } from './conditional-fetch.js';
+
 export class ProblemManager {
     constructor(elements, appState, uiManager) {
         this.elements = elements;
@@ -17,9 +19,9 @@ export class ProblemManager {
     // 加载题目列表
     async loadProblems() {
         try {
-            const response = await fetch('/api/problems');
+            const response = await fetchJsonConditional('/api/problems');
             if (!response.ok) throw new Error(`HTTP error: ${response.status}`);
-            const problems = await response.json();
+            const problems = response.data;
             this.appState.setProblems(problems);
             this.renderProblemList();
         } catch (error) {
@@ -55,19 +57,23 @@ export class ProblemManager {
             li.addEventListener('click', () => this.selectProblem(problem.id));
             this.elements.problemList.appendChild(li);
         });
+
+        if (userRole === 'student' && this.studentView) {
+            this.studentView.showDashboard(this.appState.getStudentId());
+        }
     }
 
     // 选择题目
     async selectProblem(problemId) {
         this.uiManager.showGlobalLoadingModal('正在加载题目...');
         try {
-            const response = await fetch(`/api/problems/${problemId}`);
+            const response = await fetchJsonConditional(`/api/problems/${problemId}`);
             
             if (!response.ok) {
                 throw new Error(`HTTP错误: ${response.status} ${response.statusText}`);
             }
             
-            const problemData = await response.json();
+            const problemData = response.data;
             
             if (problemData.error) {
                 throw new Error(problemData.error);
@@ -103,6 +109,7 @@ export class ProblemManager {
         document.getElementById('problem-description').value = problemData.description_md || '';
         this.elements.testCaseList.innerHTML = '';
         problemData.test_cases.forEach(tc => this.addTestCaseItem(tc));
+        this.loadReferenceCode(problemData.id, problemData.has_reference);
         
         const codeEditor = this.appState.getCodeEditor();
         if (codeEditor) {
@@ -212,19 +219,117 @@ export class ProblemManager {
         this.elements.chatDisplay.innerHTML = '<div class="chat-message ai-message"><p>你好，我是你的AI编程导师。有任何关于代码的问题都可以问我！</p></div>';
     }
 
+    // 加载参考解答(题目详情中不包含参考解答)
+    async loadReferenceCode(problemId, hasReference) {
+        const referenceInput = document.getElementById('problem-reference');
+        referenceInput.value = '';
+        if (!hasReference) return;
+        try {
+            const response = await fetch(`/api/problems/${problemId}/reference`);
+            if (!response.ok) throw new Error(`HTTP错误: ${response.status}`);
+            const data = await response.json();
+            referenceInput.value = data.data.reference_code;
+        } catch (error) {
+            this.uiManager.displayNotification(`加载参考解答失败: ${error.message}`, 'error');
+        }
+    }
+
+    // 显示参考解答的运行结果：填入的期望输出、与期望输出不一致或运行出错的用例
+    showReferenceReport(report) {
+        if (!report) return;
+        if (report.filled.length) {
+            this.uiManager.displayNotification(`已用参考解答生成测试用例 ${report.filled.join('、')} 的期望输出`, 'info');
+        }
+        if (report.mismatched.length) {
+            const cases = report.mismatched.map(item => item.case).join('、');
+            this.uiManager.displayNotification(`参考解答在测试用例 ${cases} 上的输出与期望输出不一致，请检查`, 'error');
+        }
+        if (report.failed.length) {
+            const cases = report.failed.map(item => item.case).join('、');
+            this.uiManager.displayNotification(`参考解答在测试用例 ${cases} 上运行出错，这些用例使用默认时限`, 'error');
+        }
+    }
+
     // 添加测试用例项
     addTestCaseItem(testCase = { input_data: '', expected_output: '' }) {
         const li = document.createElement('li');
         li.className = 'test-case-item';
+        // 保存时带上原ID，服务器据此保留未修改的用例，只重新评测有变化的用例
+        if (testCase.id) li.dataset.caseId = testCase.id;
         li.innerHTML = `
-            <div class="form-group"><label>输入数据 (可选)</label><textarea class="test-input" rows="2">${testCase.input_data}</textarea></div>
-            <div class="form-group"><label>期望输出 (可选)</label><textarea class="test-output" rows="2">${testCase.expected_output}</textarea></div>
+            <div class="form-group"><label>输入数据 (可选)</label><textarea class="test-input" rows="2"></textarea>
+                <input type="file" class="test-input-file" hidden><button type="button" class="upload-fixture" data-target="input">上传文件</button><button type="button" class="clear-fixture" data-target="input" hidden>改为手动输入</button></div>
+            <div class="form-group"><label>期望输出 (可选)</label><textarea class="test-output" rows="2"></textarea>
+                <input type="file" class="test-output-file" hidden><button type="button" class="upload-fixture" data-target="output">上传文件</button><button type="button" class="clear-fixture" data-target="output" hidden>改为手动输入</button></div>
+            <div class="form-group"><label>比较方式</label><select class="test-comparator">
+                <option value="exact">精确匹配(忽略首尾空白)</option>
+                <option value="whitespace">忽略空白差异</option>
+                <option value="float">浮点数允许误差</option>
+            </select></div>
             <button type="button" class="remove-test-case">删除</button>
         `;
+        li.querySelector('.test-input').value = testCase.input_data || '';
+        li.querySelector('.test-output').value = testCase.expected_output || '';
+        const comparator = li.querySelector('.test-comparator');
+        if (testCase.comparator && !Array.from(comparator.options).some(option => option.value === testCase.comparator)) {
+            // 保留自定义参数的比较方式，如 float:1e-4
+            comparator.add(new Option(testCase.comparator, testCase.comparator));
+        }
+        comparator.value = testCase.comparator || 'exact';
+        this.setTestCaseFixture(li, 'input', testCase.input_ref, testCase.input_data);
+        this.setTestCaseFixture(li, 'output', testCase.expected_ref, testCase.expected_output);
+
+        li.querySelectorAll('.upload-fixture').forEach(button => {
+            button.addEventListener('click', () => li.querySelector(`.test-${button.dataset.target}-file`).click());
+        });
+        li.querySelectorAll('.clear-fixture').forEach(button => {
+            button.addEventListener('click', () => this.setTestCaseFixture(li, button.dataset.target, null, ''));
+        });
+        ['input', 'output'].forEach(target => {
+            li.querySelector(`.test-${target}-file`).addEventListener('change', (e) => {
+                const file = e.target.files[0];
+                e.target.value = '';
+                if (file) this.uploadFixture(li, target, file);
+            });
+        });
         li.querySelector('.remove-test-case').addEventListener('click', () => li.remove());
         this.elements.testCaseList.appendChild(li);
     }
 
+    // 设置测试用例的数据文件：有文件时文本框只显示文件开头部分，不可编辑
+    setTestCaseFixture(li, target, ref, text) {
+        const textarea = li.querySelector(`.test-${target}`);
+        textarea.value = text || '';
+        textarea.readOnly = Boolean(ref);
+        if (ref) {
+            textarea.dataset.ref = ref;
+        } else {
+            delete textarea.dataset.ref;
+        }
+        li.querySelector(`.clear-fixture[data-target="${target}"]`).hidden = !ref;
+    }
+
+    // 上传大型输入或期望输出文件，服务器按内容保存并返回文件标识
+    async uploadFixture(li, target, file) {
+        this.uiManager.showGlobalLoadingModal(`正在上传 ${file.name}...`);
+        try {
+            const response = await fetch('/api/fixtures', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/octet-stream' },
+                body: file
+            });
+            const data = await response.json();
+            if (data.status !== 'success') {
+                throw new Error(data.message || `HTTP错误: ${response.status}`);
+            }
+            this.setTestCaseFixture(li, target, data.data.ref, data.data.preview);
+        } catch (error) {
+            this.uiManager.displayNotification(`上传测试数据文件失败: ${error.message}`, 'error');
+        } finally {
+            this.uiManager.hideGlobalLoadingModal();
+        }
+    }
+
     // 初始化添加题目按钮
     initAddProblemButton() {
         this.elements.addProblemBtn.addEventListener('click', () => this.resetTeacherView());
@@ -238,9 +343,14 @@ export class ProblemManager {
             const problemId = activeProblem ? activeProblem.id : null;
             const title = document.getElementById('problem-title').value;
             const descriptionMd = document.getElementById('problem-description').value;
+            const referenceCode = document.getElementById('problem-reference').value;
             const testCases = Array.from(document.querySelectorAll('.test-case-item')).map(item => ({
+                id: item.dataset.caseId ? Number(item.dataset.caseId) : null,
                 input_data: item.querySelector('.test-input').value,
-                expected_output: item.querySelector('.test-output').value
+                expected_output: item.querySelector('.test-output').value,
+                input_ref: item.querySelector('.test-input').dataset.ref || null,
+                expected_ref: item.querySelector('.test-output').dataset.ref || null,
+                comparator: item.querySelector('.test-comparator').value
             }));
 
             if (!title.trim() || !descriptionMd.trim()) {
@@ -248,12 +358,12 @@ export class ProblemManager {
                 return;
             }
 
-            this.uiManager.showGlobalLoadingModal('正在发布题目...');
+            this.uiManager.showGlobalLoadingModal(referenceCode.trim() ? '正在运行参考解答并发布题目...' : '正在发布题目...');
             try {
                 const response = await fetch(`/api/problems${problemId ? `/${problemId}` : ''}`, {
                     method: 'POST',
                     headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ title, description_md: descriptionMd, test_cases: testCases }),
+                    body: JSON.stringify({ title, description_md: descriptionMd, reference_code: referenceCode, test_cases: testCases }),
                     signal: this.appState.getAbortController()?.signal
                 });
                 
@@ -266,6 +376,10 @@ export class ProblemManager {
                 
                 if (data.status === 'success') {
                     this.uiManager.displayNotification('题目发布成功！', 'success');
+                    this.showReferenceReport(data.reference);
+                    if (data.regrading) {
+                        this.uiManager.displayNotification('测试用例已修改，正在后台重新评测已有提交', 'info');
+                    }
                     await this.loadProblems();
                     this.selectProblem(data.problem_id);
                 } else {
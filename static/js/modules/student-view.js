@@ -4,6 +4,9 @@ export class StudentView {
         this.elements = elements;
         this.appState = appState;
         this.uiManager = uiManager;
+        // 学生首页概览：{ studentId, problems: Map<题目ID, 概览> }，提交后刷新
+        this.dashboard = null;
+        this.dashboardRequest = null;
     }
 
     init() {
@@ -39,6 +42,73 @@ export class StudentView {
         this.appState.setCurrentSubmissionId(null);
     }
 
+    // 一次请求加载学生在所有题目上的提交状态和AI辅导摘要
+    async loadDashboard(studentId) {
+        const request = fetch(`/api/student/dashboard/${studentId}`)
+            .then(response => {
+                if (!response.ok) throw new Error(`HTTP error: ${response.status}`);
+                return response.json();
+            })
+            .then(result => {
+                if (result.status !== 'success') throw new Error(result.message);
+                this.dashboard = {
+                    studentId,
+                    problems: new Map(result.data.problems.map(problem => [problem.problem_id, problem]))
+                };
+                this.renderDashboardBadges();
+                return this.dashboard;
+            })
+            .catch(error => {
+                console.warn('加载学生概览失败:', error);
+                return null;
+            })
+            .finally(() => {
+                if (this.dashboardRequest === request) this.dashboardRequest = null;
+            });
+        this.dashboardRequest = request;
+        return request;
+    }
+
+    // 题目列表重新渲染后显示概览；学号变化时重新加载
+    showDashboard(studentId) {
+        if (!studentId || !/^\d+$/.test(studentId)) return;
+        if (this.dashboard && this.dashboard.studentId === studentId) {
+            this.renderDashboardBadges();
+        } else if (!this.dashboardRequest) {
+            this.loadDashboard(studentId);
+        }
+    }
+
+    // 获取某道题目的概览(尚未加载时先加载)，加载失败返回null
+    async getDashboardEntry(problemId, studentId) {
+        if (!this.dashboard || this.dashboard.studentId !== studentId) {
+            await (this.dashboardRequest || this.loadDashboard(studentId));
+        }
+        if (!this.dashboard || this.dashboard.studentId !== studentId) return null;
+        return this.dashboard.problems.get(Number(problemId)) || null;
+    }
+
+    // 在题目列表中标出通过情况
+    renderDashboardBadges() {
+        if (!this.dashboard) return;
+        document.querySelectorAll('#problem-list li[data-id]').forEach(li => {
+            const entry = this.dashboard.problems.get(Number(li.dataset.id));
+            let badge = li.querySelector('.problem-status');
+            if (!entry || entry.submission_id === null) {
+                badge?.remove();
+                return;
+            }
+            if (!badge) {
+                badge = document.createElement('span');
+                badge.className = 'problem-status';
+                li.appendChild(badge);
+            }
+            const solved = entry.total_tests > 0 && entry.passed_tests === entry.total_tests;
+            badge.classList.toggle('solved', solved);
+            badge.textContent = `${solved ? '✓ ' : ''}${entry.passed_tests}/${entry.total_tests}`;
+        });
+    }
+
     // 加载学生最新的提交记录
     async loadLatestStudentSubmission(problemId, studentId) {
         // 确保学号不为空且是有效的
@@ -62,6 +132,13 @@ export class StudentView {
 
             // 确保URL格式正确，去除可能的额外字符
             const cleanStudentId = studentId.toString().trim();
+            // 概览显示该题没有提交时直接初始化，不再请求提交详情
+            const entry = await this.getDashboardEntry(problemId, cleanStudentId);
+            if (entry && entry.submission_id === null) {
+                this.resetStudentView();
+                this.uiManager.displayNotification('欢迎开始新的挑战！', 'info');
+                return;
+            }
             const response = await fetch(`/api/student/latest-submission/${problemId}/${cleanStudentId}`);
             
             if (!response.ok) {
@@ -92,8 +169,15 @@ export class StudentView {
                 
                 this.uiManager.displayTestResult({ details: submission.test_details });
                 
-                // 加载学生AI辅导历史记录
-                await this.loadStudentAIReviewHistory(problemId, cleanStudentId);
+                // 提交详情已包含该提交的AI辅导；没有时再查找历史记录(概览显示没有记录则直接使用本地缓存)
+                if (submission.ai_review) {
+                    this.uiManager.renderAiReview(submission.ai_review);
+                    this.uiManager.displayNotification('已成功恢复你上次的代码和AI辅导记录', 'success');
+                } else if (entry && entry.review_count === 0) {
+                    this.loadAIReviewFromLocalStorage(problemId, cleanStudentId);
+                } else {
+                    await this.loadStudentAIReviewHistory(problemId, cleanStudentId);
+                }
                 
                 document.querySelector('.tab-button[data-tab="test"]').click();
             } else {
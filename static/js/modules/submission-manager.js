@@ -1,4 +1,6 @@
 // 提交管理器模块 - 负责学生提交记录的管理和显示
+import { fetchJsonConditional, invalidateConditional } from './conditional-fetch.js';
+
 export class SubmissionManager {
     constructor(elements, appState, uiManager) {
         this.elements = elements;
@@ -85,9 +87,9 @@ export class SubmissionManager {
     async loadSubmissionDetail(submissionId) {
         this.uiManager.showGlobalLoadingModal('正在加载提交详情...');
         try {
-            const response = await fetch(`/api/submission/${submissionId}`);
+            const response = await fetchJsonConditional(`/api/submission/${submissionId}`);
             if (!response.ok) throw new Error(`HTTP error: ${response.status}`);
-            const detail = await response.json();
+            const detail = response.data;
             
             this.appState.setCurrentSubmissionId(submissionId);
 
@@ -115,9 +117,9 @@ export class SubmissionManager {
     // 根据提交ID加载AI评审
     async loadAiReviewForSubmission(submissionId) {
         try {
-            const response = await fetch(`/api/review/${submissionId}`);
+            const response = await fetchJsonConditional(`/api/review/${submissionId}`);
             if (!response.ok) throw new Error(`HTTP error: ${response.status}`);
-            const data = await response.json();
+            const data = response.data;
             
             if (data.status === 'success' && data.data) {
                 // 修复：使用aiTutor的renderMarkdownAiReview方法而不是uiManager的renderAiReview
@@ -157,6 +159,8 @@ export class SubmissionManager {
             this.uiManager.hideGlobalLoadingModal();
             
             if (data.status === 'success') {
+                invalidateConditional(`/api/submission/${submissionId}`);
+                invalidateConditional(`/api/review/${submissionId}`);
                 this.uiManager.displayNotification('提交记录删除成功', 'success');
                 // 重新加载提交列表
                 const activeProblem = this.appState.getActiveProblem();
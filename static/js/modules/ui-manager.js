@@ -140,6 +140,8 @@ export class UIManager {
             this.elements.runTestBtn.classList.remove('hidden'); // 教师端可以测试代码
             this.elements.exportCurrentBtn.classList.remove('hidden');
             this.elements.exportAllBtn.classList.remove('hidden');
+            this.elements.exportBookletBtn.classList.remove('hidden');
+            this.elements.exportGradebookBtn.classList.remove('hidden');
         } else { // 学生视图
             // 学生端显示"重新登录"按钮
             this.elements.backToIdentityBtn.textContent = '重新登录';
@@ -156,6 +158,8 @@ export class UIManager {
             // 隐藏学生端的导出按钮
             this.elements.exportCurrentBtn.classList.add('hidden');
             this.elements.exportAllBtn.classList.add('hidden');
+            this.elements.exportBookletBtn.classList.add('hidden');
+            this.elements.exportGradebookBtn.classList.add('hidden');
         }
     }
 
@@ -171,7 +175,9 @@ export class UIManager {
                     <p><strong>输入:</strong> <pre>${detail.input}</pre></p>
                     <p><strong>期望输出:</strong> <pre>${detail.expected_output}</pre></p>
                     <p><strong>实际输出:</strong> <pre>${detail.actual_output}</pre></p>
+                    ${detail.time_limit ? `<p><strong>用时:</strong> ${detail.elapsed ?? '-'} 秒（时限 ${detail.time_limit} 秒）</p>` : ''}
                     ${detail.stderr ? `<p><strong>错误输出:</strong> <pre>${detail.stderr}</pre></p>` : ''}
+                    ${detail.note ? `<p><em>${detail.note}</em></p>` : ''}
                 `;
                 this.elements.testTab.appendChild(div);
             });